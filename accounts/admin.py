@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import User
+from .models import User, EmailOutbox
 
 admin.site.register(User)
 
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("to_email", "subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("to_email",)
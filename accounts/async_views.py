@@ -0,0 +1,127 @@
+# accounts/async_views.py
+# ASGI-native variants of the I/O-heavy auth endpoints. While they wait on
+# Google the event loop keeps serving other requests; DB work runs in one
+# sync_to_async hop per request. OTP emails are queued in the outbox
+# (accounts.outbox), so no SMTP happens on these paths.
+# DRF's APIView can't run async handlers, so these are plain Django views
+# returning the same payloads as their sync counterparts.
+import json
+from urllib.parse import unquote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, HttpResponseRedirect
+from django.views import View
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+from .oauth import get_async_google_client, GoogleOAuthError
+from .serializers import SendOTPSerializer, VerifyOTPSerializer
+
+
+def _payload(request):
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def _run_serializer(serializer_class, data, save=False):
+    """Validate (and save) in one thread hop; returns (serializer, errors)."""
+    serializer = serializer_class(data=data)
+    if not serializer.is_valid():
+        return serializer, serializer.errors
+    if save:
+        serializer.save()
+    return serializer, None
+
+
+def _google_login(email, name):
+    user, _ = User.objects.get_or_create(email__lower=email.lower(), defaults={"email": email, "name": name})
+    refresh = RefreshToken.for_user(user)
+    refresh["role"] = user.role
+    return user, refresh
+
+
+class AsyncSendOTPView(View):
+    async def post(self, request):
+        serializer, errors = await sync_to_async(_run_serializer)(SendOTPSerializer, _payload(request), save=True)
+        if errors:
+            return JsonResponse(errors, status=400)
+
+        email = serializer.validated_data.get("email")
+        await request.session.aset("otp_user_email", email)
+        return JsonResponse({"message": "OTP sent successfully", "email": email}, status=200)
+
+
+class AsyncVerifyOTPView(View):
+    async def post(self, request):
+        serializer, errors = await sync_to_async(_run_serializer)(VerifyOTPSerializer, _payload(request))
+        if errors:
+            return JsonResponse(errors, status=400)
+
+        # OTP verified → keep email in session for password reset
+        await request.session.aset("verified_email", serializer.validated_data["user"].email)
+        return JsonResponse({"message": "OTP verified successfully."})
+
+
+class AsyncGoogleCallbackView(View):
+    async def get(self, request):
+        code = request.GET.get("code")
+        if not code:
+            return HttpResponseRedirect(f"{settings.FRONTEND_REDIRECT_URL}?error=NoCode")
+
+        google = get_async_google_client()
+        try:
+            _, token_data = await google.exchange_code(code)
+            if not token_data.get("access_token"):
+                return HttpResponseRedirect(f"{settings.FRONTEND_REDIRECT_URL}?error=InvalidToken")
+            user_info = await google.identify(token_data)
+        except GoogleOAuthError:
+            return HttpResponseRedirect(f"{settings.FRONTEND_REDIRECT_URL}?error=GoogleUnavailable")
+
+        email = user_info.get("email")
+        if not email:
+            return HttpResponseRedirect(f"{settings.FRONTEND_REDIRECT_URL}?error=EmailNotFound")
+
+        _, refresh = await sync_to_async(_google_login)(email, user_info.get("name", ""))
+        return HttpResponseRedirect(f"{settings.FRONTEND_REDIRECT_URL}?token={refresh.access_token}")
+
+
+class AsyncGoogleExchangeView(View):
+    async def post(self, request):
+        code = _payload(request).get("code")
+        if not code:
+            return JsonResponse({"error": "Code is required"}, status=400)
+
+        google = get_async_google_client()
+        try:
+            token_status, token_data = await google.exchange_code(unquote(code))
+            if token_status != 200:
+                return JsonResponse({
+                    "error": token_data,
+                    "hint": "Check redirect_uri and ensure you're using a fresh code."
+                }, status=400)
+            if not token_data.get("access_token"):
+                return JsonResponse({"error": "Invalid access token"}, status=400)
+            user_info = await google.identify(token_data)
+        except GoogleOAuthError as e:
+            return JsonResponse({"error": "Google is unavailable", "detail": str(e)}, status=502)
+
+        email = user_info.get("email")
+        if not email:
+            return JsonResponse({"error": "No email from Google"}, status=400)
+
+        user, refresh = await sync_to_async(_google_login)(email, user_info.get("name", ""))
+        return JsonResponse({
+            "user": {
+                "id": user.id,
+                "email": user.email,
+                "name": user.name,
+                "role": user.role,
+            },
+            "refresh": str(refresh),
+            "access": str(refresh.access_token),
+        })
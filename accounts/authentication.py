@@ -0,0 +1,52 @@
+# accounts/authentication.py
+import copy
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from common.cache import LRUTTLCache
+
+# Per-process cache of authenticated users, keyed by str(user id).
+# Entries are evicted by the User post_save/post_delete receivers in
+# accounts.signals; the TTL bounds staleness for writes made by other
+# processes or through QuerySet.update().
+user_cache = LRUTTLCache(
+    maxsize=getattr(settings, "AUTH_USER_CACHE_MAX_SIZE", 10000),
+    ttl=getattr(settings, "AUTH_USER_CACHE_TTL", 60),
+)
+
+
+def evict_cached_user(user_id):
+    user_cache.delete(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that serves `get_user` from `user_cache`, so a warm
+    request does no User SELECT.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        cached = user_cache.get(str(user_id))
+        if cached is None:
+            user = super().get_user(validated_token)
+            user_cache.set(str(user_id), user)
+            # Hand out a copy so per-request mutations never leak into the cache
+            return copy.copy(user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not cached.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(cached.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+        return copy.copy(cached)
@@ -5,3 +5,9 @@ class RoleChoices(TextChoices):
     ADMIN = 'admin', 'Admin'
     CARRIER = 'carrier', 'Carrier'
     SENDER = 'sender', 'Sender'
+
+
+class EmailStatusChoices(TextChoices):
+    PENDING = 'pending', 'Pending'
+    SENT = 'sent', 'Sent'
+    FAILED = 'failed', 'Failed'
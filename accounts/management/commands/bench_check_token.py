@@ -0,0 +1,50 @@
+# accounts/management/commands/bench_check_token.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from accounts.models import User
+from accounts.tokens import validate_token_claims
+from accounts.views import get_tokens_for_user
+
+
+class Command(BaseCommand):
+    help = "Compare CheckTokenView's old DB-backed validation with the claims check on the cached user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", help="User to issue the token for (defaults to the first user).")
+        parser.add_argument("--iterations", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        user = users.filter(email=options["email"]).first() if options["email"] else users.first()
+        if user is None:
+            raise CommandError("No user to issue a token for.")
+
+        token = get_tokens_for_user(user)["access"]
+        jwt_auth = JWTAuthentication()
+
+        def legacy():
+            jwt_auth.get_user(jwt_auth.get_validated_token(token))
+
+        def cached():
+            validate_token_claims(token)
+
+        for label, fn in (("db-backed", legacy), ("cached", cached)):
+            self._run(label, fn, options["iterations"])
+
+    def _run(self, label, fn, iterations):
+        fn()  # warm up
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                fn()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:>10}: {iterations / elapsed:10.0f} checks/s, "
+            f"{elapsed / iterations * 1e6:8.1f} us/check, "
+            f"{len(queries) / iterations:.2f} queries/check"
+        )
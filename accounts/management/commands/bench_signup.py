@@ -0,0 +1,50 @@
+# accounts/management/commands/bench_signup.py
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = "Time POST /api/signup/ and count its SQL queries (new and duplicate email)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        client = Client()
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        n = options["iterations"]
+
+        def signup(email):
+            return client.post("/api/signup/", {
+                "name": "Bench User",
+                "email": email,
+                "password": "bench-password",
+                "confirm_password": "bench-password",
+            })
+
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for i in range(n):
+                    signup(f"{prefix}-{i}@example.com")
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"new email:       {elapsed / n * 1000:7.2f} ms/signup, "
+                f"{len(queries) / n:.1f} queries/signup"
+            )
+
+            with CaptureQueriesContext(connection) as queries:
+                response = signup(f"{prefix}-0@EXAMPLE.com".upper())
+            self.stdout.write(
+                f"duplicate email: HTTP {response.status_code}, {len(queries)} queries, "
+                f"{response.json().get('email')}"
+            )
+        finally:
+            User.objects.filter(email__istartswith=prefix).delete()
@@ -0,0 +1,31 @@
+# accounts/management/commands/bulk_create_users.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.provisioning import BulkUserProvisioner, read_user_records
+
+
+class Command(BaseCommand):
+    help = "Create users in bulk from a CSV (email,name,password,role) or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=None, help="Password hashing processes (default: all cores).")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Pass --format csv|jsonl for this file.")
+
+        provisioner = BulkUserProvisioner(batch_size=options["batch_size"], workers=options["workers"])
+        with open(path, encoding="utf-8-sig", newline="") as fh:
+            report = provisioner.run(read_user_records(fh, file_format))
+
+        self.stdout.write(json.dumps(report, indent=2))
+        self.stdout.write(
+            f"Created {report['created']}, duplicates {len(report['duplicates'])}, invalid {len(report['invalid'])}."
+        )
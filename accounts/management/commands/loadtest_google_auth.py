@@ -0,0 +1,118 @@
+# accounts/management/commands/loadtest_google_auth.py
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+
+from accounts.oauth import (
+    AsyncGoogleOAuthClient,
+    GoogleOAuthClient,
+    set_async_google_client,
+    set_google_client,
+)
+
+
+class StandInGoogle(BaseHTTPRequestHandler):
+    """Token + userinfo stand-in that answers after a fixed latency."""
+    latency = 0.1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        time.sleep(self.latency)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply({"access_token": "stand-in"})
+
+    def do_GET(self):
+        self._reply({"email": "loadtest@example.com", "name": "Load Test"})
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent Google exchange logins against a local stand-in Google "
+        "and compare the sync view (fixed thread pool) with the async view (one event loop)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=50, help="In-flight requests for the async run.")
+        parser.add_argument("--workers", type=int, default=4, help="Worker threads for the sync run.")
+        parser.add_argument("--latency-ms", type=float, default=100, help="Stand-in Google latency per call.")
+
+    def handle(self, *args, **options):
+        StandInGoogle.latency = options["latency_ms"] / 1000
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInGoogle)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        sync_client = GoogleOAuthClient(token_url=f"{base}/token", userinfo_url=f"{base}/userinfo")
+        old_sync = set_google_client(sync_client)
+        old_async = set_async_google_client(AsyncGoogleOAuthClient(sync_client=sync_client))
+        try:
+            n = options["requests"]
+            self._report(f"sync  ({options['workers']} threads)", n, *self._run_sync(n, options["workers"]))
+            self._report(f"async (1 loop, {options['concurrency']} in flight)", n,
+                         *asyncio.run(self._run_async(n, options["concurrency"])))
+        finally:
+            set_google_client(old_sync)
+            set_async_google_client(old_async)
+            server.shutdown()
+
+    def _run_sync(self, n, workers):
+        def one(_):
+            client = Client()
+            start = time.perf_counter()
+            response = client.post("/api/google/exchange/", {"code": "x"}, content_type="application/json")
+            elapsed = time.perf_counter() - start
+            connections.close_all()
+            return elapsed, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(one, range(n)))
+        return time.perf_counter() - start, results
+
+    async def _run_async(self, n, concurrency):
+        client = AsyncClient()
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with gate:
+                start = time.perf_counter()
+                response = await client.post("/api/async/google/exchange/", {"code": "x"}, content_type="application/json")
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one() for _ in range(n)))
+        return time.perf_counter() - start, results
+
+    def _report(self, label, n, wall, results):
+        latencies = [elapsed * 1000 for elapsed, _ in results]
+        errors = sum(1 for _, code in results if code != 200)
+        self.stdout.write(
+            f"{label:>32}: {n / wall:7.1f} req/s  "
+            f"p50={statistics.median(latencies):7.1f}ms  "
+            f"p95={percentile(latencies, 95):7.1f}ms  "
+            f"p99={percentile(latencies, 99):7.1f}ms  errors={errors}"
+        )
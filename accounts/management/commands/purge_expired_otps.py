@@ -0,0 +1,29 @@
+# accounts/management/commands/purge_expired_otps.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import OTP
+
+
+class Command(BaseCommand):
+    help = "Delete expired OTP rows in small chunks so the table stays small without long locks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks.")
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        total = 0
+
+        while True:
+            ids = list(OTP.objects.expired().values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                break
+            deleted, _ = OTP.objects.filter(pk__in=ids).delete()
+            total += deleted
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(f"Deleted {total} expired OTP(s).")
@@ -0,0 +1,46 @@
+# accounts/management/commands/send_outbox_emails.py
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.outbox import deliver_batch
+
+logger = logging.getLogger(__name__)
+
+# Longest sleep after repeated errors (DB or SMTP down).
+MAX_ERROR_BACKOFF_SECONDS = 60
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches over a reused SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain the outbox once and exit.")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        interval = options["interval"]
+        errors = 0
+
+        while True:
+            try:
+                processed = deliver_batch(batch_size)
+            except Exception:
+                if options["once"]:
+                    raise
+                # Keep the worker alive; claimed rows come back when their lease expires.
+                errors += 1
+                delay = min(interval * 2 ** errors, MAX_ERROR_BACKOFF_SECONDS)
+                logger.exception("Email outbox: batch failed, retrying in %.0fs", delay)
+                time.sleep(delay)
+                continue
+            errors = 0
+            if processed:
+                self.stdout.write(f"Processed {processed} email(s).")
+                continue
+            if options["once"]:
+                break
+            time.sleep(interval)
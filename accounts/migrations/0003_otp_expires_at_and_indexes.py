@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:32
+
+import accounts.models
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_expires_at(apps, schema_editor):
+    OTP = apps.get_model('accounts', 'OTP')
+    OTP.objects.update(expires_at=models.F('created_at') + timedelta(minutes=5))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otp',
+            name='expires_at',
+            field=models.DateTimeField(default=accounts.models.otp_expiry),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['user', 'code', 'created_at'], name='accounts_ot_user_id_3093f6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_at'], name='accounts_ot_expires_57ad4f_idx'),
+        ),
+    ]
@@ -74,11 +74,12 @@
 #     def __str__(self):
 #         return f"{self.code} ({self.user.email})"
 import random
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from .enums import RoleChoices  # ✅ Proper import of RoleChoices
+from .enums import RoleChoices, EmailStatusChoices  # ✅ Proper import of RoleChoices
 
 
 class UserManager(BaseUserManager):
@@ -103,6 +104,14 @@ class UserManager(BaseUserManager):
 
         return self.create_user(email, password, **extra_fields)
 
+    def for_email(self, email):
+        """Case-insensitive email match, served by the unique Lower(email) index."""
+        return self.filter(email__lower=email.lower())
+
+    def get_by_natural_key(self, username):
+        # authenticate(email=...) lands here; keep login on the Lower(email) index
+        return self.get(email__lower=username.lower())
+
 
 class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=100)
@@ -130,18 +139,100 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['name']
 
+    class Meta:
+        indexes = [models.Index(fields=["date_joined", "id"])]
+        constraints = [
+            models.UniqueConstraint(Lower("email"), name="accounts_user_email_ci_unique"),
+        ]
+
     def __str__(self):
         return self.email
 
 
+# email__lower=<value> compiles to LOWER("email") = <value>, matching the functional index
+User._meta.get_field("email").register_lookup(Lower)
+
+
+OTP_LIFETIME = timedelta(minutes=5)
+
+
+def otp_expiry():
+    return timezone.now() + OTP_LIFETIME
+
+
+class OTPQuerySet(models.QuerySet):
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def latest_for(self, email, code):
+        """
+        Newest OTP matching (email, code), with its user, in one joined query.
+        Expiry is left to the caller so it can report it separately.
+        """
+        return (
+            self.select_related("user")
+            .filter(user__email__lower=email.lower(), code=code)
+            .order_by("-created_at")
+            .first()
+        )
+
+    def consume(self, email, code):
+        """
+        Validate and delete the newest matching, unexpired OTP atomically.
+        Returns the OTP (with .user loaded) or None.
+        """
+        with transaction.atomic():
+            # lock only the OTP row; the joined user row stays free for
+            # concurrent logins and profile edits
+            otp = (
+                self.select_for_update(of=("self",))
+                .select_related("user")
+                .filter(user__email__lower=email.lower(), code=code, expires_at__gt=timezone.now())
+                .order_by("-created_at")
+                .first()
+            )
+            if otp is not None:
+                self.filter(pk=otp.pk).delete()
+        return otp
+
+
 # ✅ OTP model for one-time password verification
 class OTP(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     code = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(default=otp_expiry)
+
+    objects = OTPQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "code", "created_at"]),
+            models.Index(fields=["expires_at"]),
+        ]
 
     def is_expired(self):
-        return timezone.now() > self.created_at + timedelta(minutes=5)
+        return timezone.now() >= self.expires_at
 
     def __str__(self):
         return f"{self.code} ({self.user.email})"
+
+
+# ✅ Outbox row for emails delivered by the `send_outbox_emails` worker
+class EmailOutbox(models.Model):
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body_text = models.TextField()
+    body_html = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=EmailStatusChoices.choices, default=EmailStatusChoices.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
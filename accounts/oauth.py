@@ -0,0 +1,404 @@
+# accounts/oauth.py
+import asyncio
+import logging
+import threading
+import time
+
+import httpx
+import jwt
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class GoogleOAuthError(Exception):
+    """Google could not be reached (timeout / connection error) after retries."""
+
+
+_ANY = object()
+
+
+class UnknownSigningKey(Exception):
+    """id_token is signed with a key id we don't have, even after a refresh."""
+
+
+class CallMetrics:
+    """Per-operation call count, failures and latency for upstream calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def record(self, op, seconds, ok):
+        with self._lock:
+            m = self._ops.setdefault(op, {"calls": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0})
+            ms = seconds * 1000
+            m["calls"] += 1
+            m["failures"] += 0 if ok else 1
+            m["total_ms"] += ms
+            m["max_ms"] = max(m["max_ms"], ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                op: {
+                    "calls": m["calls"],
+                    "failures": m["failures"],
+                    "avg_ms": round(m["total_ms"] / m["calls"], 2) if m["calls"] else 0.0,
+                    "max_ms": round(m["max_ms"], 2),
+                }
+                for op, m in self._ops.items()
+            }
+
+
+class JWKSCache:
+    """
+    In-process cache of Google's signing keys (kid -> PyJWK).
+
+    Keys are refreshed in the background once they are `refresh_ahead` of
+    the way through their TTL, so logins never wait on the JWKS fetch once
+    warm. An unknown kid (key rotation) forces one synchronous refresh, at
+    most every `min_refresh_interval` seconds.
+    """
+
+    def __init__(self, fetch, ttl=3600, refresh_ahead=0.8, min_refresh_interval=60, clock=time.monotonic):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.min_refresh_interval = min_refresh_interval
+        self._clock = clock
+        self._keys = {}
+        self._fetched_at = None
+        self._lock = threading.Lock()
+        # guards only _refreshing, so lookups never wait behind a fetch
+        self._refreshing_lock = threading.Lock()
+        self._refreshing = False
+
+    def get_key(self, kid):
+        now = self._clock()
+        fetched_at = self._fetched_at
+        if fetched_at is None or now - fetched_at >= self.ttl:
+            self.refresh(seen=fetched_at)
+        elif now - fetched_at >= self.ttl * self.refresh_ahead:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        fetched_at = self._fetched_at
+        if key is None and (fetched_at is None or self._clock() - fetched_at >= self.min_refresh_interval):
+            self.refresh(seen=fetched_at)
+            key = self._keys.get(kid)
+        if key is None:
+            raise UnknownSigningKey(kid)
+        return key
+
+    def refresh(self, seen=_ANY):
+        """
+        Reload the key set. With `seen`, skip if another thread already
+        refreshed since the caller looked, so a cold start fetches once.
+        """
+        with self._lock:
+            if seen is not _ANY and self._fetched_at != seen:
+                return
+            jwks = self._fetch()
+            keys = {}
+            for data in jwks.get("keys", []):
+                try:
+                    keys[data["kid"]] = jwt.PyJWK(data)
+                except (KeyError, jwt.PyJWKError, jwt.InvalidKeyError) as e:
+                    logger.warning("Skipping unusable JWKS key: %s", e)
+            self._keys = keys
+            self._fetched_at = self._clock()
+
+    def _refresh_in_background(self):
+        with self._refreshing_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Background JWKS refresh failed: %s", e)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+def build_session(pool_size=20):
+    """
+    Keep-alive session with a bounded connection pool. Retries are set per
+    call (see GoogleOAuthClient), not on the adapter.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class GoogleOAuthClient:
+    """
+    Shared client for Google's token and userinfo endpoints.
+
+    `transport` is any object with requests.Session's `request()` signature;
+    pass a plain session pointed at a local stand-in server (via token_url /
+    userinfo_url) to run the OAuth views without reaching Google.
+    """
+
+    def __init__(self, transport=None, token_url=None, userinfo_url=None, jwks_url=None,
+                 connect_timeout=None, read_timeout=None, retries=None):
+        self.transport = transport or build_session(getattr(settings, "GOOGLE_OAUTH_POOL_SIZE", 20))
+        self.token_url = token_url or settings.GOOGLE_TOKEN_URL
+        self.userinfo_url = userinfo_url or settings.GOOGLE_USERINFO_URL
+        self.jwks_url = jwks_url or settings.GOOGLE_JWKS_URL
+        self.timeout = (
+            connect_timeout or settings.GOOGLE_OAUTH_CONNECT_TIMEOUT,
+            read_timeout or settings.GOOGLE_OAUTH_READ_TIMEOUT,
+        )
+        self.retries = settings.GOOGLE_OAUTH_RETRIES if retries is None else retries
+        self.metrics = CallMetrics()
+        self.jwks = JWKSCache(self.fetch_jwks, ttl=getattr(settings, "GOOGLE_JWKS_TTL", 3600))
+
+    def _call(self, op, method, url, retry, **kwargs):
+        """
+        Run one upstream call within its retry budget and record latency.
+        Returns (status_code, json_body); raises GoogleOAuthError if Google
+        could not be reached.
+        """
+        attempts = 0
+        start = time.perf_counter()
+        while True:
+            attempts += 1
+            try:
+                response = self.transport.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if retry(attempts, e, None):
+                    time.sleep(self._backoff(attempts))
+                    continue
+                self._record(op, start, attempts, ok=False)
+                raise GoogleOAuthError(f"{op} failed: {e}") from e
+            if response.status_code >= 500 and retry(attempts, None, response):
+                time.sleep(self._backoff(attempts))
+                continue
+            self._record(op, start, attempts, ok=response.status_code < 400)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"error": response.text[:500]}
+            return response.status_code, body
+
+    def _backoff(self, attempts):
+        return min(0.1 * (2 ** (attempts - 1)), 1.0)
+
+    def _record(self, op, start, attempts, ok):
+        elapsed = time.perf_counter() - start
+        self.metrics.record(op, elapsed, ok)
+        logger.info("google_oauth op=%s ok=%s attempts=%d latency_ms=%.1f", op, ok, attempts, elapsed * 1000)
+
+    def exchange_code(self, code, redirect_uri=None):
+        """
+        POST the authorization code to the token endpoint. Codes are single
+        use, so only connection failures are retried, never read timeouts or 5xx.
+        """
+        data = {
+            "code": code,
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            "redirect_uri": redirect_uri or settings.GOOGLE_REDIRECT_URI,
+            "grant_type": "authorization_code",
+        }
+
+        def retry(attempts, error, response):
+            # ConnectionError covers ConnectTimeout but not ReadTimeout
+            return isinstance(error, requests.ConnectionError) and attempts <= self.retries
+
+        return self._call("token", "POST", self.token_url, retry, data=data)
+
+    def fetch_userinfo(self, access_token):
+        """GET the userinfo endpoint; idempotent, so 5xx and timeouts are retried too."""
+        def retry(attempts, error, response):
+            return attempts <= self.retries
+
+        return self._call(
+            "userinfo", "GET", self.userinfo_url, retry,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+
+    def fetch_jwks(self):
+        status_code, body = self._call("jwks", "GET", self.jwks_url, lambda attempts, e, r: attempts <= self.retries)
+        if status_code != 200:
+            raise GoogleOAuthError(f"jwks returned {status_code}")
+        return body
+
+    def verify_id_token(self, id_token):
+        """Verify an id_token locally against the cached JWKS; returns its claims."""
+        kid = jwt.get_unverified_header(id_token).get("kid")
+        key = self.jwks.get_key(kid)
+        return jwt.decode(
+            id_token,
+            key.key,
+            algorithms=["RS256"],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=["https://accounts.google.com", "accounts.google.com"],
+        )
+
+    def identify(self, token_data):
+        """
+        Return Google's user info for a token-endpoint response. Uses the
+        id_token when it verifies locally and only falls back to the
+        userinfo endpoint (one extra round trip) when it can't.
+        """
+        id_token = token_data.get("id_token")
+        if id_token:
+            try:
+                claims = self.verify_id_token(id_token)
+                if claims.get("email"):
+                    return claims
+            except UnknownSigningKey as e:
+                logger.info("id_token signed with unknown key %s; using userinfo", e)
+            except (jwt.PyJWTError, GoogleOAuthError) as e:
+                logger.warning("id_token verification failed (%s); using userinfo", e)
+        _, user_info = self.fetch_userinfo(token_data["access_token"])
+        return user_info
+
+
+class AsyncGoogleOAuthClient:
+    """
+    asyncio counterpart of GoogleOAuthClient on httpx, for the ASGI views.
+    Same endpoints, timeouts and retry budgets; id_token keys come from the
+    sync client's JWKSCache so both share one key set per process.
+    `transport` is any httpx.AsyncBaseTransport (e.g. httpx.MockTransport).
+    """
+
+    def __init__(self, sync_client=None, transport=None, token_url=None, userinfo_url=None,
+                 connect_timeout=None, read_timeout=None, retries=None):
+        self.sync_client = sync_client or get_google_client()
+        self.transport = transport
+        self.token_url = token_url or self.sync_client.token_url
+        self.userinfo_url = userinfo_url or self.sync_client.userinfo_url
+        self.timeout = httpx.Timeout(
+            read_timeout or settings.GOOGLE_OAUTH_READ_TIMEOUT,
+            connect=connect_timeout or settings.GOOGLE_OAUTH_CONNECT_TIMEOUT,
+        )
+        self.retries = settings.GOOGLE_OAUTH_RETRIES if retries is None else retries
+        self.metrics = CallMetrics()
+        self._http = None
+        self._loop = None
+
+    def _client(self):
+        # httpx pools are bound to the event loop they were opened on
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            pool_size = getattr(settings, "GOOGLE_OAUTH_POOL_SIZE", 20)
+            self._http = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            )
+            self._loop = loop
+        return self._http
+
+    async def _call(self, op, method, url, retry, **kwargs):
+        attempts = 0
+        start = time.perf_counter()
+        while True:
+            attempts += 1
+            try:
+                response = await self._client().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if retry(attempts, e, None):
+                    await asyncio.sleep(min(0.1 * (2 ** (attempts - 1)), 1.0))
+                    continue
+                self._record(op, start, attempts, ok=False)
+                raise GoogleOAuthError(f"{op} failed: {e}") from e
+            if response.status_code >= 500 and retry(attempts, None, response):
+                await asyncio.sleep(min(0.1 * (2 ** (attempts - 1)), 1.0))
+                continue
+            self._record(op, start, attempts, ok=response.status_code < 400)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"error": response.text[:500]}
+            return response.status_code, body
+
+    def _record(self, op, start, attempts, ok):
+        elapsed = time.perf_counter() - start
+        self.metrics.record(op, elapsed, ok)
+        logger.info("google_oauth_async op=%s ok=%s attempts=%d latency_ms=%.1f", op, ok, attempts, elapsed * 1000)
+
+    async def exchange_code(self, code, redirect_uri=None):
+        data = {
+            "code": code,
+            "client_id": settings.GOOGLE_CLIENT_ID,
+            "client_secret": settings.GOOGLE_CLIENT_SECRET,
+            "redirect_uri": redirect_uri or settings.GOOGLE_REDIRECT_URI,
+            "grant_type": "authorization_code",
+        }
+
+        def retry(attempts, error, response):
+            return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout)) and attempts <= self.retries
+
+        return await self._call("token", "POST", self.token_url, retry, data=data)
+
+    async def fetch_userinfo(self, access_token):
+        return await self._call(
+            "userinfo", "GET", self.userinfo_url, lambda attempts, e, r: attempts <= self.retries,
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+
+    async def identify(self, token_data):
+        """Async GoogleOAuthClient.identify: id_token first, userinfo as fallback."""
+        id_token = token_data.get("id_token")
+        if id_token:
+            try:
+                # RSA verify (and the rare JWKS refresh) runs off the event loop
+                claims = await sync_to_async(self.sync_client.verify_id_token, thread_sensitive=False)(id_token)
+                if claims.get("email"):
+                    return claims
+            except UnknownSigningKey as e:
+                logger.info("id_token signed with unknown key %s; using userinfo", e)
+            except (jwt.PyJWTError, GoogleOAuthError) as e:
+                logger.warning("id_token verification failed (%s); using userinfo", e)
+        _, user_info = await self.fetch_userinfo(token_data["access_token"])
+        return user_info
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_google_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GoogleOAuthClient()
+    return _client
+
+
+def set_google_client(client):
+    """Swap the shared client (e.g. for a stand-in transport); returns the old one."""
+    global _client
+    old, _client = _client, client
+    return old
+
+
+_async_client = None
+
+
+def get_async_google_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncGoogleOAuthClient()
+    return _async_client
+
+
+def set_async_google_client(client):
+    global _async_client
+    old, _async_client = _async_client, client
+    return old
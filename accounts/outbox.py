@@ -0,0 +1,126 @@
+# accounts/outbox.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .enums import EmailStatusChoices
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed row stays invisible to other workers while it is being sent.
+CLAIM_LEASE_SECONDS = 60
+
+
+def queue_email(to_email, subject, body_text, body_html=""):
+    """
+    Store an email in the outbox. Nothing touches SMTP here, so the caller's
+    request returns as soon as its transaction commits.
+    """
+    return EmailOutbox.objects.create(
+        to_email=to_email,
+        subject=subject,
+        body_text=body_text,
+        body_html=body_html,
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2*base, 4*base ... capped at the max."""
+    base = getattr(settings, "EMAIL_OUTBOX_RETRY_BASE_SECONDS", 30)
+    cap = getattr(settings, "EMAIL_OUTBOX_RETRY_MAX_SECONDS", 3600)
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), cap))
+
+
+def claim_batch(batch_size):
+    """
+    Lock up to `batch_size` due rows and push their next_attempt_at forward
+    by the lease, so concurrent workers skip them while we send.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailStatusChoices.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        if rows:
+            EmailOutbox.objects.filter(pk__in=[r.pk for r in rows]).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+            )
+    return rows
+
+
+def _mark_failed(row, error):
+    max_attempts = getattr(settings, "EMAIL_OUTBOX_MAX_ATTEMPTS", 5)
+    row.attempts += 1
+    row.last_error = str(error)[:2000]
+    if row.attempts >= max_attempts:
+        row.status = EmailStatusChoices.FAILED
+    else:
+        row.next_attempt_at = timezone.now() + retry_delay(row.attempts)
+    row.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def _mark_sent(row):
+    EmailOutbox.objects.filter(pk=row.pk).update(
+        status=EmailStatusChoices.SENT,
+        sent_at=timezone.now(),
+        last_error="",
+    )
+
+
+def deliver_batch(batch_size=50):
+    """
+    Send one batch of due outbox emails over a single SMTP connection.
+    Returns the number of rows processed (sent or rescheduled).
+    """
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        logger.warning("Email outbox: could not open mail connection: %s", e)
+        for row in rows:
+            _mark_failed(row, e)
+        return len(rows)
+
+    try:
+        for index, row in enumerate(rows):
+            message = EmailMultiAlternatives(
+                row.subject,
+                row.body_text,
+                settings.DEFAULT_FROM_EMAIL,
+                [row.to_email],
+                connection=connection,
+            )
+            if row.body_html:
+                message.attach_alternative(row.body_html, "text/html")
+            try:
+                message.send()
+            except Exception as e:
+                logger.warning("Email outbox: sending %s failed: %s", row.pk, e)
+                _mark_failed(row, e)
+                # The server may have dropped us; reconnect for the rest of the batch.
+                try:
+                    connection.close()
+                    connection.open()
+                except Exception as e:
+                    logger.warning("Email outbox: could not reopen mail connection: %s", e)
+                    for rest in rows[index + 1:]:
+                        _mark_failed(rest, e)
+                    break
+            else:
+                # Recorded per row, so a failure later in the batch can't get
+                # it re-sent when the lease runs out.
+                _mark_sent(row)
+    finally:
+        connection.close()
+    return len(rows)
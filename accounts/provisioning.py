@@ -0,0 +1,161 @@
+# accounts/provisioning.py
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .enums import RoleChoices
+from .models import User
+
+
+def read_user_records(fileobj, file_format):
+    """
+    Yield (line_number, record) from a CSV (header row: email,name,password,role)
+    or JSONL file. Bad JSON lines are yielded as records with an "_error" key.
+    """
+    if isinstance(fileobj, (bytes, bytearray)):
+        fileobj = io.StringIO(fileobj.decode("utf-8-sig"))
+    elif not isinstance(fileobj, io.TextIOBase):
+        fileobj = io.TextIOWrapper(fileobj, encoding="utf-8-sig")
+
+    if file_format == "csv":
+        for line_number, row in enumerate(csv.DictReader(fileobj), start=2):
+            yield line_number, row
+    elif file_format == "jsonl":
+        for line_number, line in enumerate(fileobj, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, {"_error": f"invalid JSON: {e}"}
+    else:
+        raise ValueError(f"Unsupported format: {file_format}")
+
+
+def _init_worker():
+    # Needed under the "spawn" start method; a no-op for forked workers
+    if not apps.ready:
+        django.setup()
+
+
+class _InlinePool:
+    """Executor stand-in that hashes in the calling thread (workers=1)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, iterable, chunksize=1):
+        return map(fn, iterable)
+
+
+def _clean(record):
+    """Return (clean_record, error)."""
+    if "_error" in record:
+        return None, record["_error"]
+    email = (record.get("email") or "").strip()
+    name = (record.get("name") or "").strip()
+    role = (record.get("role") or RoleChoices.CARRIER).strip()
+    try:
+        validate_email(email)
+    except ValidationError:
+        return None, "invalid email"
+    if not name:
+        return None, "name is required"
+    if role not in RoleChoices.values:
+        return None, f"invalid role '{role}'"
+    return {
+        "email": User.objects.normalize_email(email),
+        "name": name,
+        "role": role,
+        "password": record.get("password") or None,
+    }, None
+
+
+class BulkUserProvisioner:
+    """
+    Create users in batches: validate rows, drop duplicates (within the file
+    and against the DB), hash passwords across a process pool, then insert
+    each batch with one bulk_create. Bad rows and duplicates are reported,
+    never fatal. With workers=1 passwords are hashed in the calling thread
+    and no processes are started.
+    """
+
+    def __init__(self, batch_size=1000, workers=None):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.report = {"created": 0, "duplicates": [], "invalid": []}
+        self._seen = set()
+
+    def run(self, records):
+        with self._pool() as pool:
+            batch = []
+            for line_number, record in records:
+                clean, error = _clean(record)
+                if error:
+                    self.report["invalid"].append({"line": line_number, "error": error})
+                    continue
+                if clean["email"].lower() in self._seen:
+                    self.report["duplicates"].append({"line": line_number, "email": clean["email"]})
+                    continue
+                self._seen.add(clean["email"].lower())
+                batch.append((line_number, clean))
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, pool)
+                    batch = []
+            if batch:
+                self._flush(batch, pool)
+        return self.report
+
+    def _pool(self):
+        if self.workers > 1:
+            return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return _InlinePool()
+
+    def _flush(self, batch, pool):
+        existing = {
+            email.lower()
+            for email in User.objects.filter(
+                email__lower__in=[clean["email"].lower() for _, clean in batch]
+            ).values_list("email", flat=True)
+        }
+        fresh = []
+        for line_number, clean in batch:
+            if clean["email"].lower() in existing:
+                self.report["duplicates"].append({"line": line_number, "email": clean["email"]})
+            else:
+                fresh.append((line_number, clean))
+        if not fresh:
+            return
+
+        chunksize = max(1, len(fresh) // (self.workers * 4))
+        hashes = pool.map(make_password, [clean["password"] for _, clean in fresh], chunksize=chunksize)
+        users = [
+            User(email=clean["email"], name=clean["name"], role=clean["role"], password=hashed)
+            for (_, clean), hashed in zip(fresh, hashes)
+        ]
+        # ignore_conflicts: a concurrent signup between the DB check and this
+        # insert must not abort the batch. Salted hashes are unique, so the
+        # rows carrying ours are the ones this insert actually created.
+        User.objects.bulk_create(users, batch_size=self.batch_size, ignore_conflicts=True)
+        landed = set(
+            User.objects.filter(
+                email__lower__in=[user.email.lower() for user in users],
+                password__in=[user.password for user in users],
+            ).values_list("password", flat=True)
+        )
+        for (line_number, clean), user in zip(fresh, users):
+            if user.password in landed:
+                self.report["created"] += 1
+            else:
+                self.report["duplicates"].append({"line": line_number, "email": clean["email"]})
@@ -3,11 +3,25 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate, get_user_model
 from django.core.validators import RegexValidator
+from django.db import IntegrityError, transaction
 from .models import OTP
-from .utils import generate_otp, send_otp_email
+from .utils import generate_otp, queue_otp_email
 
 User = get_user_model() 
 
+# How each backend names the email unique constraints in an IntegrityError:
+# the Lower(email) constraint, and the column's own unique index
+# (PostgreSQL "accounts_user_email_key", SQLite/MySQL "accounts_user.email").
+EMAIL_UNIQUE_CONSTRAINTS = ("accounts_user_email_ci_unique", "accounts_user_email_key", "accounts_user.email")
+
+
+def is_duplicate_email(error):
+    """True if `error` is a unique violation on the user's email."""
+    # psycopg exposes the violated constraint by name; other drivers only in the message
+    diag = getattr(error.__cause__, "diag", None)
+    text = getattr(diag, "constraint_name", None) or str(error)
+    return any(name in text for name in EMAIL_UNIQUE_CONSTRAINTS)
+
 
 # ---------------------------
 # SIGNUP SERIALIZER
@@ -46,11 +60,9 @@ class SignupSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ["name", "email", "password", "confirm_password", "role"]
-
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("This email is already registered.")
-        return value
+        # Uniqueness is enforced by the Lower(email) index in create(),
+        # not by a SELECT from DRF's UniqueValidator
+        extra_kwargs = {"email": {"validators": []}}
 
     def validate(self, attrs):
         if attrs.get("password") != attrs.get("confirm_password"):
@@ -61,7 +73,14 @@ class SignupSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop("confirm_password")
-        user = User.objects.create_user(**validated_data)
+        # One INSERT; the unique Lower(email) index rejects duplicates race-free.
+        # Nothing runs on the connection after a failure, so no savepoint is needed.
+        try:
+            user = User.objects.create_user(**validated_data)
+        except IntegrityError as e:
+            if not is_duplicate_email(e):
+                raise
+            raise serializers.ValidationError({"email": ["This email is already registered."]})
         return user
 
 
@@ -91,20 +110,21 @@ class SendOTPSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
     def validate_email(self, value):
-        if not User.objects.filter(email=value).exists():
+        self.user = User.objects.for_email(value).first()
+        if not self.user:
             raise serializers.ValidationError("User with this email does not exist.")
         return value
 
     def create(self, validated_data):
-        # 1️⃣ Get the user
-        user = User.objects.get(email=validated_data["email"])
+        # 1️⃣ User was already fetched (once) in validate_email
+        user = self.user
 
-        # 2️⃣ Generate OTP
+        # 2️⃣ Generate OTP and queue the email in one transaction;
+        #     the send_outbox_emails worker delivers it.
         code = generate_otp()
-        OTP.objects.create(user=user, code=code)
-
-        # 3️⃣ Send OTP via email
-        send_otp_email(user.email, code, name=user.name)
+        with transaction.atomic():
+            OTP.objects.create(user=user, code=code)
+            queue_otp_email(user.email, code, name=user.name)
 
         # 4️⃣ Return the user object (not a dict) so the view can access user.email
         return user
@@ -117,23 +137,22 @@ class VerifyOTPSerializer(serializers.Serializer):
     code = serializers.CharField(max_length=6)
 
     def validate(self, data):
-        request = self.context.get("request")
-        email = request.data.get("email")
+        email = self.initial_data.get("email")
 
         if not email:
             raise serializers.ValidationError(
                 "No OTP request found. Please request OTP first."
             )
 
-        user = User.objects.filter(email=email).first()
-        if not user:
-            raise serializers.ValidationError("User not found.")
-
-        otp = OTP.objects.filter(user=user, code=data["code"]).order_by("-created_at").first()
-        if not otp or otp.is_expired():
+        otp = OTP.objects.latest_for(email, data["code"])
+        if not otp:
+            if not User.objects.for_email(email).exists():
+                raise serializers.ValidationError("User not found.")
+            raise serializers.ValidationError("OTP is invalid or expired.")
+        if otp.is_expired():
             raise serializers.ValidationError("OTP is invalid or expired.")
 
-        data["user"] = user
+        data["user"] = otp.user
         return data
 
 
@@ -0,0 +1,13 @@
+# accounts/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import evict_cached_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_user_from_auth_cache(sender, instance, **kwargs):
+    evict_cached_user(instance.pk)
+
@@ -1,3 +1,814 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import jwt
+import requests
+from asgiref.sync import sync_to_async
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from jwt.algorithms import RSAAlgorithm
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication, user_cache
+from .enums import EmailStatusChoices
+from .models import OTP, OTP_LIFETIME, EmailOutbox, OTPQuerySet, User
+from .oauth import (
+    AsyncGoogleOAuthClient, GoogleOAuthClient, GoogleOAuthError, JWKSCache, UnknownSigningKey,
+    set_async_google_client,
+)
+from .outbox import CLAIM_LEASE_SECONDS, claim_batch, deliver_batch, queue_email, retry_delay
+from .provisioning import BulkUserProvisioner, read_user_records
+from .serializers import SignupSerializer, is_duplicate_email
+from .views import UserListView
+
+
+class FlakyBackend(EmailBackend):
+    """locmem backend whose Nth send (and reopen, once closed) can be made to fail."""
+    fail_sends = ()
+    fail_reopen = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sends = 0
+        self.opens = 0
+
+    def open(self):
+        self.opens += 1
+        if self.fail_reopen and self.opens > 1:
+            raise OSError("connection refused")
+
+    def send_messages(self, messages):
+        self.sends += 1
+        if self.sends in self.fail_sends:
+            raise OSError("connection dropped")
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3,
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS=30,
+    EMAIL_OUTBOX_RETRY_MAX_SECONDS=100,
+)
+class EmailOutboxTests(TestCase):
+    def queue(self, count):
+        return [queue_email(f"user{i}@example.com", "Your code", f"code {i}", f"<b>code {i}</b>") for i in range(count)]
+
+    def deliver_with(self, backend, batch_size=50):
+        """deliver_batch over `backend`; every caller expects (and swallows) a logged failure."""
+        with mock.patch("accounts.outbox.get_connection", return_value=backend), \
+                self.assertLogs("accounts.outbox", "WARNING"):
+            return deliver_batch(batch_size)
+
+    def test_deliver_batch_sends_and_marks_sent(self):
+        rows = self.queue(3)
+
+        self.assertEqual(deliver_batch(), 3)
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [r.to_email for r in rows])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+        for row in EmailOutbox.objects.all():
+            self.assertEqual(row.status, EmailStatusChoices.SENT)
+            self.assertIsNotNone(row.sent_at)
+        self.assertEqual(deliver_batch(), 0)
+
+    def test_claim_leases_rows_away_from_other_workers(self):
+        self.queue(3)
+        before = timezone.now()
+
+        claimed = claim_batch(2)
+
+        self.assertEqual(len(claimed), 2)
+        leased = EmailOutbox.objects.filter(pk__in=[r.pk for r in claimed])
+        for row in leased:
+            self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=CLAIM_LEASE_SECONDS))
+        # only the unclaimed row is still due
+        self.assertEqual([r.pk for r in claim_batch(10)], list(EmailOutbox.objects.exclude(pk__in=leased).values_list("pk", flat=True)))
+        self.assertEqual(claim_batch(10), [])
+
+    def test_rows_not_yet_due_are_skipped(self):
+        row = self.queue(1)[0]
+        EmailOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(deliver_batch(), 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_retry_delay_backs_off_to_the_cap(self):
+        self.assertEqual([retry_delay(n).total_seconds() for n in (1, 2, 3, 4)], [30, 60, 100, 100])
+
+    def test_failed_send_is_rescheduled_then_marked_failed(self):
+        row = self.queue(1)[0]
+        FlakyBackend.fail_sends = (1,)
+        self.addCleanup(setattr, FlakyBackend, "fail_sends", ())
+
+        for attempt in (1, 2, 3):
+            EmailOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+            before = timezone.now()
+            self.deliver_with(FlakyBackend())
+            row.refresh_from_db()
+            self.assertEqual(row.attempts, attempt)
+            self.assertEqual(row.last_error, "connection dropped")
+            if attempt < 3:
+                self.assertEqual(row.status, EmailStatusChoices.PENDING)
+                self.assertGreaterEqual(row.next_attempt_at, before + retry_delay(attempt))
+
+        self.assertEqual(row.status, EmailStatusChoices.FAILED)
+        self.assertEqual(deliver_batch(), 0)
+
+    def test_sent_rows_stay_sent_when_reconnect_fails(self):
+        rows = self.queue(4)
+        FlakyBackend.fail_sends, FlakyBackend.fail_reopen = (2,), True
+        self.addCleanup(setattr, FlakyBackend, "fail_sends", ())
+        self.addCleanup(setattr, FlakyBackend, "fail_reopen", False)
+
+        self.assertEqual(self.deliver_with(FlakyBackend()), 4)
+
+        statuses = {r.pk: (r.status, r.attempts, r.last_error) for r in EmailOutbox.objects.all()}
+        self.assertEqual(statuses[rows[0].pk], (EmailStatusChoices.SENT, 0, ""))
+        self.assertEqual(statuses[rows[1].pk], (EmailStatusChoices.PENDING, 1, "connection dropped"))
+        self.assertEqual(statuses[rows[2].pk], (EmailStatusChoices.PENDING, 1, "connection refused"))
+        self.assertEqual(statuses[rows[3].pk], (EmailStatusChoices.PENDING, 1, "connection refused"))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_unreachable_server_reschedules_whole_batch(self):
+        self.queue(2)
+        backend = FlakyBackend()
+        backend.open = mock.Mock(side_effect=OSError("no route to host"))
+
+        self.assertEqual(self.deliver_with(backend), 2)
+
+        self.assertEqual(
+            list(EmailOutbox.objects.values_list("status", "attempts")),
+            [(EmailStatusChoices.PENDING, 1)] * 2,
+        )
+        self.assertEqual(mail.outbox, [])
+
+
+class OTPQuerySetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="Carrier@Example.com", password="x", name="Carrier")
+
+    def otp(self, code, age=timedelta(0), lifetime=OTP_LIFETIME):
+        otp = OTP.objects.create(user=self.user, code=code)
+        created = timezone.now() - age
+        OTP.objects.filter(pk=otp.pk).update(created_at=created, expires_at=created + lifetime)
+        return OTP.objects.get(pk=otp.pk)
+
+    def test_latest_for_picks_newest_match_case_insensitively(self):
+        self.otp("111111", age=timedelta(minutes=3))
+        newest = self.otp("111111", age=timedelta(minutes=1))
+        self.otp("222222")
+
+        with self.assertNumQueries(1):
+            otp = OTP.objects.latest_for("carrier@example.COM", "111111")
+            self.assertEqual(otp.user, self.user)
+        self.assertEqual(otp.pk, newest.pk)
+        self.assertIsNone(OTP.objects.latest_for("carrier@example.com", "999999"))
+        self.assertIsNone(OTP.objects.latest_for("other@example.com", "111111"))
+
+    def test_latest_for_returns_expired_codes_for_the_caller_to_report(self):
+        expired = self.otp("111111", age=timedelta(minutes=10))
+
+        otp = OTP.objects.latest_for("carrier@example.com", "111111")
+
+        self.assertEqual(otp.pk, expired.pk)
+        self.assertTrue(otp.is_expired())
+
+    def test_consume_is_single_use(self):
+        otp = self.otp("111111")
+
+        consumed = OTP.objects.consume("CARRIER@example.com", "111111")
+
+        self.assertEqual(consumed.pk, otp.pk)
+        self.assertEqual(consumed.user, self.user)
+        self.assertFalse(OTP.objects.filter(pk=otp.pk).exists())
+        self.assertIsNone(OTP.objects.consume("carrier@example.com", "111111"))
+
+    def test_consume_ignores_expired_codes(self):
+        expired = self.otp("111111", age=timedelta(minutes=10))
+        self.otp("111111", age=timedelta(minutes=10), lifetime=timedelta(minutes=10))  # expires exactly now
+
+        self.assertIsNone(OTP.objects.consume("carrier@example.com", "111111"))
+        self.assertTrue(OTP.objects.filter(pk=expired.pk).exists())
+        self.assertEqual(set(OTP.objects.expired()), set(OTP.objects.all()))
+
+    def test_consume_takes_the_newest_unexpired_code(self):
+        self.otp("111111", age=timedelta(minutes=10))
+        live = self.otp("111111", age=timedelta(minutes=1))
+
+        self.assertEqual(OTP.objects.consume("carrier@example.com", "111111").pk, live.pk)
+        self.assertEqual(OTP.objects.count(), 1)
+
+    def test_consume_locks_only_the_otp_row(self):
+        # SQLite ignores FOR UPDATE, so check what consume asks for
+        self.otp("111111")
+        with mock.patch.object(OTPQuerySet, "select_for_update", autospec=True,
+                               side_effect=lambda qs, **kw: qs) as select_for_update:
+            OTP.objects.consume("carrier@example.com", "111111")
+        self.assertEqual(select_for_update.call_args.kwargs, {"of": ("self",)})
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(email="cached@example.com", password="secret", name="Cached")
+        self.auth = CachedJWTAuthentication()
+
+    def token(self, user=None):
+        return self.auth.get_validated_token(str(AccessToken.for_user(user or self.user)))
+
+    def test_hit_costs_no_query_and_returns_a_copy(self):
+        token = self.token()
+        with self.assertNumQueries(1):
+            first = self.auth.get_user(token)
+        with self.assertNumQueries(0):
+            second = self.auth.get_user(token)
+
+        self.assertEqual(second, self.user)
+        second.name = "mutated"
+        self.assertEqual(self.auth.get_user(token).name, "Cached")
+        self.assertIsNot(first, second)
+
+    def test_save_and_delete_evict(self):
+        token = self.token()
+        self.auth.get_user(token)
+
+        self.user.name = "Renamed"
+        self.user.save()
+        self.assertIsNone(user_cache.get(str(self.user.pk)))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.auth.get_user(token).name, "Renamed")
+
+        self.user.delete()
+        self.assertIsNone(user_cache.get(str(token["user_id"])))
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.get_user(token)
+
+    def test_inactive_cached_user_is_rejected(self):
+        token = self.token()
+        self.auth.get_user(token)
+        # a write the signals do not see, e.g. from another process
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        user_cache.get(str(self.user.pk)).is_active = False
+
+        with self.assertRaises(AuthenticationFailed) as ctx:
+            self.auth.get_user(token)
+        self.assertEqual(ctx.exception.detail["code"], "user_inactive")
+
+    def test_password_change_revokes_tokens_on_a_hit(self):
+        # simplejwt rebinds api_settings on setting_changed, so patch the shared instance
+        with mock.patch.object(api_settings, "CHECK_REVOKE_TOKEN", True):
+            old = self.token()
+            self.auth.get_user(old)
+            self.user.set_password("changed")
+            self.user.save()
+            new = self.token()
+            self.auth.get_user(new)  # repopulates the cache with the new hash
+
+            with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed) as ctx:
+                self.auth.get_user(old)
+            self.assertEqual(ctx.exception.detail["code"], "password_changed")
+            with self.assertNumQueries(0):
+                self.assertEqual(self.auth.get_user(new), self.user)
+
+
+class UserListViewTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.me = User.objects.create_user(email="me@example.com", password="x", name="Me")
+        for i in range(5):
+            User.objects.create_user(email=f"user{i}@example.com", password="x", name=f"User {i}")
+        # three users joined in the same instant: the id tiebreaker must keep pages stable
+        tied = timezone.now() - timedelta(days=1)
+        User.objects.filter(email__in=["user1@example.com", "user2@example.com", "user3@example.com"]).update(date_joined=tied)
+        self.expected = list(User.objects.order_by("date_joined", "id").values_list("id", flat=True))
+        self.client.force_authenticate(self.me)
+
+    def walk(self, page_size):
+        ids, url = [], f"{reverse('user-list')}?page_size={page_size}"
+        while url:
+            body = self.client.get(url).json()
+            ids += [u["id"] for u in body["data"]]
+            url = body["next"]
+        return ids
+
+    def cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def test_cursor_round_trip_over_equal_date_joined(self):
+        for page_size in (1, 2, 4):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(page_size), self.expected)
+
+    def test_tampered_cursors_are_not_found(self):
+        joined = User.objects.get(pk=self.expected[0]).date_joined.isoformat()
+        for values in (["not-a-date", 1], [joined, "x"], [joined, [1]], [joined], "junk"):
+            with self.subTest(values=values):
+                response = self.client.get(reverse("user-list"), {"cursor": self.cursor(values)})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response.json(), {"detail": "Invalid cursor."})
+
+    def test_ndjson_export(self):
+        response = self.client.get(reverse("user-list"), {"export": "ndjson"})
+
+        self.assertFalse(response.is_async)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([r["id"] for r in rows], self.expected)
+
+    async def test_ndjson_export_streams_asynchronously_under_asgi(self):
+        token = await sync_to_async(lambda: str(AccessToken.for_user(self.me)))()
+        with mock.patch.object(UserListView, "export_chunk_size", 2):
+            response = await self.async_client.get(
+                reverse("user-list"), {"export": "ndjson"}, headers={"authorization": f"Bearer {token}"},
+            )
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(len(chunks), 3)
+        rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual([r["id"] for r in rows], self.expected)
+
+
+class ScriptedTransport:
+    """requests-style transport replaying `outcomes`: a (status, body) response or an exception per call."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        status_code, body = outcome
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps(body).encode()
+        return response
+
+
+@override_settings(GOOGLE_CLIENT_ID="client-id", GOOGLE_CLIENT_SECRET="secret", GOOGLE_REDIRECT_URI="https://app/cb")
+@mock.patch("accounts.oauth.time.sleep")
+class GoogleOAuthClientTests(TestCase):
+    def client_for(self, *outcomes, retries=2):
+        return GoogleOAuthClient(transport=ScriptedTransport(*outcomes), retries=retries)
+
+    def test_exchange_code_posts_with_timeouts(self, sleep):
+        google = self.client_for((200, {"access_token": "at"}))
+
+        self.assertEqual(google.exchange_code("the-code"), (200, {"access_token": "at"}))
+
+        (method, url, kwargs), = google.transport.calls
+        self.assertEqual((method, url), ("POST", settings.GOOGLE_TOKEN_URL))
+        self.assertEqual(kwargs["timeout"], (settings.GOOGLE_OAUTH_CONNECT_TIMEOUT, settings.GOOGLE_OAUTH_READ_TIMEOUT))
+        self.assertEqual(kwargs["data"]["code"], "the-code")
+        self.assertEqual(kwargs["data"]["redirect_uri"], "https://app/cb")
+        sleep.assert_not_called()
+
+    def test_exchange_code_retries_connection_errors_within_budget(self, sleep):
+        google = self.client_for(requests.ConnectionError("refused"), requests.ConnectTimeout("slow"), (200, {"access_token": "at"}))
+
+        self.assertEqual(google.exchange_code("c")[0], 200)
+        self.assertEqual(len(google.transport.calls), 3)
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [0.1, 0.2])
+
+        google = self.client_for(*[requests.ConnectionError("refused")] * 3)
+        with self.assertRaises(GoogleOAuthError):
+            google.exchange_code("c")
+        self.assertEqual(len(google.transport.calls), 3)
+        self.assertEqual(google.metrics.snapshot()["token"]["failures"], 1)
+
+    def test_exchange_code_never_retries_once_google_may_have_seen_the_code(self, sleep):
+        google = self.client_for(requests.ReadTimeout("read timed out"), (200, {}))
+        with self.assertRaises(GoogleOAuthError):
+            google.exchange_code("c")
+        self.assertEqual(len(google.transport.calls), 1)
+
+        google = self.client_for((503, {"error": "unavailable"}), (200, {}))
+        self.assertEqual(google.exchange_code("c"), (503, {"error": "unavailable"}))
+        self.assertEqual(len(google.transport.calls), 1)
+        sleep.assert_not_called()
+
+    def test_userinfo_retries_timeouts_and_5xx(self, sleep):
+        google = self.client_for(requests.ReadTimeout("slow"), (502, {}), (200, {"email": "g@example.com"}))
+
+        self.assertEqual(google.fetch_userinfo("at"), (200, {"email": "g@example.com"}))
+        self.assertEqual(google.transport.calls[0][2]["headers"], {"Authorization": "Bearer at"})
+        self.assertEqual(len(google.transport.calls), 3)
+
+        google = self.client_for((500, {}), (500, {}), (500, {"error": "still down"}))
+        self.assertEqual(google.fetch_userinfo("at"), (500, {"error": "still down"}))
+        self.assertEqual(google.metrics.snapshot()["userinfo"]["calls"], 1)
+
+    def test_zero_retries(self, sleep):
+        google = self.client_for(requests.ConnectionError("refused"), retries=0)
+        with self.assertRaises(GoogleOAuthError):
+            google.fetch_userinfo("at")
+        self.assertEqual(len(google.transport.calls), 1)
+
+
+def rsa_jwk(private_key, kid):
+    return {**RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True), "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+class JWKSCacheTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def setUp(self):
+        self.now = 0.0
+        self.fetches = 0
+        self.cache = JWKSCache(self.fetch, ttl=100, refresh_ahead=0.8, min_refresh_interval=60, clock=lambda: self.now)
+
+    def fetch(self):
+        self.fetches += 1
+        return {"keys": [rsa_jwk(self.key, "k1"), {"kid": "broken", "kty": "RSA"}]}
+
+    def test_cold_start_fetches_once_and_skips_unusable_keys(self):
+        with self.assertLogs("accounts.oauth", "WARNING"):
+            self.assertEqual(self.cache.get_key("k1").key_id, "k1")
+        self.now = 50
+        self.cache.get_key("k1")
+        self.assertEqual(self.fetches, 1)
+
+    def test_refresh_ahead_runs_in_the_background(self):
+        with self.assertLogs("accounts.oauth", "WARNING"):
+            self.cache.get_key("k1")
+        started, release, done = threading.Event(), threading.Event(), threading.Event()
+
+        def slow_fetch():
+            started.set()
+            release.wait(5)
+            try:
+                return self.fetch()
+            finally:
+                done.set()
+        self.cache._fetch = slow_fetch
+
+        self.now = 85
+        with self.assertLogs("accounts.oauth", "WARNING"):
+            # both lookups are served from the old key set while one refresh runs
+            self.assertEqual(self.cache.get_key("k1").key_id, "k1")
+            self.assertTrue(started.wait(5))
+            self.cache.get_key("k1")
+            release.set()
+            self.assertTrue(done.wait(5))
+            self.cache._lock.acquire()  # refresh() has stored the keys once the lock is free
+            self.cache._lock.release()
+
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(self.cache._fetched_at, 85)
+
+    def test_expired_key_set_is_refreshed_synchronously(self):
+        with self.assertLogs("accounts.oauth", "WARNING"):
+            self.cache.get_key("k1")
+            self.now = 100
+            self.cache.get_key("k1")
+        self.assertEqual(self.fetches, 2)
+
+    def test_unknown_kid_forces_a_rate_limited_refresh(self):
+        with self.assertLogs("accounts.oauth", "WARNING"):
+            self.cache.get_key("k1")
+        with self.assertRaises(UnknownSigningKey):
+            self.cache.get_key("rotated")
+        self.assertEqual(self.fetches, 1)
+
+        self.now = 60
+        with self.assertLogs("accounts.oauth", "WARNING"), self.assertRaises(UnknownSigningKey):
+            self.cache.get_key("rotated")
+        self.assertEqual(self.fetches, 2)
+
+
+@override_settings(GOOGLE_CLIENT_ID="client-id")
+class VerifyIdTokenTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        cls.other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def setUp(self):
+        self.google = GoogleOAuthClient(transport=ScriptedTransport((200, {"keys": [rsa_jwk(self.key, "k1")]})))
+
+    def id_token(self, key=None, kid="k1", **claims):
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": "client-id",
+            "exp": int(time.time()) + 300,
+            "email": "g@example.com",
+            **claims,
+        }
+        return jwt.encode(claims, key or self.key, algorithm="RS256", headers={"kid": kid})
+
+    def test_valid_token(self):
+        claims = self.google.verify_id_token(self.id_token(iss="accounts.google.com"))
+
+        self.assertEqual(claims["email"], "g@example.com")
+        self.assertEqual(self.google.metrics.snapshot()["jwks"]["calls"], 1)
+
+    def test_bad_tokens_are_rejected(self):
+        self.google.verify_id_token(self.id_token())  # warm the key set
+        for token, error in (
+            (self.id_token(aud="someone-else"), jwt.InvalidAudienceError),
+            (self.id_token(iss="https://evil.example.com"), jwt.InvalidIssuerError),
+            (self.id_token(exp=int(time.time()) - 60), jwt.ExpiredSignatureError),
+            (self.id_token(key=self.other_key), jwt.InvalidSignatureError),
+            (jwt.encode({"aud": "client-id"}, "k" * 32, algorithm="HS256", headers={"kid": "k1"}), jwt.InvalidAlgorithmError),
+        ):
+            with self.subTest(error=error.__name__), self.assertRaises(error):
+                self.google.verify_id_token(token)
+
+    def test_identify_falls_back_to_userinfo(self):
+        self.google.transport.outcomes.append((200, {"email": "from-userinfo@example.com"}))
+
+        with self.assertLogs("accounts.oauth", "WARNING"):
+            info = self.google.identify({"access_token": "at", "id_token": self.id_token(aud="someone-else")})
+
+        self.assertEqual(info, {"email": "from-userinfo@example.com"})
+        self.assertEqual([c[0] for c in self.google.transport.calls], ["GET", "GET"])
+
+    def test_identify_uses_a_valid_id_token_without_userinfo(self):
+        info = self.google.identify({"access_token": "at", "id_token": self.id_token()})
+
+        self.assertEqual(info["email"], "g@example.com")
+        self.assertEqual(len(self.google.transport.calls), 1)  # the JWKS fetch only
+
+
+@override_settings(GOOGLE_CLIENT_ID="client-id", FRONTEND_REDIRECT_URL="https://app/done")
+@mock.patch("accounts.oauth.asyncio.sleep")
+class AsyncViewTests(TestCase):
+    """The ASGI variants under /api/async/, with Google replaced by an httpx.MockTransport."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="async@example.com", password="x", name="Async")
+        self.requests = []
+
+    def use_google(self, *outcomes):
+        """Answer Google calls in order: a (status, body) pair or an exception to raise."""
+        outcomes = list(outcomes)
+
+        def handler(request):
+            self.requests.append(request)
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return httpx.Response(outcome[0], json=outcome[1])
+
+        sync_client = GoogleOAuthClient(transport=ScriptedTransport())
+        old = set_async_google_client(AsyncGoogleOAuthClient(sync_client, transport=httpx.MockTransport(handler)))
+        self.addCleanup(set_async_google_client, old)
+
+    async def test_send_and_verify_otp(self, sleep):
+        response = await self.async_client.post(reverse("async-send-otp"), {"email": "ASYNC@example.com"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self.async_client.session.aget("otp_user_email"), "ASYNC@example.com")
+        otp = await OTP.objects.select_related("user").aget(user__email="async@example.com")
+        self.assertTrue(await EmailOutbox.objects.filter(to_email="async@example.com").aexists())
+
+        response = await self.async_client.post(reverse("async-verify-otp"), {"email": "async@example.com", "code": "000000"}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(reverse("async-verify-otp"), {"email": "async@example.com", "code": otp.code}, content_type="application/json")
+        self.assertEqual(response.json(), {"message": "OTP verified successfully."})
+        self.assertEqual(await self.async_client.session.aget("verified_email"), "async@example.com")
+
+    async def test_send_otp_unknown_email(self, sleep):
+        response = await self.async_client.post(reverse("async-send-otp"), {"email": "nobody@example.com"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("email", response.json())
+
+    async def test_exchange_logs_in_with_userinfo(self, sleep):
+        self.use_google(
+            httpx.ConnectError("refused"),
+            (200, {"access_token": "at"}),
+            (200, {"email": "new@example.com", "name": "New"}),
+        )
+
+        response = await self.async_client.post(reverse("async_google_exchange"), {"code": "c%2F1"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["user"]["email"], "new@example.com")
+        self.assertTrue(body["access"] and body["refresh"])
+        self.assertEqual(httpx.QueryParams(self.requests[1].content.decode())["code"], "c/1")
+        self.assertEqual(self.requests[2].headers["authorization"], "Bearer at")
+        self.assertTrue(await User.objects.filter(email="new@example.com").aexists())
+
+    async def test_exchange_matches_existing_user_case_insensitively(self, sleep):
+        self.use_google((200, {"access_token": "at"}), (200, {"email": "Async@Example.com"}))
+
+        response = await self.async_client.post(reverse("async_google_exchange"), {"code": "c"}, content_type="application/json")
+
+        self.assertEqual(response.json()["user"]["id"], self.user.pk)
+
+    async def test_exchange_errors(self, sleep):
+        cases = (
+            ({}, [], 400, "Code is required"),
+            ({"code": "c"}, [(400, {"error": "invalid_grant"})], 400, {"error": "invalid_grant"}),
+            ({"code": "c"}, [(200, {})], 400, "Invalid access token"),
+            ({"code": "c"}, [(200, {"access_token": "at"}), (200, {})], 400, "No email from Google"),
+        )
+        for payload, outcomes, status_code, error in cases:
+            with self.subTest(error=error):
+                self.use_google(*outcomes)
+                response = await self.async_client.post(reverse("async_google_exchange"), payload, content_type="application/json")
+                self.assertEqual(response.status_code, status_code)
+                self.assertEqual(response.json()["error"], error)
+
+    async def test_exchange_code_is_not_retried_after_a_read_timeout(self, sleep):
+        self.use_google(httpx.ReadTimeout("slow"), (200, {"access_token": "at"}))
+
+        response = await self.async_client.post(reverse("async_google_exchange"), {"code": "c"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(len(self.requests), 1)
+        sleep.assert_not_called()
+
+    async def test_exchange_gives_up_after_the_retry_budget(self, sleep):
+        self.use_google(*[httpx.ConnectError("refused")] * (settings.GOOGLE_OAUTH_RETRIES + 1))
+
+        response = await self.async_client.post(reverse("async_google_exchange"), {"code": "c"}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.json()["error"], "Google is unavailable")
+        self.assertEqual(len(self.requests), settings.GOOGLE_OAUTH_RETRIES + 1)
+
+    async def test_callback_redirects(self, sleep):
+        response = await self.async_client.get(reverse("async_google_callback"))
+        self.assertEqual(response.url, "https://app/done?error=NoCode")
+
+        self.use_google(*[httpx.ConnectError("refused")] * (settings.GOOGLE_OAUTH_RETRIES + 1))
+        response = await self.async_client.get(reverse("async_google_callback"), {"code": "c"})
+        self.assertEqual(response.url, "https://app/done?error=GoogleUnavailable")
+
+        self.use_google((200, {"access_token": "at"}), (200, {"email": "async@example.com"}))
+        response = await self.async_client.get(reverse("async_google_callback"), {"code": "c"})
+        self.assertTrue(response.url.startswith("https://app/done?token="))
+
+
+class BulkUserProvisionerTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(email="taken@example.com", password="x", name="Taken")
+
+    def run_jsonl(self, lines, **kwargs):
+        data = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode()
+        return BulkUserProvisioner(workers=1, **kwargs).run(read_user_records(data, "jsonl"))
+
+    def test_report(self):
+        report = self.run_jsonl([
+            {"email": "new@example.com", "name": "New", "password": "pw123456"},
+            {"email": "TAKEN@example.com", "name": "Again"},
+            {"email": "New@Example.com", "name": "Twice"},
+            {"email": "not-an-email", "name": "Bad"},
+            "{broken",
+            {"email": "driver@example.com", "name": "Driver", "role": "nope"},
+            {"email": "second@example.com", "name": "Second"},
+        ])
+
+        self.assertEqual(report["created"], 2)
+        # in-file duplicates are reported as read, DB duplicates when their batch is flushed
+        self.assertEqual(sorted(report["duplicates"], key=lambda d: d["line"]), [
+            {"line": 2, "email": "TAKEN@example.com"},
+            {"line": 3, "email": "New@example.com"},
+        ])
+        self.assertEqual([i["line"] for i in report["invalid"]], [4, 5, 6])
+        self.assertEqual(report["invalid"][0]["error"], "invalid email")
+        self.assertTrue(User.objects.get(email="new@example.com").check_password("pw123456"))
+        self.assertFalse(User.objects.get(email="second@example.com").has_usable_password())
+
+    def test_row_taken_by_a_concurrent_insert_is_a_duplicate(self):
+        bulk_create = User.objects.bulk_create
+
+        def racing_bulk_create(users, **kwargs):
+            # another request signs one of them up between the existence check and the insert
+            User.objects.create_user(email="RACE@example.com", password="x", name="Racer")
+            return bulk_create(users, **kwargs)
+
+        with mock.patch.object(User.objects, "bulk_create", side_effect=racing_bulk_create):
+            report = self.run_jsonl([
+                {"email": "race@example.com", "name": "Race"},
+                {"email": "calm@example.com", "name": "Calm"},
+            ])
+
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["duplicates"], [{"line": 1, "email": "race@example.com"}])
+        self.assertEqual(User.objects.get(email__lower="race@example.com").name, "Racer")
+
+
+class BulkUserCreateViewTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email="admin@example.com", password="x", name="Admin")
+        self.client.force_authenticate(self.admin)
+
+    def upload(self):
+        upload = SimpleUploadedFile("users.csv", b"email,name,password,role\nfresh@example.com,Fresh,,\nadmin@example.com,Dup,,\n")
+        return self.client.post(reverse("admin-users-bulk"), {"file": upload}, format="multipart")
+
+    def test_hashes_in_the_request_thread_by_default(self):
+        with mock.patch("accounts.provisioning.ProcessPoolExecutor") as pool:
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(response.json()["duplicates"], [{"line": 3, "email": "admin@example.com"}])
+        pool.assert_not_called()
+
+    @override_settings(BULK_USER_API_WORKERS=2)
+    def test_worker_count_comes_from_settings(self):
+        with mock.patch("accounts.provisioning.ProcessPoolExecutor") as pool:
+            pool.return_value.__enter__.return_value.map.side_effect = lambda fn, items, chunksize: map(fn, items)
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(pool.call_args.kwargs["max_workers"], 2)
+
+    def test_missing_file(self):
+        response = self.client.post(reverse("admin-users-bulk"), {}, format="multipart")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "file is required."})
+
+
+class CaseInsensitiveEmailTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="Taken@example.com", password="x", name="Taken")
+
+    def signup(self, email):
+        return self.client.post(reverse("signup"), {
+            "name": "Someone", "email": email, "password": "pw123456", "confirm_password": "pw123456",
+        })
+
+    def test_case_variant_signup_is_a_duplicate(self):
+        response = self.signup("tAKEN@EXAMPLE.com")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"email": ["This email is already registered."]})
+
+    def test_signup(self):
+        response = self.signup("fresh@example.com")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.filter(email="fresh@example.com").exists())
+
+    def test_other_integrity_errors_are_not_reported_as_duplicates(self):
+        serializer = SignupSerializer(data={
+            "name": "Someone", "email": "fresh@example.com", "password": "pw123456", "confirm_password": "pw123456",
+        })
+        serializer.is_valid(raise_exception=True)
+        error = IntegrityError("NOT NULL constraint failed: accounts_user.name")
+
+        with mock.patch.object(User.objects, "create_user", side_effect=error), self.assertRaises(IntegrityError):
+            serializer.save()
+
+    def test_constraint_name_from_the_driver(self):
+        def integrity_error(constraint_name, message="duplicate key value violates unique constraint"):
+            cause = Exception(message)
+            cause.diag = mock.Mock(constraint_name=constraint_name)  # as psycopg sets it
+            error = IntegrityError(message)
+            error.__cause__ = cause
+            return error
+
+        self.assertTrue(is_duplicate_email(integrity_error("accounts_user_email_ci_unique")))
+        self.assertTrue(is_duplicate_email(integrity_error("accounts_user_email_key")))
+        self.assertFalse(is_duplicate_email(integrity_error("accounts_user_pkey")))
+        self.assertTrue(is_duplicate_email(IntegrityError("UNIQUE constraint failed: index 'accounts_user_email_ci_unique'")))
+        self.assertTrue(is_duplicate_email(IntegrityError("UNIQUE constraint failed: accounts_user.email")))
+
+    def test_email_lower_lookup(self):
+        queryset = User.objects.filter(email__lower="taken@example.com")
+
+        self.assertIn('LOWER("accounts_user"."email")', str(queryset.query))
+        self.assertEqual(list(queryset), [self.user])
+        self.assertEqual(list(User.objects.for_email("TAKEN@Example.COM")), [self.user])
+
+    def test_get_by_natural_key(self):
+        self.assertEqual(User.objects.get_by_natural_key("TAKEN@EXAMPLE.COM"), self.user)
+        with self.assertRaises(User.DoesNotExist):
+            User.objects.get_by_natural_key("nobody@example.com")
+        self.assertEqual(authenticate(email="taken@EXAMPLE.com", password="x"), self.user)
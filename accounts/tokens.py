@@ -0,0 +1,19 @@
+# accounts/tokens.py
+from .authentication import CachedJWTAuthentication
+
+_jwt_auth = CachedJWTAuthentication()
+
+
+def validate_token_claims(raw_token):
+    """
+    Validate signature, expiry and token type of an access token, then check
+    that its user still exists and is active through the per-process user
+    cache (accounts.authentication). A cached user costs no query; a miss is
+    one primary-key SELECT. Saves and deletes in this process evict the entry
+    at once (accounts.signals); changes made by other processes are seen
+    once the entry expires (AUTH_USER_CACHE_TTL).
+    Raises InvalidToken / TokenError / AuthenticationFailed on failure and
+    returns (validated_token, user).
+    """
+    validated_token = _jwt_auth.get_validated_token(raw_token)
+    return validated_token, _jwt_auth.get_user(validated_token)
@@ -6,11 +6,20 @@ from .views import (
     VerifyOTPView, 
     ResetPasswordView, 
     AdminCreateView,
+    BulkUserCreateView,
     GoogleCallbackView,
     GoogleLoginView,
     GoogleExchangeView,
     CheckTokenView,
-    UserListView
+    UserListView,
+    AuthCacheStatsView
+)
+from django.views.decorators.csrf import csrf_exempt
+from .async_views import (
+    AsyncSendOTPView,
+    AsyncVerifyOTPView,
+    AsyncGoogleCallbackView,
+    AsyncGoogleExchangeView,
 )
 urlpatterns = [
     # Your custom authentication views
@@ -20,12 +29,20 @@ urlpatterns = [
     path('verify-otp/', VerifyOTPView.as_view(), name='verify-otp'),
     path('reset-password/', ResetPasswordView.as_view(), name='reset-password'),
     path('admin/create/', AdminCreateView.as_view(), name='admin-create'),
+    path('admin/users/bulk/', BulkUserCreateView.as_view(), name='admin-users-bulk'),
     path('check/token/', CheckTokenView.as_view(), name='check-token'),
     path('users/', UserListView.as_view(), name='user-list'),
+    path('auth/cache-stats/', AuthCacheStatsView.as_view(), name='auth-cache-stats'),
 
     # Social login URLs from django-allauth
     path('social/', include('allauth.socialaccount.urls')),         
     path("google/login/", GoogleLoginView.as_view(), name="google_login"),
     path("google/callback/", GoogleCallbackView.as_view(), name="google_callback"),
-    path("google/exchange/", GoogleExchangeView.as_view(), name="google_exchange")   
+    path("google/exchange/", GoogleExchangeView.as_view(), name="google_exchange"),
+
+    # ASGI-native variants (serve under an ASGI server)
+    path('async/send-otp/', csrf_exempt(AsyncSendOTPView.as_view()), name='async-send-otp'),
+    path('async/verify-otp/', csrf_exempt(AsyncVerifyOTPView.as_view()), name='async-verify-otp'),
+    path("async/google/callback/", AsyncGoogleCallbackView.as_view(), name="async_google_callback"),
+    path("async/google/exchange/", csrf_exempt(AsyncGoogleExchangeView.as_view()), name="async_google_exchange"),
 ]
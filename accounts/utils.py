@@ -1,12 +1,15 @@
-from django.core.mail import EmailMultiAlternatives
-from django.conf import settings
 from django.utils.html import strip_tags
 import random
 
+from .outbox import queue_email
+
 def generate_otp():
     return str(random.randint(100000, 999999))
 
-def send_otp_email(email, otp_code, name="User"):
+def render_otp_email(otp_code, name="User"):
+    """
+    Build (subject, plain_text, html_content) for an OTP email.
+    """
     subject = "🔐 Your OTP Code for Verification"
     
     html_content = f"""
@@ -32,9 +35,13 @@ def send_otp_email(email, otp_code, name="User"):
     </div>
     """
     plain_text = strip_tags(html_content)
-    from_email = settings.DEFAULT_FROM_EMAIL
-    recipient_list = [email]
+    return subject, plain_text, html_content
 
-    email_message = EmailMultiAlternatives(subject, plain_text, from_email, recipient_list)
-    email_message.attach_alternative(html_content, "text/html")
-    email_message.send()
+
+def queue_otp_email(email, otp_code, name="User"):
+    """
+    Queue the OTP email in the outbox; `send_outbox_emails` delivers it.
+    Call inside the same transaction that creates the OTP row.
+    """
+    subject, plain_text, html_content = render_otp_email(otp_code, name=name)
+    return queue_email(email, subject, plain_text, html_content)
@@ -1,21 +1,32 @@
+import json
+from itertools import islice
 from urllib.parse import urlencode, unquote
+
+from asgiref.sync import sync_to_async
 from .serializers import UserSerializer
-import requests
 from django.conf import settings
 from django.shortcuts import render, redirect
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import NotFound
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError, AuthenticationFailed
 
 from .serializers import SignupSerializer, LoginSerializer, ResetPasswordSerializer
 from .models import User, OTP
+from .authentication import user_cache
+from .tokens import validate_token_claims
+from .oauth import get_google_client, GoogleOAuthError
+from .provisioning import BulkUserProvisioner, read_user_records
+from common.pagination import KeysetPagination
 
 
 from .serializers import (
@@ -43,7 +54,6 @@ from .serializers import (
 #                 "role": user.role,
 #             }
 #         }, status=status.HTTP_201_CREATED)
-from django.db import transaction
 from rest_framework import generics, status
 from rest_framework.permissions import AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
@@ -57,15 +67,14 @@ class SignupView(generics.CreateAPIView):
     permission_classes = [AllowAny]
     parser_classes = (MultiPartParser, FormParser)
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
-        # Validate & create user
+        # Validate & create user (a single INSERT, so no transaction wrapper)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
 
-        # If you want to send OTP/email here, do it now (send_otp_email or similar).
-        # Example: send_otp_email(user.email, code)
+        # If you want to send OTP/email here, queue it now (queue_otp_email or similar).
+        # Example: queue_otp_email(user.email, code)
 
         # Return serialized user (read-only fields) — keeps API consistent
         user_data = UserSerializer(user).data
@@ -128,8 +137,9 @@ class SendOTPView(generics.CreateAPIView):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        result = serializer.save()  # result is a dict {"message": "..."}
-        print("serializer.save() returned:", result)
+        # OTP row and outbox row are committed together; the email itself is
+        # delivered by the send_outbox_emails worker, not on this request.
+        serializer.save()
 
         # Extract email from validated_data instead of assuming .email exists
         email = serializer.validated_data.get("email")
@@ -138,7 +148,7 @@ class SendOTPView(generics.CreateAPIView):
             print("Stored in session:", email)
 
         return Response(
-            {"message": result.get("message", "OTP sent successfully"), "email": email},
+            {"message": "OTP sent successfully", "email": email},
             status=200
         )
 
@@ -185,28 +195,18 @@ class ResetPasswordView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 1️⃣ Verify user exists
-        user = User.objects.filter(email=email).first()
-        print("user", user)
-
-        if not user:
-            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # 2️⃣ Verify OTP
-        # otp = OTP.objects.filter(user=user, code=str(otp_code)).order_by("-created_at").first()
-        otp = OTP.objects.filter(user=user, code=str(otp_code).strip()).order_by("-created_at").first()
-        print("otp", otp)
+        # 1️⃣ Verify OTP and delete it to prevent reuse, in one locked, joined query on email
+        otp = OTP.objects.consume(email, str(otp_code).strip())
         if not otp:
+            # Slow path only on failure: work out which error to report
+            if not User.objects.for_email(email).exists():
+                return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+            if OTP.objects.filter(user__email__lower=email.lower(), code=str(otp_code).strip()).exists():
+                return Response({"detail": "OTP has expired."}, status=status.HTTP_400_BAD_REQUEST)
             return Response({"detail": "Invalid OTP."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if otp.is_expired():
-            return Response({"detail": "OTP has expired."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # 3️⃣ OTP valid → delete OTP to prevent reuse
-        otp.delete()
-
-        # 4️⃣ Reset password
-        serializer = self.get_serializer(data=request.data, context={"user": user})
+        # 2️⃣ Reset password
+        serializer = self.get_serializer(data=request.data, context={"user": otp.user})
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
@@ -243,11 +243,40 @@ class AdminCreateView(generics.CreateAPIView):
 
 
 # check token valiude orn inavlid
+class BulkUserCreateView(APIView):
+    """
+    POST /api/admin/users/bulk/  (multipart: file=<csv|jsonl>, file_format=csv|jsonl)
+    Creates users in batches; duplicates and bad rows are reported, not fatal.
+    Hashing runs on BULK_USER_API_WORKERS processes (default 1, i.e. in this
+    request's thread) so an upload can't take every core from the web
+    workers; use the bulk_create_users command for large imports.
+    """
+    permission_classes = [IsAdminUser]
+    parser_classes = (MultiPartParser, FormParser)
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if not upload:
+            return Response({"detail": "file is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.data.get("file_format") or upload.name.rsplit(".", 1)[-1].lower()
+        if file_format not in ("csv", "jsonl"):
+            return Response({"detail": "file_format must be csv or jsonl."}, status=status.HTTP_400_BAD_REQUEST)
+
+        provisioner = BulkUserProvisioner(workers=getattr(settings, "BULK_USER_API_WORKERS", 1))
+        report = provisioner.run(read_user_records(upload.file, file_format))
+        return Response(report, status=status.HTTP_201_CREATED)
+
+
 class CheckTokenView(APIView):
     """
     Check if a JWT access token is valid or invalid.
+    Answers from the signed claims plus the cached user (is_active and
+    existence, see accounts.tokens), so a check for a cached user costs no
+    DB query.
     """
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = []
+    permission_classes = [AllowAny]
 
     def get(self, request, *args, **kwargs):
         # Extract token from the "Authorization" header
@@ -259,16 +288,14 @@ class CheckTokenView(APIView):
 
         token = auth_header.split(' ')[1]
 
-        jwt_auth = JWTAuthentication()
         try:
-            validated_token = jwt_auth.get_validated_token(token)
-            user = jwt_auth.get_user(validated_token)
+            validated_token, user = validate_token_claims(token)
             return Response({
                 "valid": True,
                 "message": "Token is valid.",
                 "user": user.email
             }, status=status.HTTP_200_OK)
-        except (InvalidToken, TokenError) as e:
+        except (InvalidToken, TokenError, AuthenticationFailed) as e:
             return Response({
                 "valid": False,
                 "message": "Invalid or expired token.",
@@ -309,24 +336,19 @@ class GoogleCallbackView(APIView):
         if not code:
             return redirect(f"{settings.FRONTEND_REDIRECT_URL}?error=NoCode")
 
-        # Exchange code for access token
-        token_url = "https://oauth2.googleapis.com/token"
-        data = {
-            "code": code,
-            "client_id": settings.GOOGLE_CLIENT_ID,
-            "client_secret": settings.GOOGLE_CLIENT_SECRET,
-            "redirect_uri": settings.GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code",
-        }
-        token_response = requests.post(token_url, data=data).json()
-        access_token = token_response.get("access_token")
+        google = get_google_client()
+        try:
+            # Exchange code for access token
+            _, token_response = google.exchange_code(code)
+            access_token = token_response.get("access_token")
 
-        if not access_token:
-            return redirect(f"{settings.FRONTEND_REDIRECT_URL}?error=InvalidToken")
+            if not access_token:
+                return redirect(f"{settings.FRONTEND_REDIRECT_URL}?error=InvalidToken")
 
-        # Fetch user info from Google
-        user_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
-        user_info = requests.get(user_info_url, params={"access_token": access_token}).json()
+            # User info from the locally verified id_token (userinfo as fallback)
+            user_info = google.identify(token_response)
+        except GoogleOAuthError:
+            return redirect(f"{settings.FRONTEND_REDIRECT_URL}?error=GoogleUnavailable")
 
         email = user_info.get("email")
         name = user_info.get("name", "")
@@ -336,8 +358,8 @@ class GoogleCallbackView(APIView):
 
         # Create or get user
         user, _ = User.objects.get_or_create(
-            email=email,
-            defaults={"username": email.split("@")[0], "first_name": name},
+            email__lower=email.lower(),
+            defaults={"email": email, "name": name},
         )
 
         # Generate JWT
@@ -359,36 +381,28 @@ class GoogleExchangeView(APIView):
         # ⚠️ 1️⃣ Common cause of invalid_grant: The 'redirect_uri' here must match EXACTLY
         #     the one used during the frontend Google OAuth authorization request.
         #     Even a trailing slash mismatch causes 'invalid_grant'.
-        token_url = "https://oauth2.googleapis.com/token"
-        data = {
-            "code": unquote(code),  # ✅ Decode URL-encoded code
-            "client_id": settings.GOOGLE_CLIENT_ID,
-            "client_secret": settings.GOOGLE_CLIENT_SECRET,
-            "redirect_uri": settings.GOOGLE_REDIRECT_URI,  # ⚠️ MUST match frontend redirect
-            "grant_type": "authorization_code",
-        }
-
-        # Exchange code for access token
-        r = requests.post(token_url, data=data)
-
-        # ⚠️ 2️⃣ If the code is already used or expired, Google returns invalid_grant
-        #     Each code can only be used once and expires quickly (within ~60s)
-        if r.status_code != 200:
-            return Response({
-                "error": r.json(),
-                "hint": "Check redirect_uri and ensure you're using a fresh code."
-            }, status=400)
-        
-        token_data = r.json()
-        access_token = token_data.get("access_token")
-        if not access_token:
-            return Response({"error": "Invalid access token"}, status=400)
-
-        # ✅ Fetch user info from Google
-        user_info = requests.get(
-            "https://www.googleapis.com/oauth2/v3/userinfo",
-            headers={"Authorization": f"Bearer {access_token}"}
-        ).json()
+        google = get_google_client()
+        try:
+            # Exchange code for access token (✅ decode URL-encoded code;
+            # ⚠️ settings.GOOGLE_REDIRECT_URI MUST match frontend redirect)
+            token_status, token_data = google.exchange_code(unquote(code))
+
+            # ⚠️ 2️⃣ If the code is already used or expired, Google returns invalid_grant
+            #     Each code can only be used once and expires quickly (within ~60s)
+            if token_status != 200:
+                return Response({
+                    "error": token_data,
+                    "hint": "Check redirect_uri and ensure you're using a fresh code."
+                }, status=400)
+
+            access_token = token_data.get("access_token")
+            if not access_token:
+                return Response({"error": "Invalid access token"}, status=400)
+
+            # ✅ User info from the locally verified id_token (userinfo as fallback)
+            user_info = google.identify(token_data)
+        except GoogleOAuthError as e:
+            return Response({"error": "Google is unavailable", "detail": str(e)}, status=502)
 
         email = user_info.get("email")
         name = user_info.get("name", "")
@@ -398,8 +412,8 @@ class GoogleExchangeView(APIView):
 
         # ✅ Create or get existing user
         user, _ = User.objects.get_or_create(
-            email=email,
-            defaults={"name": name}
+            email__lower=email.lower(),
+            defaults={"email": email, "name": name}
         )
 
         # ✅ Generate JWT
@@ -430,30 +444,21 @@ class GoogleSignupView(APIView):
         if not code:
             return Response({"error": "Code is required"}, status=400)
 
-        # Exchange code for access token
-        token_url = "https://oauth2.googleapis.com/token"
-        data = {
-            "code": unquote(code),
-            "client_id": settings.GOOGLE_CLIENT_ID,
-            "client_secret": settings.GOOGLE_CLIENT_SECRET,
-            "redirect_uri": settings.GOOGLE_REDIRECT_URI,
-            "grant_type": "authorization_code",
-        }
-
-        token_response = requests.post(token_url, data=data)
-        if token_response.status_code != 200:
-            return Response({"error": "Failed to get token", "details": token_response.json()}, status=400)
+        google = get_google_client()
+        try:
+            # Exchange code for access token
+            token_status, token_data = google.exchange_code(unquote(code))
+            if token_status != 200:
+                return Response({"error": "Failed to get token", "details": token_data}, status=400)
 
-        token_data = token_response.json()
-        access_token = token_data.get("access_token")
-        if not access_token:
-            return Response({"error": "Invalid access token"}, status=400)
+            access_token = token_data.get("access_token")
+            if not access_token:
+                return Response({"error": "Invalid access token"}, status=400)
 
-        # Fetch user info from Google
-        user_info_url = "https://www.googleapis.com/oauth2/v3/userinfo"
-        user_info = requests.get(
-            user_info_url, headers={"Authorization": f"Bearer {access_token}"}
-        ).json()
+            # User info from the locally verified id_token (userinfo as fallback)
+            user_info = google.identify(token_data)
+        except GoogleOAuthError as e:
+            return Response({"error": "Google is unavailable", "detail": str(e)}, status=502)
 
         email = user_info.get("email")
         name = user_info.get("name", "")
@@ -462,15 +467,11 @@ class GoogleSignupView(APIView):
             return Response({"error": "No email returned from Google"}, status=400)
 
         # Check if user already exists
-        if User.objects.filter(email=email).exists():
+        if User.objects.for_email(email).exists():
             return Response({"error": "User already exists. Please login."}, status=400)
 
         # Create new user (signup)
-        user = User.objects.create(
-            email=email,
-            username=email.split("@")[0],
-            first_name=name
-        )
+        user = User.objects.create_user(email=email, name=name)
 
         # Generate JWT tokens
         refresh = RefreshToken.for_user(user)
@@ -480,7 +481,7 @@ class GoogleSignupView(APIView):
             "user": {
                 "id": user.id,
                 "email": user.email,
-                "name": user.first_name,
+                "name": user.name,
             },
             "refresh": str(refresh),
             "access": access_token_jwt,
@@ -488,14 +489,65 @@ class GoogleSignupView(APIView):
         }, status=201)
 
 
+class UserPagination(KeysetPagination):
+    ordering = ("date_joined", "id")
+    page_size = 100
+
+
 class UserListView(APIView):
+    """
+    GET /api/users/                      -> one keyset page, follow "next" for more
+    GET /api/users/?cursor=...&page_size=N
+    GET /api/users/?export=ndjson        -> whole table streamed as NDJSON
+    """
     permission_classes = [IsAuthenticated]  # only logged-in users can access
     # or use [permissions.AllowAny] if you want it public
+    export_chunk_size = 2000
 
     def get(self, request):
+        if request.query_params.get("export") == "ndjson":
+            return self.export_ndjson(request)
         try:
-            users = User.objects.all()
+            paginator = UserPagination()
+            users = paginator.paginate_queryset(User.objects.all(), request, view=self)
             serializer = UserSerializer(users, many=True)
-            return Response({"status": "success", "data": serializer.data}, status=status.HTTP_200_OK)
+            return Response({
+                "status": "success",
+                "data": serializer.data,
+                "next": paginator.get_next_link(),
+            }, status=status.HTTP_200_OK)
+        except NotFound:
+            raise
         except Exception as e:
             return Response({"status": "error", "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def export_ndjson(self, request):
+        fields = UserSerializer.Meta.fields
+        rows = (
+            User.objects.order_by("date_joined", "id")
+            .values(*fields)
+            .iterator(chunk_size=self.export_chunk_size)
+        )
+        lines = (json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in rows)
+        if isinstance(request._request, ASGIRequest):
+            # Django buffers a sync iterator whole under ASGI; stream an async one instead
+            lines = self.aiter_chunks(lines)
+        response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        response["Content-Disposition"] = 'attachment; filename="users.ndjson"'
+        return response
+
+    async def aiter_chunks(self, lines):
+        """Yield `lines` export_chunk_size at a time, reading the cursor in the sync thread."""
+        next_chunk = sync_to_async(lambda: "".join(islice(lines, self.export_chunk_size)))
+        while chunk := await next_chunk():
+            yield chunk
+
+
+class AuthCacheStatsView(APIView):
+    """
+    Hit/miss counters of this process's authenticated-user cache.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(user_cache.stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,119 @@
+# common/pagination.py
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a unique, indexed column tuple (e.g. date_joined, id).
+
+    Each page is one indexed range scan `WHERE (a, b) > (last_a, last_b)
+    ORDER BY a, b LIMIT n`, so late pages cost the same as the first one.
+    Prefix the fields with "-" for a descending walk. The cursor is an
+    opaque base64 of the last row's key values.
+    """
+    ordering = ("id",)
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset)))
+
+        rows = list(queryset[: self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        self.next_key = self.key_of(rows[-1]) if rows and self.has_next else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def after(self, values, ordering=None):
+        """Q for rows strictly after `values` in `ordering`."""
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering or self.ordering, values):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def before(self, values):
+        """Q for rows strictly before `values` in `ordering`."""
+        return self.after(values, self.reversed_ordering())
+
+    def reversed_ordering(self):
+        return tuple(f[1:] if f.startswith("-") else f"-{f}" for f in self.ordering)
+
+    def key_of(self, row):
+        names = [field.lstrip("-") for field in self.ordering]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    def encode_cursor(self, values):
+        values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, cursor, queryset=None):
+        """
+        Key values from `cursor`. With `queryset`, each value is also run
+        through its field's to_python, so a tampered cursor (a non-date for
+        a DateTimeField, a non-int id) is a 404 rather than a database error.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (TypeError, ValueError):
+            raise NotFound("Invalid cursor.")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("Invalid cursor.")
+        if queryset is None:
+            return values
+        try:
+            return [
+                self.cursor_field(queryset, field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValidationError):
+            raise NotFound("Invalid cursor.")
+
+    def cursor_field(self, queryset, name):
+        """Model field or annotation output field behind an ordering column."""
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return queryset.query.annotations[name].output_field
+
+    def get_next_cursor(self):
+        return self.encode_cursor(self.next_key) if self.next_key is not None else None
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
@@ -1,3 +1,61 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .cache import LRUTTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class LRUTTLCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUTTLCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_get_set_delete(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("a", "dflt"), "dflt")
+        self.cache.set("a", 1)
+
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertTrue(self.cache.delete("a"))
+        self.assertFalse(self.cache.delete("a"))
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2, ttl=30)
+
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get("a"), 1)
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("b"), 2)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual((self.cache.get("a"), self.cache.get("c")), (1, 3))
+
+    def test_stats(self):
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        self.cache.get("missing")
+        self.cache.set("b", 2)
+        self.cache.set("c", 3)
+
+        self.assertEqual(self.cache.stats(), {
+            "size": 2, "maxsize": 2, "ttl": 10,
+            "hits": 1, "misses": 1, "evictions": 1, "hit_rate": 0.5,
+        })
+        self.cache.clear()
+        self.assertEqual(self.cache.stats()["size"], 0)
@@ -18,18 +18,20 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
-import chat.routing
-import notifications.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+# Initialise Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+import dashboard.chat.routing  # noqa: E402
+from dashboard.chat.middleware import JwtAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
+    # session user first; ?token=<access token> overrides it for API clients
     "websocket": AuthMiddlewareStack(
-        URLRouter(
-            chat.routing.websocket_urlpatterns +
-            notifications.routing.websocket_urlpatterns
-        )
+        JwtAuthMiddleware(URLRouter(dashboard.chat.routing.websocket_urlpatterns))
     ),
 })
@@ -103,7 +103,7 @@ TEMPLATES = [
 
 # settings.py (essential)
 
-ASGI_APPLICATION = "project.asgi.application"  # adjust to your project path
+ASGI_APPLICATION = "core.asgi.application"
 
 CHANNEL_LAYERS = {
     "default": {
@@ -115,11 +115,24 @@ CHANNEL_LAYERS = {
     },
 }
 
+# CHANNEL_LAYER=memory: single-process layer for development and load tests, no Redis needed
+if os.getenv('CHANNEL_LAYER', 'redis') == 'memory':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "dashboard.chat.layers.ShardedInMemoryChannelLayer",
+            "CONFIG": {
+                "capacity": int(os.getenv('CHANNEL_LAYER_CAPACITY', 1000)),
+                "expiry": int(os.getenv('CHANNEL_LAYER_EXPIRY', 60)),
+                "shards": int(os.getenv('CHANNEL_LAYER_SHARDS', 16)),
+            },
+        },
+    }
+
 WSGI_APPLICATION = 'core.wsgi.application'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -175,12 +188,58 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', 'no-reply@gamerbytes.us')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER)
 
+# Outbox worker (python manage.py send_outbox_emails)
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_BASE_SECONDS', 30))
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_MAX_SECONDS', 3600))
+
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=30),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=30),
 }
 
+# Google OAuth (accounts.oauth)
+GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID', '')
+GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET', '')
+GOOGLE_REDIRECT_URI = os.getenv('GOOGLE_REDIRECT_URI', '')
+FRONTEND_REDIRECT_URL = os.getenv('FRONTEND_REDIRECT_URL', '')
+GOOGLE_TOKEN_URL = os.getenv('GOOGLE_TOKEN_URL', 'https://oauth2.googleapis.com/token')
+GOOGLE_USERINFO_URL = os.getenv('GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v3/userinfo')
+GOOGLE_JWKS_URL = os.getenv('GOOGLE_JWKS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+GOOGLE_JWKS_TTL = int(os.getenv('GOOGLE_JWKS_TTL', 3600))
+GOOGLE_OAUTH_CONNECT_TIMEOUT = float(os.getenv('GOOGLE_OAUTH_CONNECT_TIMEOUT', 3.05))
+GOOGLE_OAUTH_READ_TIMEOUT = float(os.getenv('GOOGLE_OAUTH_READ_TIMEOUT', 10))
+GOOGLE_OAUTH_RETRIES = int(os.getenv('GOOGLE_OAUTH_RETRIES', 2))
+GOOGLE_OAUTH_POOL_SIZE = int(os.getenv('GOOGLE_OAUTH_POOL_SIZE', 20))
+
+# Password hashing processes for bulk uploads through the API (accounts.views.BulkUserCreateView);
+# the bulk_create_users command uses every core
+BULK_USER_API_WORKERS = int(os.getenv('BULK_USER_API_WORKERS', 1))
+
+# Per-process authenticated-user cache (accounts.authentication)
+AUTH_USER_CACHE_MAX_SIZE = int(os.getenv('AUTH_USER_CACHE_MAX_SIZE', 10000))
+AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 60))
+
+# Per-process room membership cache (dashboard.chat.membership)
+CHAT_MEMBERSHIP_CACHE_MAX_SIZE = int(os.getenv('CHAT_MEMBERSHIP_CACHE_MAX_SIZE', 10000))
+CHAT_MEMBERSHIP_CACHE_TTL = int(os.getenv('CHAT_MEMBERSHIP_CACHE_TTL', 300))
+
+# Websocket token -> claims cache (dashboard.chat.middleware); entries never outlive the token
+CHAT_TOKEN_CACHE_MAX_SIZE = int(os.getenv('CHAT_TOKEN_CACHE_MAX_SIZE', 10000))
+CHAT_TOKEN_CACHE_TTL = int(os.getenv('CHAT_TOKEN_CACHE_TTL', 3600))
+
+# Typing indicator coalescing (dashboard.chat.typing)
+CHAT_TYPING_INTERVAL = float(os.getenv('CHAT_TYPING_INTERVAL', 0.3))
+CHAT_TYPING_TIMEOUT = float(os.getenv('CHAT_TYPING_TIMEOUT', 6))
+
+# Per-connection websocket send queue (dashboard.chat.outbound); slower clients are disconnected
+CHAT_OUTBOUND_MAX_FRAMES = int(os.getenv('CHAT_OUTBOUND_MAX_FRAMES', 256))
+CHAT_OUTBOUND_MAX_LAG = float(os.getenv('CHAT_OUTBOUND_MAX_LAG', 10))
+
+# Rooms one multiplexed websocket (ws/) may subscribe to at once
+CHAT_MAX_SUBSCRIPTIONS = int(os.getenv('CHAT_MAX_SUBSCRIPTIONS', 100))
+
 
 
 cloudinary.config(
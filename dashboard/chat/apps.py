@@ -13,4 +13,7 @@ class ChatConfig(AppConfig):
     name = 'dashboard.chat'
     verbose_name = "Chat Application"
 
+    def ready(self):
+        from . import signals  # noqa: F401
+
 
@@ -1,74 +1,84 @@
 # chat/consumers.py
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+from urllib.parse import parse_qs
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth.models import AnonymousUser
 from .models import Room, Message, Notification
-from .serializers import MessageSerializer
+from .encoders import encode_message
+from .membership import aget_room, ais_participant
+from .outbound import BufferedSendMixin
+from .services import changes_since, delete_own_message, edit_own_message, post_message
+from .typing import typing_aggregator
+from .unread import mark_read, read_until, unread_count
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        try:
-            self.room_name = self.scope["url_route"]["kwargs"].get("room_name")
-            self.user = self.scope.get("user", AnonymousUser())
-            if not self.room_name:
-                await self.close(code=4001)
-                return
 
-            # fetch room or create (depending on policy)
-            try:
-                self.room = await database_sync_to_async(Room.objects.get)(name=self.room_name)
-            except Room.DoesNotExist:
-                # option: create if not exists
-                self.room = await database_sync_to_async(Room.objects.create)(name=self.room_name)
-                if not getattr(self.user, "is_anonymous", True):
-                    await database_sync_to_async(self.room.participants.add)(self.user)
-
-            # Security: ensure participant
-            if self.user.is_anonymous or not await database_sync_to_async(self.room.participants.filter(pk=self.user.pk).exists)():
-                # If you want to require being participant: close
-                # Alternatively, automatically add participant:
-                await database_sync_to_async(self.room.participants.add)(self.user)
+class RoomActionsMixin:
+    """
+    Room actions and chat group handlers shared by ChatConsumer (one room per
+    socket) and MultiplexConsumer (many rooms per socket). Handlers take the
+    room they act on; room-scoped frames go out through room_frame(), which
+    the multiplexed consumer uses to tag them with the room name.
+    """
+    room_actions = {
+        "send_message": "handle_send_message",
+        "edit_message": "handle_edit_message",
+        "delete_message": "handle_delete_message",
+        "typing": "handle_typing",
+    }
 
-            self.group_name = f"chat_{self.room.name}"
-            await self.channel_layer.group_add(self.group_name, self.channel_name)
-            await self.accept()
-            await self.send_json({"type":"connection_established","message":"connected"})
-        except Exception as e:
-            await self.close(code=1011)
+    def room_frame(self, room_name, frame):
+        return frame
 
-    async def disconnect(self, code):
-        try:
-            await self.channel_layer.group_discard(self.group_name, self.channel_name)
-        except Exception:
-            pass
+    async def join_room(self, room_name):
+        # fetch room or create (depending on policy)
+        # served from the membership cache once warm (see chat.membership)
+        room = await aget_room(room_name)
+        if room is None:
+            # option: create if not exists
+            room = await database_sync_to_async(Room.objects.create)(name=room_name)
+            if not getattr(self.user, "is_anonymous", True):
+                await database_sync_to_async(room.participants.add)(self.user)
 
-    async def receive(self, text_data=None, bytes_data=None):
-        try:
-            if text_data is None:
-                return
-            data = json.loads(text_data)
-            action = data.get("action")
+        # Security: ensure participant
+        if not await ais_participant(room, self.user):
+            # If you want to require being participant: close
+            # Alternatively, automatically add participant:
+            await database_sync_to_async(room.participants.add)(self.user)
 
-            if action == "send_message":
-                await self.handle_send_message(data)
-            elif action == "edit_message":
-                await self.handle_edit_message(data)
-            elif action == "delete_message":
-                await self.handle_delete_message(data)
-            elif action == "typing":
-                await self.handle_typing(data)
-            else:
-                await self.send_json({"error":"unknown_action"})
-        except json.JSONDecodeError:
-            await self.send_json({"error":"invalid_json"})
-        except Exception as e:
-            await self.send_json({"error":"server_error", "detail": str(e)})
+        await self.channel_layer.group_add(f"chat_{room.name}", self.channel_name)
+        return room
+
+    async def leave_room(self, room):
+        await self.channel_layer.group_discard(f"chat_{room.name}", self.channel_name)
+        typing_aggregator.update(room.name, self.user.pk, self.user.get_username(), False)
+
+    async def replay_changes(self, room, since):
+        """
+        Send {type: "sync", changes, last_seq, has_more} frames for every
+        change after `since`. Clients dedupe live events by message seq.
+        """
+        has_more = True
+        while has_more:
+            rows, has_more = await database_sync_to_async(changes_since)(room, since)
+            if rows:
+                since = rows[-1].seq
+            await self.send_json(self.room_frame(room.name, {
+                "type": "sync",
+                "changes": [encode_message(row) for row in rows],
+                "last_seq": since,
+                "has_more": has_more,
+            }))
 
-    async def handle_send_message(self, data):
+    async def handle_room_action(self, room, action, data):
+        await getattr(self, self.room_actions[action])(room, data)
+
+    async def handle_send_message(self, room, data):
         """
         data: { action: "send_message", content: "...", message_type: "text" }
         file uploads should be done via REST and server will broadcast file messages.
@@ -79,28 +89,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send_json({"error":"empty_message"})
             return
 
-        # create message
-        msg = await database_sync_to_async(Message.objects.create)(
-            room=self.room,
-            sender=self.user,
-            content=content,
-            message_type=message_type
-        )
-        serialized = MessageSerializer(msg, context={"request": None}).data
+        # create message + notifications in one transaction; room broadcast and
+        # personal notifications go out after commit (see chat.services)
+        await database_sync_to_async(post_message)(room, self.user, content=content, message_type=message_type)
 
-        # broadcast to room
-        await self.channel_layer.group_send(self.group_name, {"type":"chat.message","message":serialized})
-
-        # notify other participants
-        recipients = await database_sync_to_async(lambda: list(self.room.participants.exclude(pk=self.user.pk).all()))()
-        for r in recipients:
-            notif = await database_sync_to_async(Notification.objects.create)(recipient=r, actor=self.user, verb="sent_message", target_message=msg, target_room=self.room)
-            # send to personal notification group
-            await self.channel_layer.group_send(f"notifications_{r.pk}", {"type":"notify","notification": {"id": notif.pk,"actor": self.user.username,"verb":"sent_message","room": self.room.name,"timestamp": notif.timestamp.isoformat()}})
-
-    async def handle_edit_message(self, data):
+    async def handle_edit_message(self, room, data):
         """
         data: { action: "edit_message", message_id: 12, content: "new text" }
+        Ownership is checked by the UPDATE itself (see chat.services.edit_own_message).
         """
         mid = data.get("message_id")
         content = data.get("content", "")
@@ -109,23 +105,16 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         try:
-            msg = await database_sync_to_async(Message.objects.get)(pk=mid)
-            if msg.sender_id != self.user.pk:
-                await self.send_json({"error":"permission_denied"})
-                return
-
-            await database_sync_to_async(setattr)(msg, "content", content)
-            await database_sync_to_async(setattr)(msg, "edited", True)
-            await database_sync_to_async(msg.save)()
-
-            serialized = MessageSerializer(msg, context={"request": None}).data
-            await self.channel_layer.group_send(self.group_name, {"type":"chat.message_update","message": serialized})
+            # one conditional UPDATE with a new room sequence; broadcasts after commit
+            await database_sync_to_async(edit_own_message)(room, self.user, mid, content=content)
+        except PermissionDenied:
+            await self.send_json({"error":"permission_denied"})
         except Message.DoesNotExist:
             await self.send_json({"error":"message_not_found"})
         except Exception as e:
             await self.send_json({"error":"edit_failed","detail": str(e)})
 
-    async def handle_delete_message(self, data):
+    async def handle_delete_message(self, room, data):
         """
         data: { action: "delete_message", message_id: 12 }
         We'll soft-delete (deleted=True) and broadcast delete
@@ -135,64 +124,161 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send_json({"error":"message_id_required"})
             return
         try:
-            msg = await database_sync_to_async(Message.objects.get)(pk=mid)
-            if msg.sender_id != self.user.pk:
-                await self.send_json({"error":"permission_denied"})
-                return
-            await database_sync_to_async(setattr)(msg, "deleted", True)
-            await database_sync_to_async(msg.save)()
-            await self.channel_layer.group_send(self.group_name, {"type":"chat.message_delete","message_id": mid})
+            await database_sync_to_async(delete_own_message)(room, self.user, mid)
+        except PermissionDenied:
+            await self.send_json({"error":"permission_denied"})
         except Message.DoesNotExist:
             await self.send_json({"error":"message_not_found"})
         except Exception as e:
             await self.send_json({"error":"delete_failed","detail": str(e)})
 
-    async def handle_typing(self, data):
+    async def handle_typing(self, room, data):
         """
         data: { action: "typing", typing: true | false }
-        Broadcast typing event to other participants
+        Coalesced per room by chat.typing: the room gets at most one
+        "who is typing" frame per interval, not one per keystroke.
         """
-        is_typing = data.get("typing", False)
-        username = getattr(self.user, "username", "anonymous")
-        await self.channel_layer.group_send(self.group_name, {"type":"chat.typing","username": username, "typing": is_typing, "sender_id": self.user.pk})
+        typing_aggregator.update(room.name, self.user.pk, self.user.get_username(), bool(data.get("typing", False)))
 
     # Group handlers - these are called when group_send is used
     async def chat_message(self, event):
-        await self.send_json({"type":"chat","payload": event["message"]})
+        await self.send_json(self.room_frame(event.get("room"), {"type":"chat","payload": event.get("message")}))
 
     async def chat_message_update(self, event):
-        await self.send_json({"type":"chat_update","payload": event["message"]})
+        await self.send_json(self.room_frame(event.get("room"), {"type":"chat_update","payload": event["message"]}))
 
     async def chat_message_delete(self, event):
-        await self.send_json({"type":"chat_delete","message_id": event["message_id"]})
+        await self.send_json(self.room_frame(event.get("room"), {"type":"chat_delete","message_id": event["message_id"], "seq": event.get("seq")}))
+
+    async def chat_typing_state(self, event):
+        # everyone currently typing (as seen by one server process, `source`)
+        await self.send_json(
+            self.room_frame(event.get("room"), {"type":"typing","users": event["users"], "source": event["source"]}),
+            coalesce=f"typing:{event.get('room')}:{event['source']}",
+        )
 
-    async def chat_typing(self, event):
-        # send typing events to clients
-        await self.send_json({"type":"typing","username": event["username"], "typing": event["typing"], "sender_id": event.get("sender_id")})
 
-    # compatibility wrappers with Channels naming
-    async def chat_message(self, event):
-        # event from REST or internal code might use 'message' key
-        await self.send_json({"type":"chat","payload": event.get("message")})
+class NotificationActionsMixin:
+    """
+    Notification actions and group handlers shared by NotificationConsumer
+    and MultiplexConsumer.
+    """
+    notification_actions = ("mark_read", "mark_read_until", "mark_room_read")
+
+    @property
+    def notification_group(self):
+        return f"notifications_{self.user.pk}"
+
+    async def send_unread_meta(self):
+        # materialized counter (chat.unread), not a COUNT over the user's notifications
+        unread = await database_sync_to_async(unread_count)(self.user.pk)
+        await self.send_json({"type":"notification_meta","unread": unread}, coalesce="unread")
+
+    async def handle_notification_action(self, action, data):
+        if action == "mark_read":
+            nid = data.get("notification_id")
+            if nid:
+                unread = await database_sync_to_async(mark_read)(self.user, Notification.objects.filter(pk=nid))
+                await self.send_json({"type":"notification_marked","id": nid, "unread": unread})
+                await self.push_unread(unread)
+            else:
+                await self.send_json({"error":"notification_id_required"})
+        elif action == "mark_read_until":
+            # { action: "mark_read_until", notification_id: 40 } or { ..., timestamp: "2025-01-01T12:00:00Z" }
+            try:
+                notifications = read_until(data.get("notification_id"), data.get("timestamp"))
+            except ValueError as e:
+                await self.send_json({"error":"invalid_until", "detail": str(e)})
+                return
+            await self.mark_many(notifications)
+        elif action == "mark_room_read":
+            # { action: "mark_room_read", room: "room-name" }
+            room = await aget_room(data.get("room") or "")
+            if room is None:
+                await self.send_json({"error":"room_not_found"})
+                return
+            await self.mark_many(Notification.objects.filter(target_room=room))
+
+    async def mark_many(self, notifications):
+        # one set-based UPDATE, answered with the new count in one frame
+        unread = await database_sync_to_async(mark_read)(self.user, notifications)
+        await self.send_json({"type":"notification_meta","unread": unread}, coalesce="unread")
+        await self.push_unread(unread)
+
+    async def push_unread(self, unread):
+        # keep the user's other connections (other devices/tabs) in step
+        await self.channel_layer.group_send(self.notification_group, {"type": "notification.unread", "unread": unread, "origin": self.channel_name})
+
+    async def notify(self, event):
+        await self.send_json({"type":"notification","payload": event.get("notification")})
+
+    async def notification_unread(self, event):
+        if event.get("origin") != self.channel_name:
+            await self.send_json({"type":"notification_meta","unread": event["unread"]}, coalesce="unread")
+
+
+class ChatConsumer(RoomActionsMixin, BufferedSendMixin, AsyncJsonWebsocketConsumer):
+    async def connect(self):
+        try:
+            self.room_name = self.scope["url_route"]["kwargs"].get("room_name")
+            self.user = self.scope.get("user", AnonymousUser())
+            if not self.room_name:
+                await self.close(code=4001)
+                return
+
+            self.room = await self.join_room(self.room_name)
+            self.group_name = f"chat_{self.room.name}"
+            await self.accept()
+            await self.send_json({"type":"connection_established","message":"connected"})
+            # ws/chat/<room>/?since=N: replay what was missed before going live.
+            # Live events queue behind connect(), so they arrive after the replay.
+            since = self.get_since()
+            if since is not None:
+                await self.replay_changes(self.room, since)
+        except Exception as e:
+            await self.close(code=1011)
+
+    async def disconnect(self, code):
+        try:
+            await self.leave_room(self.room)
+        except Exception:
+            pass
 
-    # If functions above are duplicated, ensure consistent handler names:
-    async def chat_message(self, event):  # final handler
-        await self.send_json({"type":"chat","payload": event.get("message")})
+    def get_since(self):
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        try:
+            return int(query["since"][0])
+        except (KeyError, ValueError):
+            return None
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            if text_data is None:
+                return
+            data = json.loads(text_data)
+            action = data.get("action")
+
+            if action in self.room_actions:
+                await self.handle_room_action(self.room, action, data)
+            else:
+                await self.send_json({"error":"unknown_action"})
+        except json.JSONDecodeError:
+            await self.send_json({"error":"invalid_json"})
+        except Exception as e:
+            await self.send_json({"error":"server_error", "detail": str(e)})
 
 # notifications
 # chat/consumers.py (continued)
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(NotificationActionsMixin, BufferedSendMixin, AsyncJsonWebsocketConsumer):
     async def connect(self):
         self.user = self.scope.get("user", AnonymousUser())
         if self.user.is_anonymous:
             await self.close(code=4003)
             return
-        self.group_name = f"notifications_{self.user.pk}"
+        self.group_name = self.notification_group
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
-        # optionally send unread count
-        unread_count = await database_sync_to_async(lambda: self.user.notifications.filter(read=False).count())()
-        await self.send_json({"type":"notification_meta","unread": unread_count})
+        await self.send_unread_meta()
 
     async def disconnect(self, code):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
@@ -203,13 +289,106 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             return
         data = json.loads(text_data)
         action = data.get("action")
-        if action == "mark_read":
-            nid = data.get("notification_id")
-            if nid:
-                await database_sync_to_async(Notification.objects.filter(pk=nid, recipient=self.user).update)(read=True)
-                await self.send_json({"type":"notification_marked","id": nid})
+        if action in self.notification_actions:
+            await self.handle_notification_action(action, data)
+
+
+class MultiplexConsumer(RoomActionsMixin, NotificationActionsMixin, BufferedSendMixin, AsyncJsonWebsocketConsumer):
+    """
+    One socket per user (ws/) carrying notifications plus any number of
+    rooms, instead of ws/chat/<room>/ per open conversation and
+    ws/notifications/. Auth and the user lookup happen once per socket.
+
+        { action: "subscribe", room: "name", since: 42 }   -> {type: "subscribed", room}
+        { action: "unsubscribe", room: "name" }            -> {type: "unsubscribed", room}
+        { action: "send_message", room: "name", ... }      any ChatConsumer action, plus "room"
+        { action: "mark_read", ... }                       any NotificationConsumer action
+
+    Room frames are the ChatConsumer frames with a "room" key added.
+    Unlike ws/chat/<room>/, subscribe never creates rooms or adds the user
+    to one: like the REST message views it only admits participants
+    (room_not_found / not_participant otherwise).
+    """
+    max_rooms = getattr(settings, "CHAT_MAX_SUBSCRIPTIONS", 100)
+
+    async def connect(self):
+        self.user = self.scope.get("user", AnonymousUser())
+        if self.user.is_anonymous:
+            await self.close(code=4003)
+            return
+        self.rooms = {}
+        await self.channel_layer.group_add(self.notification_group, self.channel_name)
+        await self.accept()
+        await self.send_json({"type":"connection_established","message":"connected"})
+        await self.send_unread_meta()
+
+    async def disconnect(self, code):
+        if self.user.is_anonymous:
+            return
+        await self.channel_layer.group_discard(self.notification_group, self.channel_name)
+        for room in self.rooms.values():
+            await self.leave_room(room)
+
+    def room_frame(self, room_name, frame):
+        return dict(frame, room=room_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            if text_data is None:
+                return
+            data = json.loads(text_data)
+            action = data.get("action")
+
+            if action == "subscribe":
+                await self.subscribe(data)
+            elif action == "unsubscribe":
+                await self.unsubscribe(data)
+            elif action in self.room_actions:
+                room = self.rooms.get(data.get("room"))
+                if room is None:
+                    await self.send_json({"error":"not_subscribed", "room": data.get("room")})
+                    return
+                await self.handle_room_action(room, action, data)
+            elif action in self.notification_actions:
+                await self.handle_notification_action(action, data)
             else:
-                await self.send_json({"error":"notification_id_required"})
+                await self.send_json({"error":"unknown_action"})
+        except json.JSONDecodeError:
+            await self.send_json({"error":"invalid_json"})
+        except Exception as e:
+            await self.send_json({"error":"server_error", "detail": str(e)})
 
-    async def notify(self, event):
-        await self.send_json({"type":"notification","payload": event.get("notification")})
+    async def subscribe(self, data):
+        room_name = data.get("room")
+        if not room_name:
+            await self.send_json({"error":"room_required"})
+            return
+        since = data.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except (TypeError, ValueError):
+                await self.send_json({"error":"invalid_since", "room": room_name})
+                return
+        if room_name not in self.rooms:
+            if len(self.rooms) >= self.max_rooms:
+                await self.send_json({"error":"too_many_rooms", "room": room_name})
+                return
+            room = await aget_room(room_name)
+            if room is None:
+                await self.send_json({"error":"room_not_found", "room": room_name})
+                return
+            if not await ais_participant(room, self.user):
+                await self.send_json({"error":"not_participant", "room": room_name})
+                return
+            self.rooms[room_name] = await self.join_room(room_name)
+        await self.send_json({"type":"subscribed", "room": room_name})
+        # like ws/chat/<room>/?since=N; live events for the room queue until this returns
+        if since is not None:
+            await self.replay_changes(self.rooms[room_name], since)
+
+    async def unsubscribe(self, data):
+        room = self.rooms.pop(data.get("room"), None)
+        if room is not None:
+            await self.leave_room(room)
+        await self.send_json({"type":"unsubscribed", "room": data.get("room")})
@@ -0,0 +1,49 @@
+# chat/encoders.py
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Plain-dict encoders for the chat hot paths (broadcasts, delta sync). They
+# produce exactly what MessageSerializer produces, key order included,
+# without DRF's per-call field binding. Keep them in step with
+# serializers.py; dashboard.chat.tests checks the two agree.
+
+_drf_datetime = serializers.DateTimeField()
+_fast_datetimes = settings.USE_TZ and api_settings.DATETIME_FORMAT.lower() == ISO_8601
+
+
+def encode_datetime(value):
+    if value is None:
+        return None
+    if not _fast_datetimes:
+        return _drf_datetime.to_representation(value)
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def encode_user(user):
+    """UserSimpleSerializer"""
+    if user is None:
+        return None
+    return {"id": user.pk, "email": user.email, "name": user.name}
+
+
+def encode_message(msg, request=None):
+    """MessageSerializer; `msg.sender` should be loaded (select_related) or cached."""
+    return {
+        "id": msg.pk,
+        "room": msg.room_id,
+        "sender": encode_user(msg.sender),
+        "content": msg.content,
+        "file_url": msg.file_url(request=request),
+        "message_type": msg.message_type,
+        "edited": msg.edited,
+        "deleted": msg.deleted,
+        "seq": msg.seq,
+        "created_at": encode_datetime(msg.created_at),
+        "updated_at": encode_datetime(msg.updated_at),
+    }
+
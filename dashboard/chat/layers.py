@@ -0,0 +1,214 @@
+# chat/layers.py
+import asyncio
+import random
+import string
+import time
+import zlib
+from collections import deque
+from copy import deepcopy
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+
+class _Channel:
+    """
+    One channel's bounded FIFO of (expires_at, message). `waiters` counts
+    receive() calls parked on it, so expiry never drops a channel someone is
+    still awaiting; `ready` wakes them when a message arrives.
+    """
+
+    __slots__ = ("messages", "capacity", "waiters", "ready")
+
+    def __init__(self, capacity):
+        self.messages = deque()
+        self.capacity = capacity
+        self.waiters = 0
+        self.ready = asyncio.Event()
+
+    def put(self, item):
+        if len(self.messages) >= self.capacity:
+            return False
+        self.messages.append(item)
+        self.ready.set()
+        return True
+
+    async def get(self):
+        while not self.messages:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.messages.popleft()
+
+
+class ShardedInMemoryChannelLayer(BaseChannelLayer):
+    """
+    Single-process channel layer for development and load tests, selected
+    with CHANNEL_LAYER=memory (see settings).
+
+    Unlike channels' InMemoryChannelLayer it never scans every channel and
+    group on the hot path:
+      * groups and channels live in `shards` dicts picked by a hash of the
+        name, and expiry is swept one shard per call, at most every
+        `expiry / shards` seconds, so a sweep touches ~1/shards of the state;
+      * group_send copies the message once and appends it to each member's
+        bounded queue, with no task per member;
+      * a channel -> groups index makes dropping an expired channel from its
+        groups O(groups it joined).
+    Consumers get the same dict instance per group_send, so treat received
+    messages as read-only (ours do).
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, shards=16, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.group_expiry = group_expiry
+        self.shard_count = shards
+        self._channels = [{} for _ in range(shards)]   # channel -> _Channel
+        self._groups = [{} for _ in range(shards)]     # group -> {channel: joined_at}
+        self._memberships = {}                         # channel -> set of groups
+        self._next_sweep = 0
+        self._sweep_at = 0.0
+        self.sent = 0
+        self.dropped = 0
+        self.expired = 0
+
+    def _shard(self, name):
+        return zlib.crc32(name.encode()) % self.shard_count
+
+    def _queue(self, channel):
+        channels = self._channels[self._shard(channel)]
+        queue = channels.get(channel)
+        if queue is None:
+            queue = channels[channel] = _Channel(self.get_capacity(channel))
+        return queue
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        self._put(channel, deepcopy(message), time.time() + self.expiry)
+
+    def _put(self, channel, message, expires_at):
+        if not self._queue(channel).put((expires_at, message)):
+            self.dropped += 1
+            raise ChannelFull(channel)
+        self.sent += 1
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self._sweep()
+        channels = self._channels[self._shard(channel)]
+        while True:
+            queue = self._queue(channel)
+            queue.waiters += 1
+            try:
+                expires_at, message = await queue.get()
+            finally:
+                queue.waiters -= 1
+                if not queue.messages and not queue.waiters and channels.get(channel) is queue:
+                    del channels[channel]
+            if expires_at >= time.time():
+                return message
+            self.expired += 1
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.inmemory!%s" % (prefix, "".join(random.choice(string.ascii_letters) for _ in range(12)))
+
+    # Expiry
+
+    def _sweep(self):
+        """Expire messages and group memberships in the next shard, if one is due."""
+        now = time.time()
+        if now < self._sweep_at:
+            return
+        self._sweep_at = now + self.expiry / self.shard_count
+        shard = self._next_sweep
+        self._next_sweep = (shard + 1) % self.shard_count
+
+        channels = self._channels[shard]
+        for channel, queue in list(channels.items()):
+            stale = False
+            while queue.messages and queue.messages[0][0] < now:
+                queue.messages.popleft()
+                self.expired += 1
+                stale = True
+            if stale:
+                # a consumer that stopped reading: drop it from its groups
+                self._remove_from_groups(channel)
+            # never orphan a queue a receive() is still awaiting
+            if not queue.messages and not queue.waiters:
+                channels.pop(channel, None)
+
+        cutoff = now - self.group_expiry
+        for group, members in list(self._groups[shard].items()):
+            for channel in [c for c, joined_at in members.items() if joined_at < cutoff]:
+                self._discard(group, channel)
+
+    def _remove_from_groups(self, channel):
+        for group in list(self._memberships.get(channel, ())):
+            self._discard(group, channel)
+
+    # Flush extension
+
+    async def flush(self):
+        self._channels = [{} for _ in range(self.shard_count)]
+        self._groups = [{} for _ in range(self.shard_count)]
+        self._memberships = {}
+
+    async def close(self):
+        pass
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self._groups[self._shard(group)].setdefault(group, {})[channel] = time.time()
+        self._memberships.setdefault(channel, set()).add(group)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        self._discard(group, channel)
+
+    def _discard(self, group, channel):
+        groups = self._groups[self._shard(group)]
+        members = groups.get(group)
+        if members is not None:
+            members.pop(channel, None)
+            if not members:
+                del groups[group]
+        joined = self._memberships.get(channel)
+        if joined is not None:
+            joined.discard(group)
+            if not joined:
+                del self._memberships[channel]
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        self._sweep()
+        members = self._groups[self._shard(group)].get(group)
+        if not members:
+            return
+        message = deepcopy(message)
+        expires_at = time.time() + self.expiry
+        for channel in list(members):
+            try:
+                self._put(channel, message, expires_at)
+            except ChannelFull:
+                pass
+
+    def stats(self):
+        return {
+            "channels": sum(len(shard) for shard in self._channels),
+            "groups": sum(len(shard) for shard in self._groups),
+            "queued": sum(len(q.messages) for shard in self._channels for q in shard.values()),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "expired": self.expired,
+        }
@@ -0,0 +1,43 @@
+# chat/loadtest.py
+import json
+
+from asgiref.testing import ApplicationCommunicator
+
+
+class SocketClient:
+    """
+    In-process websocket client for driving consumers in benchmarks.
+    (channels.testing.WebsocketCommunicator needs daphne installed.)
+    """
+
+    def __init__(self, consumer, path, user, url_kwargs=None, query_string=b""):
+        self.scope = {
+            "type": "websocket",
+            "path": path,
+            "query_string": query_string,
+            "headers": [],
+            "subprotocols": [],
+            "user": user,
+            "url_route": {"args": (), "kwargs": url_kwargs or {}},
+        }
+        self.communicator = ApplicationCommunicator(consumer, self.scope)
+
+    async def connect(self, timeout=5):
+        await self.communicator.send_input({"type": "websocket.connect"})
+        response = await self.communicator.receive_output(timeout)
+        return response["type"] == "websocket.accept"
+
+    async def send_json(self, data):
+        await self.communicator.send_input({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self, timeout=5):
+        while True:
+            message = await self.communicator.receive_output(timeout)
+            if message["type"] == "websocket.send":
+                return json.loads(message["text"])
+            if message["type"] == "websocket.close":
+                raise ConnectionError(f"closed with code {message.get('code')}")
+
+    async def disconnect(self, code=1000):
+        await self.communicator.send_input({"type": "websocket.disconnect", "code": code})
+        await self.communicator.wait(timeout=5)
@@ -0,0 +1,44 @@
+# chat/management/commands/bench_chat_encoder.py
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dashboard.chat.encoders import encode_message
+from dashboard.chat.models import Message, Room
+from dashboard.chat.serializers import MessageSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Time chat.encoders.encode_message against MessageSerializer per payload. "
+        "Equivalence of the two is covered by dashboard.chat.tests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        # an unsaved row: nothing is read from or written to the database
+        now = timezone.now()
+        msg = Message(pk=1, room=Room(pk=3, name="general"), sender=User(pk=7, email="sender@example.com", name="Sender"),
+                      content="hello", seq=10, created_at=now, updated_at=now)
+        self.report("message", options["iterations"],
+                    lambda: MessageSerializer(msg, context={"request": None}).data,
+                    lambda: encode_message(msg))
+
+    def report(self, label, iterations, drf, fast):
+        drf_us = self.time(drf, iterations)
+        fast_us = self.time(fast, iterations)
+        self.stdout.write(
+            f"{label:12s} drf {drf_us:7.2f} us   encoder {fast_us:6.2f} us   ({drf_us / fast_us:4.1f}x)"
+        )
+
+    def time(self, fn, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return (time.perf_counter() - start) / iterations * 1e6
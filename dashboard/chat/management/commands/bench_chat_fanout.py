@@ -0,0 +1,68 @@
+# chat/management/commands/bench_chat_fanout.py
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from dashboard.chat.consumers import ChatConsumer
+from dashboard.chat.loadtest import SocketClient
+from dashboard.chat.models import Room
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Measure ChatConsumer send_message throughput (messages/s) for several room sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="2,10,50,200", help="Comma-separated participant counts.")
+        parser.add_argument("--messages", type=int, default=100)
+        parser.add_argument("--in-memory", action="store_true", help="Use an in-process channel layer instead of settings.")
+
+    def handle(self, *args, **options):
+        if options["in_memory"]:
+            channel_layers.set("default", InMemoryChannelLayer(capacity=100000))
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        for size in sizes:
+            rate = asyncio.run(self.run_room(size, options["messages"]))
+            self.stdout.write(f"room size {size:5d}: {rate:8.1f} messages/s")
+
+    def setup_room(self, size):
+        tag = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([
+            User(email=f"fanout-{tag}-{i}@example.com", name="Fanout", password="!")
+            for i in range(size)
+        ])
+        users = list(User.objects.filter(email__startswith=f"fanout-{tag}-").order_by("pk"))
+        room = Room.objects.create(name=f"fanout-{tag}")
+        room.participants.add(*users)
+        return room, users[0], tag
+
+    def teardown_room(self, room, tag):
+        room.delete()
+        User.objects.filter(email__startswith=f"fanout-{tag}-").delete()
+
+    async def run_room(self, size, messages):
+        room, sender, tag = await sync_to_async(self.setup_room)(size)
+        client = SocketClient(ChatConsumer.as_asgi(), f"/ws/chat/{room.name}/", sender, {"room_name": room.name})
+        try:
+            assert await client.connect()
+            await client.receive_json()  # connection_established
+
+            start = time.perf_counter()
+            for i in range(messages):
+                await client.send_json({"action": "send_message", "content": f"message {i}"})
+            # The sender is in the room group too: its last broadcast marks the end of the last fan-out
+            received = 0
+            while received < messages:
+                if (await client.receive_json(timeout=60)).get("type") == "chat":
+                    received += 1
+            elapsed = time.perf_counter() - start
+        finally:
+            await client.disconnect()
+            await sync_to_async(self.teardown_room)(room, tag)
+        return messages / elapsed
@@ -0,0 +1,99 @@
+# chat/management/commands/bench_chat_inbox.py
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from dashboard.chat.models import Message, Notification, Room
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Time walking the room list (inbox) for a user in N rooms against the old "
+        "list-then-fetch-each-room pattern. Creates its own rows and deletes them afterwards; "
+        "correctness and the per-page query count are covered by dashboard.chat.tests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=100)
+        parser.add_argument("--messages", type=int, default=20, help="Up to N messages per room.")
+        parser.add_argument("--page-size", type=int, default=30)
+
+    def handle(self, *args, **options):
+        user, others, tag = self.setup(options["rooms"], options["messages"])
+        try:
+            client = APIClient()
+            client.force_authenticate(user)
+
+            url = f"{reverse('room-list')}?page_size={options['page_size']}"
+            client.get(url)  # warm-up: backend feature probes (e.g. SQLite's JSON support) run once per connection
+            pages = 0
+            with CaptureQueriesContext(connection) as inbox_queries:
+                start = time.perf_counter()
+                while url:
+                    url = client.get(url).data["next"]
+                    pages += 1
+                inbox_ms = (time.perf_counter() - start) * 1000
+
+            with CaptureQueriesContext(connection) as naive_queries:
+                start = time.perf_counter()
+                self.naive(user)
+                naive_ms = (time.perf_counter() - start) * 1000
+        finally:
+            self.teardown(user, others, tag)
+
+        self.stdout.write(f"rooms:          {options['rooms']} ({pages} page(s) of {options['page_size']})")
+        self.stdout.write(f"inbox:          {len(inbox_queries)} queries  {inbox_ms:8.1f} ms")
+        self.stdout.write(f"room + latest:  {len(naive_queries)} queries  {naive_ms:8.1f} ms")
+
+    def setup(self, room_count, max_messages):
+        tag = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([
+            User(email=f"inbox-{tag}-{i}@example.com", name=f"Bench {i}", password="!") for i in range(4)
+        ])
+        user, *others = User.objects.filter(email__startswith=f"inbox-{tag}-").order_by("pk")
+        rooms = Room.objects.bulk_create([Room(name=f"inbox-{tag}-{r}") for r in range(room_count)])
+        rooms = list(Room.objects.filter(name__startswith=f"inbox-{tag}-"))
+        Room.participants.through.objects.bulk_create([
+            Room.participants.through(room_id=room.pk, user_id=member.pk)
+            for room in rooms for member in (user, random.choice(others))
+        ])
+
+        now = timezone.now()
+        for room in rooms:
+            count = random.randint(0, max_messages)
+            msgs = Message.objects.bulk_create([
+                Message(room=room, sender=random.choice([user, *others]), content=f"m{i}",
+                        deleted=random.random() < 0.1, seq=i + 1)
+                for i in range(count)
+            ])
+            if msgs:
+                # spread activity over the last day, with ties inside a room
+                at = now - timedelta(minutes=random.randint(0, 1440))
+                Message.objects.filter(pk__in=[m.pk for m in msgs]).update(created_at=at)
+                Notification.objects.bulk_create([
+                    Notification(recipient=user, actor=m.sender, verb="sent_message", target_message=m,
+                                 target_room=room, read=random.random() < 0.5)
+                    for m in msgs if m.sender_id != user.pk
+                ])
+        return user, others, tag
+
+    def naive(self, user):
+        """The old client pattern: the room list, then per room its latest message and unread count."""
+        for room in Room.objects.filter(participants=user).prefetch_related("participants"):
+            room.messages.order_by("-created_at", "-id").first()
+            Notification.objects.filter(recipient=user, read=False, target_room=room).count()
+
+    def teardown(self, user, others, tag):
+        Room.objects.filter(name__startswith=f"inbox-{tag}-").delete()
+        User.objects.filter(pk__in=[user.pk, *(u.pk for u in others)]).delete()
@@ -0,0 +1,137 @@
+# chat/management/commands/bench_chat_rooms.py
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers, get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from dashboard.chat.consumers import ChatConsumer
+from dashboard.chat.layers import ShardedInMemoryChannelLayer
+from dashboard.chat.loadtest import SocketClient
+from dashboard.chat.models import Room
+
+User = get_user_model()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive N simulated ChatConsumer clients spread over M rooms; every client sends messages "
+        "at a fixed rate. Reports delivery latency percentiles and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=100)
+        parser.add_argument("--rooms", type=int, default=10)
+        parser.add_argument("--messages", type=int, default=5, help="Messages sent by each client.")
+        parser.add_argument("--rate", type=float, default=2.0, help="Messages per second per client.")
+        parser.add_argument(
+            "--layer", choices=["settings", "memory", "sharded"], default="sharded",
+            help="settings: CHANNEL_LAYERS as configured; memory: channels' InMemoryChannelLayer; "
+                 "sharded: chat.layers.ShardedInMemoryChannelLayer.",
+        )
+        parser.add_argument("--timeout", type=float, default=120.0, help="Give up waiting for deliveries after this.")
+
+    def handle(self, *args, **options):
+        if options["layer"] == "memory":
+            channel_layers.set("default", InMemoryChannelLayer(capacity=100000))
+        elif options["layer"] == "sharded":
+            channel_layers.set("default", ShardedInMemoryChannelLayer(capacity=100000))
+
+        rooms, users, tag = self.setup(options["clients"], options["rooms"])
+        try:
+            result = asyncio.run(self.run(rooms, users, options))
+        finally:
+            self.teardown(rooms, tag)
+
+        latencies = sorted(result["latencies"])
+        elapsed = result["elapsed"]
+        self.stdout.write(f"layer:              {type(get_channel_layer()).__name__}")
+        self.stdout.write(f"clients / rooms:    {options['clients']} / {options['rooms']}")
+        self.stdout.write(f"messages sent:      {result['sent']} ({result['sent'] / elapsed:.1f}/s)")
+        self.stdout.write(
+            f"frames delivered:   {len(latencies)} of {result['expected']} ({len(latencies) / elapsed:.1f}/s)"
+        )
+        self.stdout.write(
+            "latency ms:         p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+                *(percentile(latencies, pct) * 1000 for pct in (50, 95, 99, 100))
+            )
+        )
+
+    def setup(self, clients, room_count):
+        tag = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([
+            User(email=f"rooms-{tag}-{i}@example.com", name="Bench", password="!")
+            for i in range(clients)
+        ])
+        users = list(User.objects.filter(email__startswith=f"rooms-{tag}-").order_by("pk"))
+        rooms = [Room.objects.create(name=f"rooms-{tag}-{r}") for r in range(room_count)]
+        for i, user in enumerate(users):
+            rooms[i % room_count].participants.add(user)
+        return rooms, users, tag
+
+    def teardown(self, rooms, tag):
+        Room.objects.filter(pk__in=[room.pk for room in rooms]).delete()
+        User.objects.filter(email__startswith=f"rooms-{tag}-").delete()
+
+    async def run(self, rooms, users, options):
+        room_count = len(rooms)
+        clients = []
+        for i, user in enumerate(users):
+            room = rooms[i % room_count]
+            client = SocketClient(ChatConsumer.as_asgi(), f"/ws/chat/{room.name}/", user, {"room_name": room.name})
+            assert await client.connect()
+            await client.receive_json()  # connection_established
+            clients.append(client)
+
+        # Every message reaches every connected member of its room, sender included
+        members = [sum(1 for i in range(len(users)) if i % room_count == r) for r in range(room_count)]
+        expected = sum(members[i % room_count] for i in range(len(users))) * options["messages"]
+        latencies = []
+        done = asyncio.Event()
+
+        async def read(client):
+            # no timeout: a communicator timeout kills the consumer; the task is cancelled instead
+            while True:
+                frame = await client.receive_json(timeout=None)
+                if frame.get("type") == "chat":
+                    latencies.append(time.perf_counter() - float(frame["payload"]["content"]))
+                    if len(latencies) >= expected:
+                        done.set()
+
+        async def send(client, offset):
+            await asyncio.sleep(offset)
+            for _ in range(options["messages"]):
+                # the send time rides in the content so any receiver can compute latency
+                await client.send_json({"action": "send_message", "content": repr(time.perf_counter())})
+                await asyncio.sleep(1 / options["rate"])
+
+        readers = [asyncio.create_task(read(client)) for client in clients]
+        start = time.perf_counter()
+        spread = 1 / (options["rate"] * len(clients))
+        await asyncio.gather(*(send(client, n * spread) for n, client in enumerate(clients)))
+        try:
+            await asyncio.wait_for(done.wait(), options["timeout"])
+        except asyncio.TimeoutError:
+            self.stderr.write(f"timed out with {len(latencies)} of {expected} frames delivered")
+        elapsed = time.perf_counter() - start
+
+        for task in readers:
+            task.cancel()
+        for client in clients:
+            await client.disconnect()
+        return {
+            "latencies": latencies,
+            "expected": expected,
+            "sent": len(clients) * options["messages"],
+            "elapsed": elapsed,
+        }
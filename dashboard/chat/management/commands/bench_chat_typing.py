@@ -0,0 +1,109 @@
+# chat/management/commands/bench_chat_typing.py
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from channels.layers import InMemoryChannelLayer, channel_layers, get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from dashboard.chat.consumers import ChatConsumer
+from dashboard.chat.loadtest import SocketClient
+from dashboard.chat.models import Room
+from dashboard.chat.typing import typing_aggregator
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Simulate a typing storm in one room and report channel-layer messages per second."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=20, help="Connected participants, all typing.")
+        parser.add_argument("--rate", type=float, default=8.0, help="Typing events per client per second.")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run.")
+        parser.add_argument("--in-memory", action="store_true", help="Use an in-process channel layer instead of settings.")
+
+    def handle(self, *args, **options):
+        if options["in_memory"]:
+            channel_layers.set("default", InMemoryChannelLayer(capacity=100000))
+        room, users, tag = self.setup_room(options["clients"])
+        try:
+            stats = asyncio.run(self.storm(room, users, options["rate"], options["duration"]))
+        finally:
+            self.teardown_room(room, tag)
+
+        duration = options["duration"]
+        clients = options["clients"]
+        self.stdout.write(f"typing events from clients: {stats['events'] / duration:10.1f} /s")
+        self.stdout.write(f"channel-layer group_sends:  {stats['group_sends'] / duration:10.1f} /s")
+        self.stdout.write(f"typing frames to clients:   {stats['frames'] / duration:10.1f} /s")
+        # Before coalescing every event was its own group_send, delivered to every member
+        self.stdout.write(
+            f"uncoalesced equivalent:     {stats['events'] / duration:10.1f} group_sends/s, "
+            f"{stats['events'] * clients / duration:10.1f} frames/s"
+        )
+
+    def setup_room(self, size):
+        tag = uuid.uuid4().hex[:8]
+        User.objects.bulk_create([
+            User(email=f"typing-{tag}-{i}@example.com", name="Typing", password="!")
+            for i in range(size)
+        ])
+        users = list(User.objects.filter(email__startswith=f"typing-{tag}-").order_by("pk"))
+        room = Room.objects.create(name=f"typing-{tag}")
+        room.participants.add(*users)
+        return room, users, tag
+
+    def teardown_room(self, room, tag):
+        room.delete()
+        User.objects.filter(email__startswith=f"typing-{tag}-").delete()
+
+    async def storm(self, room, users, rate, duration):
+        stats = {"events": 0, "group_sends": 0, "frames": 0}
+        channel_layer = get_channel_layer()
+        group_send = channel_layer.group_send
+
+        async def counting_group_send(group, message):
+            stats["group_sends"] += 1
+            await group_send(group, message)
+
+        channel_layer.group_send = counting_group_send
+
+        clients = [
+            SocketClient(ChatConsumer.as_asgi(), f"/ws/chat/{room.name}/", user, {"room_name": room.name})
+            for user in users
+        ]
+        for client in clients:
+            assert await client.connect()
+            await client.receive_json()  # connection_established
+
+        async def read(client):
+            # no timeout: a communicator timeout kills the consumer; the task is cancelled instead
+            while True:
+                frame = await client.receive_json(timeout=None)
+                if frame.get("type") == "typing":
+                    stats["frames"] += 1
+
+        async def type_(client, offset):
+            await asyncio.sleep(offset)
+            deadline = time.perf_counter() + duration
+            i = 0
+            while time.perf_counter() < deadline:
+                # a burst of keystrokes with a pause (stop) every 20 events
+                i += 1
+                await client.send_json({"action": "typing", "typing": i % 20 != 0})
+                stats["events"] += 1
+                await asyncio.sleep(1 / rate)
+
+        readers = [asyncio.create_task(read(client)) for client in clients]
+        await asyncio.gather(*(type_(client, n / (rate * len(clients))) for n, client in enumerate(clients)))
+        # let the last coalesced frames and stops land before tearing down
+        await asyncio.sleep(typing_aggregator.interval * 2)
+        for task in readers:
+            task.cancel()
+        for client in clients:
+            await client.disconnect()
+        channel_layer.group_send = group_send
+        return stats
@@ -0,0 +1,33 @@
+# chat/management/commands/reconcile_unread_counters.py
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from dashboard.chat.unread import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount unread notifications and repair drifted per-user unread counters, in chunks of users."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        chunk_size = options["chunk_size"]
+        last_id = 0
+        checked = fixed = 0
+
+        while True:
+            ids = list(User.objects.filter(pk__gt=last_id).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                break
+            fixed += reconcile(ids)
+            checked += len(ids)
+            last_id = ids[-1]
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(f"Checked {checked} user(s), repaired {fixed} counter(s).")
@@ -0,0 +1,89 @@
+# chat/membership.py
+import copy
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from common.cache import LRUTTLCache
+
+from .models import Room
+
+# Per-process membership index: room name -> Room, room pk -> frozenset of
+# participant ids. Entries are evicted by the receivers in chat.signals
+# (Room save/delete and participants m2m_changed); the TTL bounds staleness
+# for writes made by other processes.
+room_cache = LRUTTLCache(
+    maxsize=getattr(settings, "CHAT_MEMBERSHIP_CACHE_MAX_SIZE", 10000),
+    ttl=getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 300),
+)
+member_cache = LRUTTLCache(
+    maxsize=getattr(settings, "CHAT_MEMBERSHIP_CACHE_MAX_SIZE", 10000),
+    ttl=getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 300),
+)
+
+
+def get_room(name):
+    """Room by name, or None if it does not exist. Misses are not cached."""
+    room = room_cache.get(name)
+    if room is None:
+        room = _load_room(name)
+    return room and copy.copy(room)
+
+
+async def aget_room(name):
+    # A warm lookup stays on the event loop instead of queueing behind the
+    # single database_sync_to_async thread.
+    room = room_cache.get(name)
+    if room is None:
+        room = await database_sync_to_async(_load_room)(name)
+    return room and copy.copy(room)
+
+
+def _load_room(name):
+    room = Room.objects.filter(name=name).first()
+    if room is not None:
+        room_cache.set(name, room)
+    return room
+
+
+def member_ids(room_id):
+    ids = member_cache.get(room_id)
+    if ids is None:
+        ids = _load_member_ids(room_id)
+    return ids
+
+
+async def amember_ids(room_id):
+    ids = member_cache.get(room_id)
+    if ids is None:
+        ids = await database_sync_to_async(_load_member_ids)(room_id)
+    return ids
+
+
+def _load_member_ids(room_id):
+    ids = frozenset(
+        Room.participants.through.objects.filter(room_id=room_id).values_list("user_id", flat=True)
+    )
+    member_cache.set(room_id, ids)
+    return ids
+
+
+def is_participant(room, user):
+    if user is None or user.is_anonymous:
+        return False
+    return user.pk in member_ids(room.pk)
+
+
+async def ais_participant(room, user):
+    if user is None or user.is_anonymous:
+        return False
+    return user.pk in await amember_ids(room.pk)
+
+
+def evict_members(room_id):
+    member_cache.delete(room_id)
+
+
+def evict_room(room):
+    room_cache.delete(room.name)
+    member_cache.delete(room.pk)
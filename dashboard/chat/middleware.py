@@ -1,46 +1,88 @@
 # chat/middleware.py
+import copy
+import hashlib
+import time
 import urllib.parse
+
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import AccessToken
 from django.contrib.auth.models import AnonymousUser
-from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import user_cache
+from common.cache import LRUTTLCache
 
 User = get_user_model()
 
-@database_sync_to_async
-def get_user_from_token(token):
-    try:
+# sha256(raw token) -> the claims we need, kept until the token expires. A hit
+# means this exact string already passed signature and expiry checks, so
+# reconnects skip both the decode and the User SELECT. Users themselves come
+# from accounts.authentication.user_cache, which the User signals evict.
+token_cache = LRUTTLCache(
+    maxsize=getattr(settings, "CHAT_TOKEN_CACHE_MAX_SIZE", 10000),
+    ttl=getattr(settings, "CHAT_TOKEN_CACHE_TTL", 3600),
+)
+
+
+def token_claims(token):
+    key = hashlib.sha256(token.encode()).hexdigest()
+    claims = token_cache.get(key)
+    if claims is None:
         validated = AccessToken(token)
-        user_id = validated.get("user_id") or validated.get("user")
-        return User.objects.get(pk=user_id)
-    except Exception:
+        claims = {
+            api_settings.USER_ID_CLAIM: validated.get(api_settings.USER_ID_CLAIM) or validated.get("user"),
+            api_settings.JTI_CLAIM: validated.get(api_settings.JTI_CLAIM),
+            "exp": validated["exp"],
+        }
+        token_cache.set(key, claims, ttl=min(token_cache.ttl, claims["exp"] - time.time()))
+    return claims
+
+
+def _load_user(user_id):
+    user = User.objects.get(pk=user_id)
+    user_cache.set(str(user_id), user)
+    return user
+
+
+async def get_user_from_token(token):
+    try:
+        claims = token_claims(token)
+    except TokenError:
+        return AnonymousUser()
+    if claims["exp"] <= time.time():
+        return AnonymousUser()
+
+    user_id = claims[api_settings.USER_ID_CLAIM]
+    user = user_cache.get(str(user_id))
+    if user is None:
+        try:
+            user = await database_sync_to_async(_load_user)(user_id)
+        except User.DoesNotExist:
+            return AnonymousUser()
+    if not user.is_active:
         return AnonymousUser()
+    # per-connection copy, so nothing a consumer sets leaks into the cache
+    return copy.copy(user)
+
 
 class JwtAuthMiddleware:
     """
-    Custom middleware for JWT auth over WebSocket.
+    Custom middleware for JWT auth over WebSocket (ASGI 3 single callable).
     Expects token in query string: ?token=<access_token>
+    Without a token the user already in scope (e.g. from AuthMiddlewareStack) is kept.
     """
     def __init__(self, inner):
         self.inner = inner
 
-    def __call__(self, scope):
-        return JwtAuthMiddlewareInstance(scope, self.inner)
-
-class JwtAuthMiddlewareInstance:
-    def __init__(self, scope, inner):
-        self.scope = dict(scope)
-        self.inner = inner
-
-    async def __call__(self, receive, send):
-        query_string = self.scope.get("query_string", b"").decode()
+    async def __call__(self, scope, receive, send):
+        query_string = scope.get("query_string", b"").decode()
         params = urllib.parse.parse_qs(query_string)
         token = params.get("token", [None])[0]
         if token:
             user = await get_user_from_token(token)
-            self.scope["user"] = user
         else:
-            self.scope["user"] = AnonymousUser()
-        inner = self.inner(self.scope)
-        return await inner(receive, send)
+            user = scope.get("user", AnonymousUser())
+        return await self.inner(dict(scope, user=user), receive, send)
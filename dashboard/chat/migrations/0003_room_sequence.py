@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    # Number existing messages 1..n per room in (created_at, id) order
+    Room = apps.get_model('chat', 'Room')
+    Message = apps.get_model('chat', 'Message')
+    for room in Room.objects.iterator():
+        batch = []
+        seq = 0
+        for message in Message.objects.filter(room=room).order_by('created_at', 'id').only('id').iterator():
+            seq += 1
+            message.seq = seq
+            batch.append(message)
+            if len(batch) >= 1000:
+                Message.objects.bulk_update(batch, ['seq'])
+                batch = []
+        Message.objects.bulk_update(batch, ['seq'])
+        Room.objects.filter(pk=room.pk).update(last_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_room_created_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='last_seq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'seq'], name='chat_messag_room_id_5eb582_idx'),
+        ),
+    ]
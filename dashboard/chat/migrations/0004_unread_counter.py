@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Notification = apps.get_model('chat', 'Notification')
+    UnreadCounter = apps.get_model('chat', 'UnreadCounter')
+    counts = (
+        Notification.objects.filter(read=False)
+        .order_by()
+        .values_list('recipient_id')
+        .annotate(n=models.Count('pk'))
+    )
+    UnreadCounter.objects.bulk_create(
+        (UnreadCounter(user_id=user_id, unread=n) for user_id, n in counts.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_user_email_ci_unique'),
+        ('chat', '0003_room_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'read'], name='chat_notifi_recipie_086ae1_idx'),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
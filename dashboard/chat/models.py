@@ -10,6 +10,8 @@ class Room(TimeStampedModel):
     """Chat room (one per conversation, or group)."""
     name = models.CharField(max_length=255, unique=True)
     participants = models.ManyToManyField(User, related_name="rooms", blank=True)
+    # last change sequence handed out to this room's messages (see chat.services.next_seq)
+    last_seq = models.BigIntegerField(default=0, editable=False)
  
 
     def __str__(self):
@@ -28,10 +30,16 @@ class Message(TimeStampedModel):
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default=TEXT)
     edited = models.BooleanField(default=False)
     deleted = models.BooleanField(default=False)
+    # room sequence of the latest insert/edit/delete of this message
+    seq = models.BigIntegerField(default=0, editable=False)
     # optional: add read receipts per user later
 
     class Meta:
         ordering = ("created_at",)
+        indexes = [
+            models.Index(fields=["room", "created_at", "id"]),
+            models.Index(fields=["room", "seq"]),
+        ]
 
     def file_url(self, request=None):
         if not self.file:
@@ -51,3 +59,14 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ("-timestamp",)
+        indexes = [
+            models.Index(fields=["recipient", "read"]),
+            # per-room unread counts for the room list (chat.services.inbox_rooms)
+            models.Index(fields=["recipient", "target_room", "read"]),
+        ]
+
+
+class UnreadCounter(models.Model):
+    """Materialized count of a user's unread notifications, kept in step by chat.unread."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="unread_counter")
+    unread = models.IntegerField(default=0)
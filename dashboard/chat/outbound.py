@@ -0,0 +1,166 @@
+# chat/outbound.py
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_queues = weakref.WeakSet()
+_totals = {"coalesced": 0, "dropped": 0, "slow_disconnects": 0}
+
+
+class OutboundQueue:
+    """
+    Bounded FIFO of frames waiting to go out on one websocket.
+
+    A frame put with a `key` is coalescible: putting another frame with the
+    same key while the first is still queued replaces it in place (latest
+    state wins, e.g. typing lists and unread counts). When the queue is full
+    the oldest coalescible frame is dropped to make room; if there is none,
+    put() returns False and the connection should be treated as too slow.
+    """
+
+    def __init__(self, maxsize=256, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._frames = deque()   # [key, payload, enqueued_at]
+        self._keyed = {}
+        _queues.add(self)
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, payload, key=None):
+        if key is not None:
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[1] = payload
+                _totals["coalesced"] += 1
+                return True
+        if len(self._frames) >= self.maxsize and not self._drop_coalescible():
+            return False
+        entry = [key, payload, self._clock()]
+        self._frames.append(entry)
+        if key is not None:
+            self._keyed[key] = entry
+        return True
+
+    def get(self):
+        key, payload, _ = self._frames.popleft()
+        if key is not None:
+            self._keyed.pop(key, None)
+        return payload
+
+    def lag(self):
+        """Seconds the oldest queued frame has been waiting."""
+        return self._clock() - self._frames[0][2] if self._frames else 0.0
+
+    def clear(self):
+        self._frames.clear()
+        self._keyed.clear()
+
+    def _drop_coalescible(self):
+        for entry in self._frames:
+            if entry[0] is not None:
+                self._frames.remove(entry)
+                del self._keyed[entry[0]]
+                _totals["dropped"] += 1
+                return True
+        return False
+
+
+def outbound_stats():
+    """Queue depth across this process's live websocket connections."""
+    depths = [len(queue) for queue in list(_queues)]
+    return {
+        "connections": len(depths),
+        "queued": sum(depths),
+        "max_depth": max(depths, default=0),
+        **_totals,
+    }
+
+
+class BufferedSendMixin:
+    """
+    Mix in before AsyncJsonWebsocketConsumer. send_json() only enqueues onto
+    the connection's OutboundQueue and a writer task does the actual sends,
+    so a client on a slow link stalls its own queue instead of the
+    consumer's channel-layer reads (which would make the layer drop
+    messages for it). Pass `coalesce=<key>` for state frames that may be
+    merged or dropped. A client whose queue is full of non-coalescible
+    frames, or whose oldest frame waited longer than
+    CHAT_OUTBOUND_MAX_LAG seconds, is disconnected with code 4008.
+    close() waits for the frames already queued, so it never overtakes them.
+    """
+
+    outbound_max_frames = getattr(settings, "CHAT_OUTBOUND_MAX_FRAMES", 256)
+    outbound_max_lag = getattr(settings, "CHAT_OUTBOUND_MAX_LAG", 10.0)
+    slow_client_close_code = 4008
+    writer_error_close_code = 1011
+
+    _outbox = None
+    _writer = None
+    _outbound_closed = False
+    _close_after_flush = None   # (code, reason) once a close is queued
+
+    async def send_json(self, content, close=False, coalesce=None):
+        if self._outbound_closed:
+            return
+        if self._outbox is None:
+            self._outbox = OutboundQueue(self.outbound_max_frames)
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.get_running_loop().create_task(self._write_outbox())
+            self._writer.add_done_callback(self._writer_done)
+
+        if not self._outbox.put(content, coalesce) or self._outbox.lag() > self.outbound_max_lag:
+            _totals["slow_disconnects"] += 1
+            self._stop_writer()
+            await self.close(code=self.slow_client_close_code)
+            return
+        if close:
+            await self.close(None if close is True else close)
+        self._wakeup.set()
+
+    async def close(self, code=None, reason=None):
+        if self._writer is None or self._outbound_closed:
+            await super().close(code=code, reason=reason)
+            return
+        # hand the close to the writer, behind the frames already queued
+        self._outbound_closed = True
+        self._close_after_flush = (code, reason)
+        self._wakeup.set()
+
+    async def _write_outbox(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._outbox:
+                await super().send_json(self._outbox.get())
+            if self._close_after_flush is not None:
+                self._writer = None
+                code, reason = self._close_after_flush
+                await super().close(code=code, reason=reason)
+                return
+
+    def _writer_done(self, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error("Websocket writer failed; closing the connection", exc_info=task.exception())
+        self._stop_writer()
+        self._closer = task.get_loop().create_task(super().close(code=self.writer_error_close_code))
+
+    def _stop_writer(self):
+        self._outbound_closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        if self._outbox is not None:
+            self._outbox.clear()
+
+    async def websocket_disconnect(self, message):
+        self._stop_writer()
+        await super().websocket_disconnect(message)
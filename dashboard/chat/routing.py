@@ -5,4 +5,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<room_name>[^/]+)/$", consumers.ChatConsumer.as_asgi()),
     re_path(r"ws/notifications/$", consumers.NotificationConsumer.as_asgi()),  
+    re_path(r"ws/$", consumers.MultiplexConsumer.as_asgi()),
 ]
@@ -16,13 +16,32 @@ class RoomSerializer(serializers.ModelSerializer):
         model = Room
         fields = ("id","name","participants","created_at")
 
+class InboxRoomSerializer(RoomSerializer):
+    """RoomSerializer plus the chat.services.inbox_rooms annotations."""
+    last_message = serializers.SerializerMethodField()
+    last_activity = serializers.DateTimeField(read_only=True)
+    unread = serializers.IntegerField(read_only=True)
+
+    class Meta(RoomSerializer.Meta):
+        fields = RoomSerializer.Meta.fields + ("last_message","last_activity","unread")
+
+    def get_last_message(self, obj):
+        msg = obj.last_message
+        if msg is None:
+            return None
+        # JSON booleans come back as 0/1 on SQLite; tombstones keep no text
+        msg["deleted"] = bool(msg["deleted"])
+        if msg["deleted"]:
+            msg["content"] = None
+        return msg
+
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSimpleSerializer(read_only=True)
     file_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Message
-        fields = ("id","room","sender","content","file_url","message_type","edited","deleted","created_at","updated_at")
+        fields = ("id","room","sender","content","file_url","message_type","edited","deleted","seq","created_at","updated_at")
 
     def get_file_url(self, obj):
         request = self.context.get("request")
@@ -0,0 +1,211 @@
+# chat/services.py
+import asyncio
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.exceptions import PermissionDenied
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, JSONObject
+from django.utils import timezone
+
+from .encoders import encode_message
+from .models import Message, Notification, Room
+from .unread import add_unread
+
+CHANGES_PAGE_SIZE = 500
+
+
+def next_seq(room_id):
+    """
+    Hand out the room's next change sequence number. Must run inside a
+    transaction: the UPDATE keeps the room row locked until commit, so
+    sequence order and commit order agree and `changes_since` never skips
+    a number that commits late.
+    """
+    Room.objects.filter(pk=room_id).update(last_seq=F("last_seq") + 1)
+    return Room.objects.filter(pk=room_id).values_list("last_seq", flat=True).get()
+
+
+def post_message(room, sender, request=None, **fields):
+    """
+    Create a message and its notifications in one transaction and schedule
+    delivery for after commit. Used by both the REST view and ChatConsumer.
+
+    Costs one INSERT for the message, one SELECT of recipient ids, one bulk
+    INSERT for notifications and three statements for the unread counters,
+    whatever the room size.
+    Returns (message, serialized_message).
+    """
+    with transaction.atomic():
+        seq = next_seq(room.pk)
+        msg = Message.objects.create(room=room, sender=sender, seq=seq, **fields)
+        recipient_ids = room.participants.exclude(pk=sender.pk).values_list("pk", flat=True)
+        notifications = Notification.objects.bulk_create([
+            Notification(recipient_id=rid, actor=sender, verb="sent_message", target_message=msg, target_room=room)
+            for rid in recipient_ids
+        ])
+        add_unread([n.recipient_id for n in notifications])
+        payload = encode_message(msg, request)
+        transaction.on_commit(partial(deliver_message, room.name, payload, sender.get_username(), notifications))
+    return msg, payload
+
+
+def edit_message(msg, request=None, **fields):
+    """Apply `fields`, mark the message edited and broadcast after commit."""
+    with transaction.atomic():
+        for name, value in fields.items():
+            setattr(msg, name, value)
+        msg.edited = True
+        msg.seq = next_seq(msg.room_id)
+        msg.save()
+        payload = encode_message(msg, request)
+        transaction.on_commit(partial(broadcast, msg.room.name, {"type": "chat.message_update", "room": msg.room.name, "message": payload}))
+    return msg, payload
+
+
+def delete_message(msg):
+    """Soft-delete the message (kept as a tombstone for delta sync) and broadcast after commit."""
+    with transaction.atomic():
+        msg.deleted = True
+        msg.seq = next_seq(msg.room_id)
+        msg.save(update_fields=["deleted", "seq", "updated_at"])
+        event = {"type": "chat.message_delete", "room": msg.room.name, "message_id": msg.pk, "seq": msg.seq}
+        transaction.on_commit(partial(broadcast, msg.room.name, event))
+    return msg
+
+
+def edit_own_message(room, sender, message_id, request=None, **fields):
+    """
+    Edit `sender`'s message `message_id` in `room` without loading it first:
+    the ownership check, the new sequence number and the changed columns go
+    into one conditional UPDATE (see _update_own). For the websocket path;
+    REST edits that may carry a file upload go through edit_message().
+    Raises Message.DoesNotExist or PermissionDenied.
+    """
+    with transaction.atomic():
+        msg = _update_own(room, sender, message_id, edited=True, **fields)
+        payload = encode_message(msg, request)
+        transaction.on_commit(partial(broadcast, room.name, {"type": "chat.message_update", "room": room.name, "message": payload}))
+    return msg, payload
+
+
+def delete_own_message(room, sender, message_id):
+    """Soft-delete counterpart of edit_own_message()."""
+    with transaction.atomic():
+        msg = _update_own(room, sender, message_id, deleted=True)
+        event = {"type": "chat.message_delete", "room": room.name, "message_id": msg.pk, "seq": msg.seq}
+        transaction.on_commit(partial(broadcast, room.name, event))
+    return msg
+
+
+def _update_own(room, sender, message_id, **values):
+    """
+    Bump the room sequence, then UPDATE the message WHERE id, sender and room
+    match, taking its seq from the room row. Where the backend can RETURN
+    rows the updated message comes back from the UPDATE itself; otherwise it
+    is read back by pk. Must run inside a transaction, which a failed
+    ownership check rolls back (returning the sequence number unused).
+    """
+    Room.objects.filter(pk=room.pk).update(last_seq=F("last_seq") + 1)
+    values["updated_at"] = timezone.now()
+    # PostgreSQL and SQLite >= 3.35 (MariaDB only RETURNs from INSERT/DELETE)
+    if connection.vendor == "postgresql" or (connection.vendor == "sqlite" and connection.features.can_return_columns_from_insert):
+        msg = next(iter(_update_returning(room, sender, message_id, values)), None)
+    else:
+        updated = Message.objects.filter(pk=message_id, sender=sender, room=room).update(
+            seq=Subquery(Room.objects.filter(pk=room.pk).values("last_seq")), **values
+        )
+        msg = Message.objects.get(pk=message_id) if updated else None
+    if msg is None:
+        if Message.objects.filter(pk=message_id, room=room).exists():
+            raise PermissionDenied("Only sender can change message.")
+        raise Message.DoesNotExist("Message matching query does not exist.")
+    # the payload's sender and room are already known; no joins needed
+    msg.sender = sender
+    msg.room = room
+    return msg
+
+
+def _update_returning(room, sender, message_id, values):
+    opts = Message._meta
+    qn = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in values]
+    assignments = ", ".join(f"{qn(field.column)} = %s" for field in fields)
+    returning = ", ".join(qn(field.column) for field in opts.concrete_fields)
+    sql = (
+        f"UPDATE {qn(opts.db_table)} SET {assignments}, "
+        f"{qn('seq')} = (SELECT {qn('last_seq')} FROM {qn(Room._meta.db_table)} WHERE {qn('id')} = %s) "
+        f"WHERE {qn('id')} = %s AND {qn('sender_id')} = %s AND {qn('room_id')} = %s "
+        f"RETURNING {returning}"
+    )
+    params = [field.get_db_prep_save(values[field.name], connection) for field in fields]
+    # raw() applies the field converters and builds the instance from the returned row
+    return Message.objects.raw(sql, params + [room.pk, message_id, sender.pk, room.pk])
+
+
+def inbox_rooms(user):
+    """
+    The user's rooms annotated for an inbox view, all in the rooms query:
+      * last_message: JSON {id, sender {id, email, name}, content,
+        message_type, deleted, seq} of the newest message (an index probe on
+        (room, created_at, id)), or None;
+      * last_activity: that message's created_at, else the room's;
+      * unread: the user's unread notifications for the room.
+    """
+    latest = Message.objects.filter(room=OuterRef("pk")).order_by("-created_at", "-id")
+    unread = (
+        Notification.objects.filter(recipient=user, read=False, target_room=OuterRef("pk"))
+        .values("target_room").annotate(n=Count("pk")).values("n")
+    )
+    return Room.objects.filter(participants=user).annotate(
+        last_message=Subquery(latest.values(json=JSONObject(
+            id="id",
+            sender=JSONObject(id="sender_id", email="sender__email", name="sender__name"),
+            content="content",
+            message_type="message_type",
+            deleted="deleted",
+            seq="seq",
+        ))[:1]),
+        last_activity=Coalesce(Subquery(latest.values("created_at")[:1]), "created_at"),
+        unread=Coalesce(Subquery(unread), 0),
+    )
+
+
+def changes_since(room, since, limit=CHANGES_PAGE_SIZE):
+    """
+    Messages inserted, edited or deleted after sequence `since`, oldest
+    change first; each row carries its latest state. Returns (rows, has_more).
+    """
+    rows = list(
+        room.messages.filter(seq__gt=since).select_related("sender").order_by("seq")[: limit + 1]
+    )
+    return rows[:limit], len(rows) > limit
+
+
+def broadcast(room_name, event):
+    async_to_sync(get_channel_layer().group_send)(f"chat_{room_name}", event)
+
+
+def deliver_message(room_name, payload, actor, notifications):
+    async_to_sync(_deliver_message)(room_name, payload, actor, notifications)
+
+
+async def _deliver_message(room_name, payload, actor, notifications):
+    """One room broadcast, then every personal notification concurrently."""
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send(f"chat_{room_name}", {"type": "chat.message", "room": room_name, "message": payload})
+    await asyncio.gather(*(
+        channel_layer.group_send(f"notifications_{n.recipient_id}", {
+            "type": "notify",
+            "notification": {
+                "id": n.pk,
+                "actor": actor,
+                "verb": "sent_message",
+                "room": room_name,
+                "timestamp": n.timestamp.isoformat(),
+            },
+        })
+        for n in notifications
+    ))
@@ -0,0 +1,35 @@
+# chat/signals.py
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .membership import evict_members, evict_room, member_cache
+from .models import Notification, Room
+from .unread import remove_unread
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def evict_room_from_membership_cache(sender, instance, **kwargs):
+    evict_room(instance)
+
+
+@receiver(m2m_changed, sender=Room.participants.through)
+def evict_room_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        evict_members(instance.pk)
+    elif pk_set is None:
+        # user.rooms.clear(): the affected rooms aren't passed in
+        member_cache.clear()
+    else:
+        for room_id in pk_set:
+            evict_members(room_id)
+
+
+@receiver(post_delete, sender=Notification)
+def drop_deleted_from_unread_counter(sender, instance, **kwargs):
+    # Also runs for cascades from message and room deletes: with a receiver
+    # connected, Django collects and deletes notifications row by row.
+    if not instance.read:
+        remove_unread(instance.recipient_id)
@@ -1,3 +1,827 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import user_cache
+
+from .consumers import MultiplexConsumer
+from .encoders import encode_message
+from .layers import ShardedInMemoryChannelLayer
+from .loadtest import SocketClient
+from .membership import (
+    aget_room, ais_participant, get_room, is_participant, member_cache, member_ids, room_cache,
+)
+from .middleware import JwtAuthMiddleware, get_user_from_token, token_cache, token_claims
+from .models import Message, Notification, Room, UnreadCounter
+from .outbound import BufferedSendMixin, OutboundQueue, outbound_stats
+from .serializers import MessageSerializer
+from .services import delete_own_message, edit_own_message, post_message
+from .unread import mark_read, read_until, reconcile, unread_count
+
+User = get_user_model()
+
+
+class OwnMessageUpdateTests(TestCase):
+    """edit_own_message / delete_own_message: one conditional UPDATE, RETURNING where supported."""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(email="owner@example.com", password="x", name="Owner")
+        self.other = User.objects.create_user(email="other@example.com", password="x", name="Other")
+        self.room = Room.objects.create(name="general")
+        self.room.participants.set([self.owner, self.other])
+        self.other_room = Room.objects.create(name="random")
+        self.msg, _ = post_message(self.room, self.owner, content="hello")
+
+    def last_seq(self):
+        return Room.objects.values_list("last_seq", flat=True).get(pk=self.room.pk)
+
+    def test_owner_edit_returns_updated_row(self):
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            msg, payload = edit_own_message(self.room, self.owner, self.msg.pk, content="edited")
+
+        self.assertTrue(any("RETURNING" in q["sql"] for q in queries))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(msg.seq, 2)
+        self.assertEqual(self.last_seq(), 2)
+        stored = Message.objects.select_related("sender").get(pk=self.msg.pk)
+        self.assertEqual(stored.content, "edited")
+        self.assertTrue(stored.edited)
+        self.assertEqual(payload, MessageSerializer(stored).data)
+
+    def test_owner_delete(self):
+        msg = delete_own_message(self.room, self.owner, self.msg.pk)
+
+        self.assertEqual(msg.seq, 2)
+        self.assertTrue(Message.objects.get(pk=self.msg.pk).deleted)
+
+    def test_non_owner_is_denied_and_seq_rolled_back(self):
+        with self.assertRaises(PermissionDenied):
+            edit_own_message(self.room, self.other, self.msg.pk, content="nope")
+        with self.assertRaises(PermissionDenied):
+            delete_own_message(self.room, self.other, self.msg.pk)
+
+        self.assertEqual(self.last_seq(), 1)
+        stored = Message.objects.get(pk=self.msg.pk)
+        self.assertEqual((stored.content, stored.edited, stored.deleted, stored.seq), ("hello", False, False, 1))
+
+    def test_missing_or_wrong_room_is_not_found(self):
+        with self.assertRaises(Message.DoesNotExist):
+            edit_own_message(self.room, self.owner, self.msg.pk + 1000, content="nope")
+        with self.assertRaises(Message.DoesNotExist):
+            edit_own_message(self.other_room, self.owner, self.msg.pk, content="nope")
+
+        self.assertEqual(self.last_seq(), 1)
+        self.assertEqual(Message.objects.get(pk=self.msg.pk).content, "hello")
+
+
+@mock.patch.object(connection, "vendor", "mysql")
+class OwnMessageUpdateFallbackTests(OwnMessageUpdateTests):
+    """Same behaviour on backends without UPDATE ... RETURNING (UPDATE, then a read by pk)."""
+
+    def test_owner_edit_returns_updated_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            msg, payload = edit_own_message(self.room, self.owner, self.msg.pk, content="edited")
+
+        self.assertFalse(any("RETURNING" in q["sql"] for q in queries))
+        self.assertEqual(msg.seq, 2)
+        stored = Message.objects.select_related("sender").get(pk=self.msg.pk)
+        self.assertEqual(payload, MessageSerializer(stored).data)
+
+
+class RoomListTests(TestCase):
+    """GET chat/rooms/: rooms by last activity, with last message and unread count, in a fixed number of queries."""
+    client_class = APIClient
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="me@example.com", password="x", name="Me")
+        self.friend = User.objects.create_user(email="friend@example.com", password="x", name="Friend")
+        self.client.force_authenticate(self.user)
+        self.quiet, self.busy, self.empty = (Room.objects.create(name=name) for name in ("quiet", "busy", "empty"))
+        for room in (self.quiet, self.busy, self.empty):
+            room.participants.set([self.user, self.friend])
+        Room.objects.create(name="not-mine").participants.add(self.friend)
+
+        now = timezone.now()
+        self.quiet_last, _ = post_message(self.quiet, self.friend, content="old news")
+        Message.objects.filter(room=self.quiet).update(created_at=now - timedelta(days=2))
+        post_message(self.busy, self.friend, content="first")
+        post_message(self.busy, self.user, content="mine")
+        self.busy_last, _ = post_message(self.busy, self.friend, content="latest")
+        Message.objects.filter(room=self.busy).update(created_at=now - timedelta(hours=1))
+        Room.objects.filter(pk=self.empty.pk).update(created_at=now - timedelta(days=1))
+        Message.objects.filter(pk=self.quiet_last.pk).update(deleted=True)
+        # the notification for "first" has been read
+        Notification.objects.filter(recipient=self.user, target_message__content="first").update(read=True)
+
+    def get(self, query=""):
+        self.client.get(reverse("room-list"))  # backend feature probes (e.g. SQLite JSON support) run once
+        with self.assertNumQueries(2):  # rooms with annotations + participants prefetch
+            response = self.client.get(reverse("room-list") + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_order_last_message_and_unread(self):
+        rooms = self.get()["results"]
+
+        self.assertEqual([r["name"] for r in rooms], ["busy", "empty", "quiet"])
+        busy, empty, quiet = rooms
+        self.assertEqual(busy["last_message"], {
+            "id": self.busy_last.pk,
+            "sender": {"id": self.friend.pk, "email": "friend@example.com", "name": "Friend"},
+            "content": "latest",
+            "message_type": "text",
+            "deleted": False,
+            "seq": 3,
+        })
+        self.assertEqual(busy["unread"], 1)
+        self.assertIsNone(empty["last_message"])
+        self.assertEqual(empty["unread"], 0)
+        self.assertEqual((quiet["last_message"]["deleted"], quiet["last_message"]["content"]), (True, None))
+        self.assertEqual(quiet["unread"], 1)
+        self.assertEqual(len(busy["participants"]), 2)
+
+    def test_pages_follow_last_activity(self):
+        first = self.get("?page_size=2")
+        self.assertEqual([r["name"] for r in first["results"]], ["busy", "empty"])
+
+        cursor = first["next"].split("cursor=")[1].split("&")[0]
+        second = self.get(f"?page_size=2&cursor={cursor}")
+        self.assertEqual([r["name"] for r in second["results"]], ["quiet"])
+        self.assertIsNone(second["next"])
+
+
+class EncodeMessageTests(TestCase):
+    """chat.encoders.encode_message must serialize to the same JSON as MessageSerializer."""
+
+    def setUp(self):
+        self.sender = User.objects.create_user(email="sender@example.com", password="x", name="Sender")
+        self.nameless = User.objects.create_user(email="nameless@example.com", password="x", name="")
+        self.room = Room.objects.create(name="general")
+
+    def assertEncodesLikeSerializer(self, msg, request=None):
+        msg = Message.objects.select_related("sender").get(pk=msg.pk)
+        expected = MessageSerializer(msg, context={"request": request}).data
+        self.assertEqual(json.dumps(encode_message(msg, request)), json.dumps(expected))
+
+    def test_text_message(self):
+        msg, _ = post_message(self.room, self.sender, content='hello é☃ "quoted"')
+        self.assertEncodesLikeSerializer(msg)
+
+    def test_edited_message(self):
+        msg, _ = post_message(self.room, self.sender, content="hello")
+        edit_own_message(self.room, self.sender, msg.pk, content="edited")
+        self.assertEncodesLikeSerializer(msg)
+
+    def test_deleted_message(self):
+        msg, _ = post_message(self.room, self.sender, content="hello")
+        delete_own_message(self.room, self.sender, msg.pk)
+        self.assertEncodesLikeSerializer(msg)
+
+    def test_file_message(self):
+        # a stored upload, as MessageCreateView leaves it; reloading gives a CloudinaryResource
+        msg = Message.objects.create(room=self.room, sender=self.sender, content=None,
+                                     message_type=Message.FILE, file="image/upload/v1/sample.jpg")
+        self.assertEncodesLikeSerializer(msg)
+        self.assertEncodesLikeSerializer(msg, request=RequestFactory().get("/"))
+        self.assertIn("sample.jpg", encode_message(Message.objects.get(pk=msg.pk))["file_url"])
+
+    def test_sender_without_name(self):
+        msg, _ = post_message(self.room, self.nameless, content="")
+        self.assertEncodesLikeSerializer(msg)
+
+    def test_datetimes_in_other_timezone(self):
+        msg, _ = post_message(self.room, self.sender, content="hello")
+        msg = Message.objects.select_related("sender").get(pk=msg.pk)
+        msg.created_at = msg.created_at.astimezone(timezone.get_fixed_timezone(330)).replace(microsecond=0)
+        self.assertEqual(
+            json.dumps(encode_message(msg)),
+            json.dumps(MessageSerializer(msg, context={"request": None}).data),
+        )
+
+
+class RoomChangesViewTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="me@example.com", password="x", name="Me")
+        self.client.force_authenticate(self.user)
+        self.room = Room.objects.create(name="general")
+        self.room.participants.add(self.user)
+        post_message(self.room, self.user, content="one")
+        post_message(self.room, self.user, content="two")
+
+    def test_changes_since(self):
+        response = self.client.get(reverse("room-changes", args=["general"]), {"since": 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c["content"] for c in response.json()["changes"]], ["two"])
+        self.assertEqual(response.json()["last_seq"], 2)
+
+    def test_bad_since_is_a_detail_error(self):
+        response = self.client.get(reverse("room-changes", args=["general"]), {"since": "x"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"detail": "since and limit must be integers."})
+
+
+class MarkNotificationsReadViewTests(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.user = User.objects.create_user(email="me@example.com", password="x", name="Me")
+        self.friend = User.objects.create_user(email="friend@example.com", password="x", name="Friend")
+        self.client.force_authenticate(self.user)
+        self.room = Room.objects.create(name="general")
+        self.room.participants.set([self.user, self.friend])
+        for content in ("one", "two"):
+            post_message(self.room, self.friend, content=content)
+
+    def test_mark_room_read(self):
+        response = self.client.post(reverse("notification-mark-read"), {"action": "mark_room_read", "room": "general"}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"unread": 0})
+
+    def test_bad_requests_are_detail_errors(self):
+        for body, detail in (
+            ({"action": "mark_read"}, "notification_id is required."),
+            ({"action": "nope"}, "action must be mark_read, mark_read_until or mark_room_read."),
+        ):
+            response = self.client.post(reverse("notification-mark-read"), body, format="json")
+
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"detail": detail})
+
+
+class MembershipCacheTests(TestCase):
+    """chat.membership: cached room / member lookups, evicted by the chat.signals receivers."""
+
+    def setUp(self):
+        room_cache.clear()
+        member_cache.clear()
+        self.addCleanup(room_cache.clear)
+        self.addCleanup(member_cache.clear)
+        self.alice = User.objects.create_user(email="alice@example.com", password="x", name="Alice")
+        self.bob = User.objects.create_user(email="bob@example.com", password="x", name="Bob")
+        self.room = Room.objects.create(name="general")
+        self.room.participants.add(self.alice)
+
+    def test_get_room_is_cached_and_copied(self):
+        with self.assertNumQueries(1):
+            room = get_room("general")
+        with self.assertNumQueries(0):
+            again = get_room("general")
+
+        self.assertEqual(again, self.room)
+        self.assertIsNot(again, room)
+        again.name = "mutated"
+        self.assertEqual(get_room("general").name, "general")
+
+    def test_missing_room_is_not_cached(self):
+        with self.assertNumQueries(2):
+            self.assertIsNone(get_room("nope"))
+            self.assertIsNone(get_room("nope"))
+        Room.objects.create(name="nope")
+        self.assertIsNotNone(get_room("nope"))
+
+    def test_room_save_and_delete_evict(self):
+        get_room("general")
+        member_ids(self.room.pk)
+
+        self.room.save()
+        self.assertIsNone(room_cache.get("general"))
+        self.assertIsNone(member_cache.get(self.room.pk))
+
+        get_room("general")
+        self.room.delete()
+        self.assertIsNone(get_room("general"))
+
+    def test_member_ids_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(member_ids(self.room.pk), {self.alice.pk})
+            self.assertTrue(is_participant(self.room, self.alice))
+            self.assertFalse(is_participant(self.room, self.bob))
+        self.assertFalse(is_participant(self.room, AnonymousUser()))
+        self.assertFalse(is_participant(self.room, None))
+
+    def test_m2m_changes_evict_members(self):
+        changes = (
+            lambda: self.room.participants.add(self.bob),
+            lambda: self.room.participants.remove(self.bob),
+            lambda: self.bob.rooms.add(self.room),
+            lambda: self.bob.rooms.remove(self.room),
+            lambda: self.room.participants.set([self.alice, self.bob]),
+            lambda: self.room.participants.clear(),
+        )
+        for change in changes:
+            member_ids(self.room.pk)
+            change()
+            with self.subTest(change=change):
+                self.assertEqual(member_ids(self.room.pk), set(self.room.participants.values_list("pk", flat=True)))
+
+    def test_reverse_clear_drops_every_member_entry(self):
+        other = Room.objects.create(name="random")
+        member_ids(self.room.pk)
+        member_ids(other.pk)
+
+        self.alice.rooms.clear()
+
+        self.assertEqual(len(member_cache), 0)
+        self.assertFalse(is_participant(self.room, self.alice))
+
+    async def test_async_lookups_stay_on_the_loop_when_warm(self):
+        await database_sync_to_async(get_room)("general")
+        await database_sync_to_async(member_ids)(self.room.pk)
+
+        with mock.patch("dashboard.chat.membership.database_sync_to_async") as to_thread:
+            room = await aget_room("general")
+            self.assertTrue(await ais_participant(room, self.alice))
+            self.assertFalse(await ais_participant(room, self.bob))
+            self.assertFalse(await ais_participant(room, AnonymousUser()))
+        to_thread.assert_not_called()
+
+
+class TokenCacheTests(TestCase):
+    """chat.middleware: websocket tokens decoded once, cached until they expire."""
+
+    def setUp(self):
+        token_cache.clear()
+        user_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.addCleanup(user_cache.clear)
+        self.user = User.objects.create_user(email="ws@example.com", password="x", name="Ws")
+
+    def token(self, lifetime=timedelta(minutes=5)):
+        token = AccessToken.for_user(self.user)
+        token.set_exp(lifetime=lifetime)
+        return str(token)
+
+    def test_claims_cached_no_longer_than_the_token_lives(self):
+        token = self.token(timedelta(seconds=30))
+
+        claims = token_claims(token)
+        with mock.patch("dashboard.chat.middleware.AccessToken") as decode:
+            self.assertEqual(token_claims(token), claims)
+        decode.assert_not_called()
+
+        self.assertEqual(claims["user_id"], str(self.user.pk))
+        (_, expires_at), = token_cache._data.values()
+        self.assertLessEqual(expires_at - token_cache._clock(), 30)
+
+    async def test_user_served_from_cache_on_reconnect(self):
+        token = self.token()
+
+        first = await get_user_from_token(token)
+        with mock.patch("dashboard.chat.middleware.database_sync_to_async") as to_thread:
+            second = await get_user_from_token(token)
+        to_thread.assert_not_called()
+
+        self.assertEqual(second, self.user)
+        self.assertIsNot(first, second)
+
+    async def test_cached_token_stops_working_at_exp(self):
+        token = self.token()
+        self.assertEqual(await get_user_from_token(token), self.user)
+        exp = token_claims(token)["exp"]
+
+        with mock.patch("dashboard.chat.middleware.time.time", return_value=exp):
+            self.assertTrue((await get_user_from_token(token)).is_anonymous)
+
+    async def test_rejected_tokens(self):
+        self.assertTrue((await get_user_from_token("not-a-token")).is_anonymous)
+        self.assertTrue((await get_user_from_token(self.token(timedelta(seconds=-1)))).is_anonymous)
+        self.assertEqual(len(token_cache), 0)
+
+        token = self.token()
+        await get_user_from_token(token)
+        await database_sync_to_async(User.objects.filter(pk=self.user.pk).update)(is_active=False)
+        await database_sync_to_async(user_cache.clear)()
+        self.assertTrue((await get_user_from_token(token)).is_anonymous)
+
+        await database_sync_to_async(User.objects.filter(pk=self.user.pk).delete)()
+        self.assertTrue((await get_user_from_token(token)).is_anonymous)
+
+    async def test_middleware_scope_user(self):
+        seen = []
+
+        async def inner(scope, receive, send):
+            seen.append(scope["user"])
+
+        middleware = JwtAuthMiddleware(inner)
+        await middleware({"query_string": f"token={self.token()}".encode()}, None, None)
+        await middleware({"query_string": b"", "user": self.user}, None, None)
+        await middleware({"query_string": b""}, None, None)
+
+        self.assertEqual(seen[:2], [self.user, self.user])
+        self.assertTrue(seen[2].is_anonymous)
+
+
+class UnreadCounterTests(TestCase):
+    """chat.unread: the materialized per-user unread count."""
+
+    def setUp(self):
+        self.me = User.objects.create_user(email="me@example.com", password="x", name="Me")
+        self.friend = User.objects.create_user(email="friend@example.com", password="x", name="Friend")
+        self.room = Room.objects.create(name="general")
+        self.room.participants.set([self.me, self.friend])
+
+    def post(self, count=1, room=None):
+        return [post_message(room or self.room, self.friend, content=f"m{i}")[0] for i in range(count)]
+
+    def test_posting_counts_for_everyone_but_the_sender(self):
+        self.post(3)
+
+        self.assertEqual(unread_count(self.me.pk), 3)
+        self.assertEqual(unread_count(self.friend.pk), 0)
+        self.assertEqual(Notification.objects.filter(recipient=self.me, read=False).count(), 3)
+
+    def test_mark_read_takes_only_flipped_rows_off(self):
+        self.post(3)
+        first = Notification.objects.filter(recipient=self.me).order_by("pk").first()
+
+        self.assertEqual(mark_read(self.me, Notification.objects.filter(pk=first.pk)), 2)
+        self.assertEqual(mark_read(self.me, Notification.objects.filter(pk=first.pk)), 2)
+        # someone else's notifications are not touched
+        self.assertEqual(mark_read(self.friend, Notification.objects.all()), 0)
+        self.assertEqual(mark_read(self.me, read_until(timestamp=timezone.now().isoformat())), 0)
+
+    def test_deleting_unread_notifications_keeps_the_count(self):
+        msgs = self.post(4)
+        mark_read(self.me, Notification.objects.filter(target_message=msgs[0]))
+        self.assertEqual(unread_count(self.me.pk), 3)
+
+        Notification.objects.filter(target_message=msgs[0]).delete()  # already read
+        self.assertEqual(unread_count(self.me.pk), 3)
+        Notification.objects.filter(target_message=msgs[1]).delete()
+        self.assertEqual(unread_count(self.me.pk), 2)
+        msgs[2].delete()  # cascades to its notification
+        self.assertEqual(unread_count(self.me.pk), 1)
+
+        other = Room.objects.create(name="other")
+        other.participants.set([self.me, self.friend])
+        self.post(2, room=other)
+        self.assertEqual(unread_count(self.me.pk), 3)
+        other.delete()  # room -> messages -> notifications
+        self.assertEqual(unread_count(self.me.pk), 1)
+        self.assertEqual(reconcile([self.me.pk]), 0)
+
+    def test_reconcile_fixes_drift(self):
+        self.post(2)
+        UnreadCounter.objects.filter(user=self.me).update(unread=7)
+        Notification.objects.filter(recipient=self.me).update(read=True)  # bypasses the counter
+
+        self.assertEqual(reconcile([self.me.pk, self.friend.pk]), 1)
+        self.assertEqual(unread_count(self.me.pk), 0)
+        self.assertEqual(reconcile([self.me.pk, self.friend.pk]), 0)
+
+
+class ShardedInMemoryChannelLayerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("dashboard.chat.layers.time.time", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def receive(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), 1)
+
+    async def test_group_send_fans_out_across_shards(self):
+        layer = ShardedInMemoryChannelLayer(shards=4)
+        channels = [await layer.new_channel() for _ in range(8)]
+        self.assertGreater(len({layer._shard(c) for c in channels}), 1)
+        for channel in channels:
+            await layer.group_add("room", channel)
+        await layer.group_add("other", channels[0])
+
+        await layer.group_send("room", {"type": "chat.message", "text": "hi"})
+        await layer.group_send("empty", {"type": "chat.message"})
+
+        for channel in channels:
+            self.assertEqual(await self.receive(layer, channel), {"type": "chat.message", "text": "hi"})
+        self.assertEqual(layer.stats(), {"channels": 0, "groups": 2, "queued": 0, "sent": 8, "dropped": 0, "expired": 0})
+
+        await layer.group_discard("room", channels[1])
+        await layer.group_send("room", {"type": "chat.message"})
+        self.assertEqual(layer.stats()["queued"], 7)
+
+    async def test_capacity(self):
+        layer = ShardedInMemoryChannelLayer(capacity=2)
+        full, roomy = "full.one", "roomy.one"
+        for channel in (full, roomy):
+            await layer.group_add("room", channel)
+        await layer.send(full, {"type": "a"})
+        await layer.send(full, {"type": "b"})
+
+        with self.assertRaises(ChannelFull):
+            await layer.send(full, {"type": "c"})
+        await layer.group_send("room", {"type": "d"})  # full members are skipped, not fatal
+
+        self.assertEqual(await self.receive(layer, roomy), {"type": "d"})
+        self.assertEqual([await self.receive(layer, full) for _ in range(2)], [{"type": "a"}, {"type": "b"}])
+        self.assertEqual(layer.dropped, 2)
+
+    async def test_expired_messages_drop_stale_channels_from_groups(self):
+        layer = ShardedInMemoryChannelLayer(expiry=10, shards=1)
+        await layer.group_add("room", "stale.one")
+        await layer.group_add("lobby", "stale.one")
+        await layer.group_add("room", "live.one")
+        await layer.group_send("room", {"type": "old"})
+        self.assertEqual(await self.receive(layer, "live.one"), {"type": "old"})
+
+        self.now += 11
+        await layer.group_send("room", {"type": "new"})  # sweeps: stale.one never read its message
+
+        self.assertEqual(layer._groups[0], {"room": {"live.one": 1000.0}})
+        self.assertNotIn("stale.one", layer._memberships)
+        self.assertEqual(layer.expired, 1)
+        self.assertEqual(await self.receive(layer, "live.one"), {"type": "new"})
+
+    async def test_receive_skips_expired_messages(self):
+        layer = ShardedInMemoryChannelLayer(expiry=10)
+        await layer.send("some.one", {"type": "old"})
+        self.now += 5
+        await layer.send("some.one", {"type": "new"})
+        self.now += 6
+
+        self.assertEqual(await self.receive(layer, "some.one"), {"type": "new"})
+        self.assertEqual(layer.expired, 1)
+
+    async def test_waiting_receive_survives_a_sweep_and_cancel_cleans_up(self):
+        layer = ShardedInMemoryChannelLayer(expiry=10, shards=1)
+        waiting = asyncio.ensure_future(layer.receive("some.one"))
+        await asyncio.sleep(0)
+        self.now += 11
+        await layer.group_send("nobody", {"type": "x"})  # runs a sweep
+        self.assertEqual(layer.stats()["channels"], 1)
+
+        await layer.send("some.one", {"type": "hello"})
+        self.assertEqual(await asyncio.wait_for(waiting, 1), {"type": "hello"})
+        self.assertEqual(layer.stats()["channels"], 0)
+
+        waiting = asyncio.ensure_future(layer.receive("some.one"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(layer.stats()["channels"], 0)
+
+    async def test_two_receivers_on_one_channel(self):
+        layer = ShardedInMemoryChannelLayer()
+        first = asyncio.ensure_future(layer.receive("some.one"))
+        second = asyncio.ensure_future(layer.receive("some.one"))
+        await asyncio.sleep(0)
+
+        await layer.send("some.one", {"type": "a"})
+        await layer.send("some.one", {"type": "b"})
+
+        got = await asyncio.wait_for(asyncio.gather(first, second), 1)
+        self.assertEqual(sorted(m["type"] for m in got), ["a", "b"])
+        self.assertEqual(layer.stats()["channels"], 0)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.queue = OutboundQueue(maxsize=3, clock=lambda: self.now)
+
+    def drain(self):
+        return [self.queue.get() for _ in range(len(self.queue))]
+
+    def test_keyed_frames_coalesce_in_place(self):
+        self.queue.put({"n": 1})
+        self.queue.put({"unread": 1}, key="unread")
+        self.queue.put({"n": 2})
+        self.queue.put({"unread": 2}, key="unread")
+
+        self.assertEqual(self.drain(), [{"n": 1}, {"unread": 2}, {"n": 2}])
+        # once sent, the key starts a new frame
+        self.queue.put({"unread": 3}, key="unread")
+        self.assertEqual(self.drain(), [{"unread": 3}])
+
+    def test_full_queue_drops_the_oldest_coalescible_frame(self):
+        self.queue.put({"typing": "a"}, key="typing:a")
+        self.queue.put({"n": 1})
+        self.queue.put({"typing": "b"}, key="typing:b")
+
+        self.assertTrue(self.queue.put({"n": 2}))
+        self.assertEqual(self.drain(), [{"n": 1}, {"typing": "b"}, {"n": 2}])
+        self.queue.put({"typing": "a"}, key="typing:a")  # its old entry is gone, not coalesced into
+        self.assertEqual(self.drain(), [{"typing": "a"}])
+
+    def test_full_of_plain_frames_refuses(self):
+        for n in range(3):
+            self.assertTrue(self.queue.put({"n": n}))
+
+        self.assertFalse(self.queue.put({"n": 3}))
+        self.assertFalse(self.queue.put({"unread": 1}, key="unread"))
+        self.assertEqual(len(self.queue), 3)
+
+    def test_lag_is_the_age_of_the_oldest_frame(self):
+        self.assertEqual(self.queue.lag(), 0.0)
+        self.queue.put({"n": 1})
+        self.now = 2
+        self.queue.put({"n": 2})
+        self.now = 5
+
+        self.assertEqual(self.queue.lag(), 5)
+        self.queue.get()
+        self.assertEqual(self.queue.lag(), 3)
+        self.queue.clear()
+        self.assertEqual(self.queue.lag(), 0.0)
+
+
+class StalledLinkConsumer(AsyncJsonWebsocketConsumer):
+    """Frames wait for `link` to open, like a client on a stalled connection."""
+
+    async def connect(self):
+        self.link = asyncio.Event()
+        self.broken = False
+        await self.accept()
+
+    async def send_json(self, content, close=False):
+        await self.link.wait()
+        if self.broken:
+            raise RuntimeError("transport gone")
+        await super().send_json(content, close)
+
+
+class SlowLinkConsumer(BufferedSendMixin, StalledLinkConsumer):
+    outbound_max_frames = 3
+    outbound_max_lag = 0.05
+
+    async def receive_json(self, content):
+        self.broken = content.get("break", False)
+        for n in range(content.get("frames", 0)):
+            await self.send_json({"n": n}, coalesce=content.get("key"))
+        if content.get("close"):
+            await self.close(code=4000)
+        if content.get("open"):
+            self.link.set()
+
+
+class BufferedSendMixinTests(SimpleTestCase):
+    async def connect(self):
+        client = SocketClient(SlowLinkConsumer.as_asgi(), "/ws/", AnonymousUser())
+        self.assertTrue(await client.connect())
+        return client
+
+    async def test_frames_flow_once_the_link_opens(self):
+        client = await self.connect()
+        await client.send_json({"frames": 2, "open": True})
+
+        self.assertEqual([await client.receive_json() for _ in range(2)], [{"n": 0}, {"n": 1}])
+        await client.disconnect()
+
+    async def test_coalesced_frames_never_overflow(self):
+        client = await self.connect()
+        await client.send_json({"frames": 10, "key": "unread"})
+        await client.send_json({"open": True})
+
+        self.assertEqual(await client.receive_json(), {"n": 9})
+        self.assertTrue(await client.communicator.receive_nothing())
+        await client.disconnect()
+
+    async def test_overflow_disconnects_with_4008(self):
+        before = outbound_stats()["slow_disconnects"]
+        client = await self.connect()
+        await client.send_json({"frames": 4})
+
+        self.assertEqual(await client.communicator.receive_output(5), {"type": "websocket.close", "code": 4008})
+        self.assertEqual(outbound_stats()["slow_disconnects"], before + 1)
+        await client.disconnect()
+
+    async def test_lag_disconnects_with_4008(self):
+        client = await self.connect()
+        await client.send_json({"frames": 2})  # one stuck in the socket, one queued behind it
+        await asyncio.sleep(0.1)
+        await client.send_json({"frames": 1})
+
+        self.assertEqual(await client.communicator.receive_output(5), {"type": "websocket.close", "code": 4008})
+        await client.disconnect()
+
+    async def test_close_waits_for_queued_frames(self):
+        client = await self.connect()
+        await client.send_json({"frames": 2, "close": True})
+        await client.send_json({"open": True})
+
+        self.assertEqual([await client.receive_json() for _ in range(2)], [{"n": 0}, {"n": 1}])
+        self.assertEqual(await client.communicator.receive_output(5), {"type": "websocket.close", "code": 4000})
+        await client.disconnect()
+
+    async def test_writer_failure_is_logged_and_closes(self):
+        client = await self.connect()
+        with self.assertLogs("dashboard.chat.outbound", "ERROR") as logs:
+            await client.send_json({"frames": 1, "break": True, "open": True})
+            self.assertEqual(await client.communicator.receive_output(5), {"type": "websocket.close", "code": 1011})
+
+        self.assertIn("transport gone", logs.output[0])
+        await client.disconnect()
+
+
+class MultiplexConsumerTests(TestCase):
+    def setUp(self):
+        room_cache.clear()
+        member_cache.clear()
+        self.addCleanup(room_cache.clear)
+        self.addCleanup(member_cache.clear)
+        self.me = User.objects.create_user(email="me@example.com", password="x", name="Me")
+        self.friend = User.objects.create_user(email="friend@example.com", password="x", name="Friend")
+        self.room = Room.objects.create(name="general")
+        self.room.participants.set([self.me, self.friend])
+        for content in ("one", "two", "three"):
+            post_message(self.room, self.friend, content=content)
+        self.private = Room.objects.create(name="private")
+        self.private.participants.add(self.friend)
+
+    async def connect(self):
+        client = SocketClient(MultiplexConsumer.as_asgi(), "/ws/", self.me)
+        self.assertTrue(await client.connect())
+        self.assertEqual((await client.receive_json())["type"], "connection_established")
+        self.assertEqual(await client.receive_json(), {"type": "notification_meta", "unread": 3})
+        return client
+
+    async def request(self, client, data):
+        await client.send_json(data)
+        return await client.receive_json()
+
+    async def test_anonymous_is_rejected(self):
+        client = SocketClient(MultiplexConsumer.as_asgi(), "/ws/", AnonymousUser())
+        await client.communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual(await client.communicator.receive_output(5), {"type": "websocket.close", "code": 4003})
+
+    async def test_subscribe_and_unsubscribe(self):
+        client = await self.connect()
+
+        self.assertEqual(await self.request(client, {"action": "subscribe", "room": "general"}), {"type": "subscribed", "room": "general"})
+        # subscribing twice is harmless
+        self.assertEqual(await self.request(client, {"action": "subscribe", "room": "general"}), {"type": "subscribed", "room": "general"})
+        self.assertEqual(await self.request(client, {"action": "unsubscribe", "room": "general"}), {"type": "unsubscribed", "room": "general"})
+        self.assertEqual(
+            await self.request(client, {"action": "send_message", "room": "general", "content": "hi"}),
+            {"error": "not_subscribed", "room": "general"},
+        )
+        self.assertEqual(await self.request(client, {"action": "subscribe"}), {"error": "room_required"})
+        await client.disconnect()
+
+    async def test_only_participants_may_subscribe(self):
+        client = await self.connect()
+
+        self.assertEqual(await self.request(client, {"action": "subscribe", "room": "private"}), {"error": "not_participant", "room": "private"})
+        self.assertEqual(await self.request(client, {"action": "subscribe", "room": "nowhere"}), {"error": "room_not_found", "room": "nowhere"})
+        await client.disconnect()
+
+        self.assertFalse(await Room.objects.filter(name="nowhere").aexists())
+        self.assertFalse(await self.private.participants.filter(pk=self.me.pk).aexists())
+
+    async def test_max_rooms(self):
+        other = await Room.objects.acreate(name="other")
+        await other.participants.aadd(self.me)
+        client = await self.connect()
+
+        with mock.patch.object(MultiplexConsumer, "max_rooms", 1):
+            await self.request(client, {"action": "subscribe", "room": "general"})
+            self.assertEqual(await self.request(client, {"action": "subscribe", "room": "other"}), {"error": "too_many_rooms", "room": "other"})
+            await self.request(client, {"action": "unsubscribe", "room": "general"})
+            self.assertEqual(await self.request(client, {"action": "subscribe", "room": "other"}), {"type": "subscribed", "room": "other"})
+        await client.disconnect()
+
+    async def test_since_replays_missed_changes(self):
+        client = await self.connect()
+
+        await self.request(client, {"action": "subscribe", "room": "general", "since": "1"})
+        sync = await client.receive_json()
+
+        self.assertEqual((sync["type"], sync["room"], sync["last_seq"], sync["has_more"]), ("sync", "general", 3, False))
+        self.assertEqual([c["content"] for c in sync["changes"]], ["two", "three"])
+        await client.disconnect()
+
+    async def test_invalid_since(self):
+        client = await self.connect()
+
+        for since in ("abc", [1], {}):
+            with self.subTest(since=since):
+                self.assertEqual(
+                    await self.request(client, {"action": "subscribe", "room": "general", "since": since}),
+                    {"error": "invalid_since", "room": "general"},
+                )
+        # nothing was subscribed on the way
+        self.assertEqual(
+            await self.request(client, {"action": "typing", "room": "general", "typing": True}),
+            {"error": "not_subscribed", "room": "general"},
+        )
+        await client.disconnect()
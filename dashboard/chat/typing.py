@@ -0,0 +1,90 @@
+# chat/typing.py
+import asyncio
+import time
+import uuid
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+
+class _RoomTyping:
+    __slots__ = ("users", "dirty", "task")
+
+    def __init__(self):
+        self.users = {}  # user id -> (username, expires_at)
+        self.dirty = False
+        self.task = None
+
+
+class TypingAggregator:
+    """
+    Coalesces typing start/stop events per room. Keystroke events only touch
+    local state; a per-room flusher sends at most one "who is typing"
+    group message every `interval` seconds, and only when the set changed.
+    A user who stops sending start events drops out after `timeout` seconds.
+
+    State is per process. Every frame carries `source`, so with several
+    server processes clients union the latest list from each source.
+    """
+
+    def __init__(self, interval=0.3, timeout=6.0, clock=time.monotonic):
+        self.interval = interval
+        self.timeout = timeout
+        self._clock = clock
+        self._rooms = {}
+        self.source = uuid.uuid4().hex[:12]
+        self.events_in = 0
+        self.frames_out = 0
+
+    def update(self, room_name, user_id, username, typing):
+        self.events_in += 1
+        state = self._rooms.get(room_name)
+        if state is None:
+            if not typing:
+                return
+            state = self._rooms[room_name] = _RoomTyping()
+
+        if typing:
+            if user_id not in state.users:
+                state.dirty = True
+            state.users[user_id] = (username, self._clock() + self.timeout)
+        elif state.users.pop(user_id, None) is not None:
+            state.dirty = True
+
+        if state.task is None or state.task.done():
+            state.task = asyncio.get_running_loop().create_task(self._flush_loop(room_name, state))
+
+    def typing_in(self, room_name):
+        state = self._rooms.get(room_name)
+        return sorted(state.users) if state else []
+
+    async def _flush_loop(self, room_name, state):
+        channel_layer = get_channel_layer()
+        while True:
+            await asyncio.sleep(self.interval)
+            now = self._clock()
+            for user_id in [uid for uid, (_, expires_at) in state.users.items() if expires_at <= now]:
+                del state.users[user_id]
+                state.dirty = True
+
+            if state.dirty:
+                state.dirty = False
+                self.frames_out += 1
+                await channel_layer.group_send(f"chat_{room_name}", {
+                    "type": "chat.typing_state",
+                    "room": room_name,
+                    "users": [{"id": uid, "username": name} for uid, (name, _) in state.users.items()],
+                    "source": self.source,
+                })
+
+            # the "nobody is typing" frame has gone out; stop until the next start
+            if not state.users and not state.dirty:
+                if self._rooms.get(room_name) is state:
+                    del self._rooms[room_name]
+                return
+
+
+typing_aggregator = TypingAggregator(
+    interval=getattr(settings, "CHAT_TYPING_INTERVAL", 0.3),
+    timeout=getattr(settings, "CHAT_TYPING_TIMEOUT", 6.0),
+)
@@ -0,0 +1,88 @@
+# chat/unread.py
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Notification, UnreadCounter
+
+
+def _lock_counters(user_ids):
+    """
+    Make sure counter rows exist, then lock them in pk order so concurrent
+    fan-outs touching overlapping users can't deadlock. Call inside a transaction.
+    """
+    user_ids = sorted(set(user_ids))
+    UnreadCounter.objects.bulk_create([UnreadCounter(user_id=uid) for uid in user_ids], ignore_conflicts=True)
+    list(UnreadCounter.objects.select_for_update().filter(user_id__in=user_ids).order_by("pk").values_list("pk", flat=True))
+    return user_ids
+
+
+def add_unread(user_ids):
+    """+1 for each user in `user_ids`; call in the transaction that inserts their notifications."""
+    if not user_ids:
+        return
+    user_ids = _lock_counters(user_ids)
+    UnreadCounter.objects.filter(user_id__in=user_ids).update(unread=F("unread") + 1)
+
+
+def mark_read(user, notifications):
+    """
+    Mark `notifications` (a Notification queryset) read for `user` and take
+    the number actually flipped off the counter. Returns the new unread count.
+    """
+    with transaction.atomic():
+        marked = notifications.filter(recipient=user, read=False).update(read=True)
+        if marked:
+            UnreadCounter.objects.filter(user=user).update(unread=F("unread") - marked)
+        return unread_count(user.pk)
+
+
+def remove_unread(user_id):
+    """-1 for `user_id`, when one of their unread notifications is deleted."""
+    UnreadCounter.objects.filter(user_id=user_id).update(unread=F("unread") - 1)
+
+
+def read_until(notification_id=None, timestamp=None):
+    """
+    Notifications up to and including `notification_id`, or created at or
+    before `timestamp` (ISO 8601). Raises ValueError on bad or missing input.
+    """
+    if notification_id is not None:
+        return Notification.objects.filter(pk__lte=int(notification_id))
+    if timestamp is not None:
+        until = parse_datetime(str(timestamp))
+        if until is None:
+            raise ValueError("timestamp must be an ISO 8601 datetime.")
+        if timezone.is_naive(until):
+            until = timezone.make_aware(until)
+        return Notification.objects.filter(timestamp__lte=until)
+    raise ValueError("notification_id or timestamp is required.")
+
+
+def unread_count(user_id):
+    return UnreadCounter.objects.filter(user_id=user_id).values_list("unread", flat=True).first() or 0
+
+
+def reconcile(user_ids):
+    """
+    Recount unread notifications for `user_ids` and overwrite drifted
+    counters. Counter rows are locked first, so writers that commit while
+    we count are neither lost nor double counted. Returns the number fixed.
+    """
+    with transaction.atomic():
+        user_ids = _lock_counters(user_ids)
+        actual = dict(
+            Notification.objects.filter(recipient_id__in=user_ids, read=False)
+            .order_by()
+            .values_list("recipient_id")
+            .annotate(n=Count("pk"))
+        )
+        drifted = [
+            counter for counter in UnreadCounter.objects.filter(user_id__in=user_ids)
+            if counter.unread != actual.get(counter.user_id, 0)
+        ]
+        for counter in drifted:
+            counter.unread = actual.get(counter.user_id, 0)
+        UnreadCounter.objects.bulk_update(drifted, ["unread"])
+        return len(drifted)
@@ -1,11 +1,15 @@
 # chat/urls.py
 from django.urls import path
-from .views import RoomListCreateView, MessageListView, MessageCreateView, MessageUpdateView, MessageDeleteView
+from .views import RoomListCreateView, MessageListView, MessageCreateView, MessageUpdateView, MessageDeleteView, RoomChangesView, UnreadCountView, MarkNotificationsReadView, ChatStatsView
 
 urlpatterns = [
     path("chat/rooms/", RoomListCreateView.as_view(), name="room-list"),
     path("chat/rooms/<str:room_name>/messages/", MessageListView.as_view(), name="message-list"),
+    path("chat/rooms/<str:room_name>/changes/", RoomChangesView.as_view(), name="room-changes"),
     path("chat/messages/", MessageCreateView.as_view(), name="message-create"),
     path("chat/messages/<int:pk>/", MessageUpdateView.as_view(), name="message-update"),
+    path("chat/notifications/unread-count/", UnreadCountView.as_view(), name="notification-unread-count"),
+    path("chat/notifications/mark-read/", MarkNotificationsReadView.as_view(), name="notification-mark-read"),
+    path("chat/stats/", ChatStatsView.as_view(), name="chat-stats"),
     path("messages/<int:pk>/delete/", MessageDeleteView.as_view(), name="message-delete"),
 ]
@@ -1,44 +1,132 @@
 # chat/views.py
 import logging
 from rest_framework import generics, status, permissions
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser,JSONParser
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
+from common.pagination import KeysetPagination
+
+from .encoders import encode_message
+from .membership import get_room, is_participant
+from .outbound import outbound_stats
 from .models import Room, Message, Notification
-from .serializers import RoomSerializer, MessageSerializer, NotificationSerializer
+from .serializers import InboxRoomSerializer, RoomSerializer, MessageSerializer, NotificationSerializer
+from .services import CHANGES_PAGE_SIZE, changes_since, delete_message, edit_message, inbox_rooms, post_message
+from .unread import mark_read, read_until, unread_count
 
 logger = logging.getLogger(__name__)
-channel_layer = get_channel_layer()
+
+class RoomPagination(KeysetPagination):
+    """Inbox order: most recently active room first."""
+    ordering = ("-last_activity", "-id")
+    page_size = 30
+
 
 class RoomListCreateView(generics.ListCreateAPIView):
+    """
+    GET: the user's rooms, most recently active first, each with its last
+    message and the user's unread count (chat.services.inbox_rooms). A page
+    costs two queries whatever its size: the annotated rooms, then the
+    participants prefetch.
+    """
     serializer_class = RoomSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
+    pagination_class = RoomPagination
 
     def get_queryset(self):
-        return Room.objects.filter(participants=self.request.user).prefetch_related("participants")
+        return inbox_rooms(self.request.user).prefetch_related("participants")
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return InboxRoomSerializer
+        return RoomSerializer
 
     def perform_create(self, serializer):
         room = serializer.save()
         room.participants.add(self.request.user)
         # optional: invite other participants via request.data
 
+class MessagePagination(KeysetPagination):
+    """
+    Keyset pages over (created_at, id), walked with the (room, created_at, id)
+    index in either direction:
+
+        GET .../messages/                   -> latest page
+        GET .../messages/?before=<cursor>   -> page of older messages
+        GET .../messages/?after=<cursor>    -> page of newer messages
+
+    Results are always in chronological order. "older" is null once the
+    start of the room is reached. "newer" is set whenever the page has rows,
+    so a client can poll it for new messages.
+    """
+    ordering = ("created_at", "id")
+    page_size = 50
+    before_query_param = "before"
+    after_query_param = "after"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+
+        if after:
+            key = self.decode_cursor(after, queryset)
+            rows = list(queryset.filter(self.after(key)).order_by(*self.ordering)[: self.page_size])
+            self.older_key = self.key_of(rows[0]) if rows else None
+            # an empty page means "caught up": keep handing back the same cursor
+            self.newer_key = self.key_of(rows[-1]) if rows else key
+            return rows
+
+        if before:
+            queryset = queryset.filter(self.before(self.decode_cursor(before, queryset)))
+        rows = list(queryset.order_by(*self.reversed_ordering())[: self.page_size + 1])
+        has_older = len(rows) > self.page_size
+        rows = rows[: self.page_size][::-1]
+        self.older_key = self.key_of(rows[0]) if rows and has_older else None
+        self.newer_key = self.key_of(rows[-1]) if rows else None
+        return rows
+
+    def get_link(self, param, key):
+        if key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, self.encode_cursor(key))
+
+    def get_paginated_response(self, data):
+        return Response({
+            "older": self.get_link(self.before_query_param, self.older_key),
+            "newer": self.get_link(self.after_query_param, self.newer_key),
+            "results": data,
+        })
+
+
 class MessageListView(generics.ListAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
-    
+    pagination_class = MessagePagination
+
 
     def get_queryset(self):
         room_name = self.kwargs.get("room_name")
-        room = get_object_or_404(Room, name=room_name)
+        room = get_room(room_name)
+        if room is None:
+            raise Http404("No Room matches the given query.")
         # ensure user belongs to room
-        if not room.participants.filter(pk=self.request.user.pk).exists():
+        if not is_participant(room, self.request.user):
             return Message.objects.none()
-        return room.messages.select_related("sender").all()
+        return room.messages.select_related("sender")
 
 class MessageCreateView(generics.CreateAPIView):
     serializer_class = MessageSerializer
@@ -46,26 +134,22 @@ class MessageCreateView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payload = self.perform_create(serializer)
+        # same dict that was broadcast (chat.encoders), not a second DRF pass
+        return Response(payload, status=status.HTTP_201_CREATED)
+
     def perform_create(self, serializer):
         room = serializer.validated_data.get("room")
-        if not room.participants.filter(pk=self.request.user.pk).exists():
+        if not is_participant(room, self.request.user):
             raise PermissionError("You are not a participant in this room.")
-        msg = serializer.save(sender=self.request.user)
-        # broadcast
-        payload = {
-            "type":"chat_message",
-            "message": MessageSerializer(msg, context={"request": self.request}).data
-        }
-        async_to_sync(channel_layer.group_send)(f"chat_{room.name}", payload)
-
-        # create notifications for other participants
-        recipients = room.participants.exclude(pk=self.request.user.pk)
-        for r in recipients:
-            notif = Notification.objects.create(recipient=r, actor=self.request.user, verb="sent_message", target_message=msg, target_room=room)
-            async_to_sync(channel_layer.group_send)(
-                f"notifications_{r.pk}",
-                {"type":"notify","notification": {"id":notif.pk,"actor": self.request.user.username, "verb":"sent_message","room":room.name,"timestamp":notif.timestamp.isoformat()}}
-            )
+        # message + notifications in one transaction; broadcast after commit
+        fields = {k: v for k, v in serializer.validated_data.items() if k != "room"}
+        msg, payload = post_message(room, self.request.user, request=self.request, **fields)
+        serializer.instance = msg
+        return payload
 
 class MessageUpdateView(generics.UpdateAPIView):
     serializer_class = MessageSerializer
@@ -78,10 +162,9 @@ class MessageUpdateView(generics.UpdateAPIView):
         msg = serializer.instance
         if msg.sender != self.request.user:
             raise PermissionError("Only sender can edit message.")
-        serializer.save(edited=True)
-        # broadcast update
-        payload = {"type":"chat_message_update","message": MessageSerializer(msg, context={"request": self.request}).data}
-        async_to_sync(channel_layer.group_send)(f"chat_{msg.room.name}", payload)
+        # messages don't move between rooms; that would break the room's change sequence
+        fields = {k: v for k, v in serializer.validated_data.items() if k != "room"}
+        edit_message(msg, request=self.request, **fields)
 
 class MessageDeleteView(generics.DestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -90,7 +173,94 @@ class MessageDeleteView(generics.DestroyAPIView):
     def perform_destroy(self, instance):
         if instance.sender != self.request.user:
             raise PermissionError("Only sender can delete message.")
-        instance.deleted = True
-        instance.save()
-        payload = {"type":"chat_message_delete","message_id": instance.pk}
-        async_to_sync(channel_layer.group_send)(f"chat_{instance.room.name}", payload)
+        delete_message(instance)
+
+
+class UnreadCountView(APIView):
+    """GET /chat/notifications/unread-count/ -> {"unread": N} from the materialized counter."""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread": unread_count(request.user.pk)})
+
+
+class MarkNotificationsReadView(APIView):
+    """
+    POST /chat/notifications/mark-read/ for clients without a socket; takes
+    the same bodies as the NotificationConsumer actions:
+
+        {"action": "mark_read", "notification_id": 12}
+        {"action": "mark_read_until", "notification_id": 40}
+        {"action": "mark_read_until", "timestamp": "2025-01-01T12:00:00Z"}
+        {"action": "mark_room_read", "room": "room-name"}
+
+    Each is one UPDATE; responds with the new unread count.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        action = request.data.get("action")
+        try:
+            if action == "mark_read":
+                if request.data.get("notification_id") is None:
+                    raise ValueError("notification_id is required.")
+                notifications = Notification.objects.filter(pk=int(request.data["notification_id"]))
+            elif action == "mark_read_until":
+                notifications = read_until(request.data.get("notification_id"), request.data.get("timestamp"))
+            elif action == "mark_room_read":
+                room = get_room(request.data.get("room") or "")
+                if room is None:
+                    raise Http404("No Room matches the given query.")
+                notifications = Notification.objects.filter(target_room=room)
+            else:
+                raise ValueError("action must be mark_read, mark_read_until or mark_room_read.")
+        except (TypeError, ValueError) as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        unread = mark_read(request.user, notifications)
+        async_to_sync(get_channel_layer().group_send)(
+            f"notifications_{request.user.pk}", {"type": "notification.unread", "unread": unread}
+        )
+        return Response({"unread": unread})
+
+
+class ChatStatsView(APIView):
+    """
+    Websocket outbound queue depth and slow-client counters for this process.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(outbound_stats(), status=status.HTTP_200_OK)
+
+
+class RoomChangesView(APIView):
+    """
+    GET /chat/rooms/<name>/changes/?since=N[&limit=M]
+
+    Messages inserted, edited or (soft-)deleted after room sequence N, in
+    sequence order, each in its latest state. Resume from "last_seq"; keep
+    going while "has_more" is true.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 1000
+
+    def get(self, request, room_name):
+        room = get_room(room_name)
+        if room is None:
+            raise Http404("No Room matches the given query.")
+        if not is_participant(room, request.user):
+            raise PermissionDenied("You are not a participant in this room.")
+        try:
+            since = int(request.query_params.get("since", 0))
+            limit = int(request.query_params.get("limit", CHANGES_PAGE_SIZE))
+        except ValueError:
+            return Response({"detail": "since and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.max_limit))
+
+        rows, has_more = changes_since(room, since, limit)
+        return Response({
+            "changes": [encode_message(row, request) for row in rows],
+            "last_seq": rows[-1].seq if rows else since,
+            "has_more": has_more,
+        })